@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""End to end benchmark of the client hot paths against the fake WorkloadWisdom.
+
+Each case runs in its own process against a fresh fakeserver.FakeWorkloadWisdom
+served by this one, so its peak RSS is the client's alone. Reported per case:
+operations, p50/p99/max latency of an operation, requests per second and bytes
+served, and peak RSS of the client.
+
+Usage::
+
+    python benchmarks/bench_client.py -o results.json
+    python benchmarks/bench_client.py --case project_by_name --case wait_poll --latency 0.005
+    python benchmarks/bench_client.py --trace-mb 64 --baseline results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fakeserver import FakeWorkloadWisdom
+
+# case -> (description, fake server arguments, default number of operations)
+CASES = {
+    'project_by_name': ("get_project_by_name, 10k projects", {'projects': 10000}, 200),
+    'iteration_suite_by_name': ("get_iteration_suite_by_name, 1k suites", {'iteration_suites': 1000}, 20),
+    'list_appliances': ("list_appliances, 50 generators", {'appliances': 50}, 20),
+    'save_all_test_results': ("save_all_test_results, 2 ports, traces of --trace-mb", {'ports_per_testbed': 2}, 1),
+    'wait_poll': ("one wait loop poll of a 16 port test", {'appliances': 2, 'ports_per_testbed': 16, 'speed': 10}, 50),
+}
+
+# relative p50 increase reported as a regression against a baseline
+DEFAULT_TOLERANCE = 0.2
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(percent / 100.0 * len(values) + 0.5)) - 1)]
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+# cases, run in the child process, each sets up and returns (operation(i), cleanup or None)
+def _case_project_by_name(ww, args):
+    import requests
+
+    names = [project['name'] for project in requests.get(args.url + '/api/projects/').json()]
+    return lambda i: ww.get_project_by_name(names[i * 7919 % len(names)]), None
+
+
+def _case_iteration_suite_by_name(ww, args):
+    import requests
+
+    names = [suite['name'] for suite in requests.get(args.url + '/api/iteration_suites').json()]
+    return lambda i: ww.get_iteration_suite_by_name(names[i * 7919 % len(names)]), None
+
+
+def _case_list_appliances(ww, args):
+    return lambda i: ww.list_appliances(), None
+
+
+def _case_save_all_test_results(ww, args):
+    test = ww.show_test(ww.list_tests()[0]['id'])
+
+    def save(i):
+        path = tempfile.mkdtemp(prefix='bench_client_') + os.sep
+        try:
+            manifest = ww.save_all_test_results(test, path)
+            if any(entry['error'] for entry in manifest):
+                raise RuntimeError("failed downloads: %s" % [entry['error'] for entry in manifest])
+        finally:
+            shutil.rmtree(path)
+
+    return save, None
+
+
+def _case_wait_poll(ww, args):
+    from concurrent.futures import ThreadPoolExecutor
+    from workloader.monitor import TestMonitor
+
+    testbed = ww.get_testbed(ww.list_testbeds()[0]['id'])
+    project = ww.show_project(ww.list_projects()[0]['id'])
+    test = ww.start_test(project, testbed, 3600)
+    while ww.show_test(test['id'])['state'] != 'running':
+        time.sleep(0.1)
+
+    monitor = TestMonitor(ww)
+    port_executor = ThreadPoolExecutor(max_workers=8)
+
+    def cleanup():
+        port_executor.shutdown()
+        ww.stop_test(test['id'])
+
+    return lambda i: monitor._poll_test(test['id'], port_executor), cleanup
+
+
+def _run_case(args):
+    """Child side, prints the JSON result of a case."""
+
+    import requests
+    from workloader.workloadwisdom import WorkloadWisdom
+
+    logging.basicConfig(level=logging.WARNING)
+    catalog = os.path.join(tempfile.mkdtemp(prefix='bench_client_'), 'catalog.sqlite')
+    with WorkloadWisdom(args.url, 'user', 'password', catalog=catalog) as ww:
+        operation, cleanup = globals()['_case_' + args.run](ww, args)
+        # only the operations are counted by the server
+        requests.post(args.url + '/_fake/stats')
+        latencies = []
+        start = time.perf_counter()
+        for i in range(args.count):
+            started = time.perf_counter()
+            operation(i)
+            latencies.append(time.perf_counter() - started)
+        elapsed = time.perf_counter() - start
+        stats = requests.get(args.url + '/_fake/stats').json()
+        if cleanup:
+            cleanup()
+    shutil.rmtree(os.path.dirname(catalog))
+
+    print(json.dumps({'latencies': latencies, 'seconds': elapsed, 'server': stats, 'peak_rss_kb': _peak_rss_kb()}))
+
+
+def _bench(case, args):
+    """Parent side, serve a fake WorkloadWisdom to a child running the case."""
+
+    description, server_args, count = CASES[case]
+    server_args = dict(server_args, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                       trace_size=args.trace_mb * 1024 * 1024)
+
+    with FakeWorkloadWisdom(**server_args) as server:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', case, '--url', server.url,
+                               '--count', str(args.count or count)], stdout=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode:
+        return {'description': description, 'error': "exit status %d" % proc.returncode}
+
+    child = json.loads(proc.stdout.strip().splitlines()[-1])
+    latencies = child['latencies']
+    stats = child['server']
+    requests = sum(stats['requests'].values())
+    return {
+        'description': description,
+        'operations': len(latencies),
+        'seconds': round(child['seconds'], 4),
+        'first_ms': round(latencies[0] * 1000, 3),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+        'requests': requests,
+        'requests_per_second': round(requests / child['seconds'], 1),
+        'errors': sum(stats['errors'].values()),
+        'bytes': stats['bytes_sent'],
+        'megabytes_per_second': round(stats['bytes_sent'] / 1048576.0 / child['seconds'], 1),
+        'peak_rss_kb': child['peak_rss_kb'],
+    }
+
+
+def _regressions(result, baseline, tolerance):
+    """Return :list: messages of the cases whose p50 got worse than the baseline by more than tolerance."""
+
+    messages = []
+    for case, current in result['cases'].items():
+        previous = baseline.get('cases', {}).get(case)
+        if not previous or 'p50_ms' not in previous or 'p50_ms' not in current:
+            continue
+        if current['p50_ms'] > previous['p50_ms'] * (1 + tolerance):
+            messages.append("%s: p50 %.3f ms, was %.3f ms" % (case, current['p50_ms'], previous['p50_ms']))
+        if current['peak_rss_kb'] > previous['peak_rss_kb'] * (1 + tolerance):
+            messages.append("%s: peak RSS %d KB, was %d KB" % (case, current['peak_rss_kb'], previous['peak_rss_kb']))
+
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help="Case to run, all if not specified")
+    parser.add_argument('-n', '--count', type=int, help="Number of operations per case, per case default if not set")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added by the server to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Max seconds added to or removed from the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failed by the server")
+    parser.add_argument('--trace-mb', type=int, default=1024, help="Megabytes of each trace file")
+    parser.add_argument('-o', '--output', help="File to save the JSON result to")
+    parser.add_argument('--baseline', help="JSON result of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative increase of p50 or peak RSS reported as a regression")
+    # child side
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        _run_case(args)
+        return
+
+    from workloader.__version__ import __version__
+
+    result = {
+        'workloader': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'server': {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+                   'trace_mb': args.trace_mb},
+        'cases': {},
+    }
+    for case in args.case or sorted(CASES):
+        result['cases'][case] = _bench(case, args)
+
+    output = json.dumps(result, indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as p:
+            p.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r") as p:
+            messages = _regressions(result, json.load(p), args.tolerance)
+        for message in messages:
+            print("regression, %s" % message, file=sys.stderr)
+        if messages:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
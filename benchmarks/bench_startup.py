@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""Cold start benchmark of the CLI, wall time and import time per subcommand.
+
+Each subcommand runs in a new interpreter against a local stub server, the
+import time comes from ``python -X importtime``.
+
+Usage::
+
+    python benchmarks/bench_startup.py -n 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    sys.exit("python 3.7+ is required to run the benchmark")
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'workLoader.py')
+
+COMMANDS = [
+    ['-h'],
+    ['test', '-h'],
+    ['generator', 'list'],
+    ['workload', 'list'],
+    ['testbed', 'list'],
+    ['test', 'list'],
+    ['composite', 'list'],
+    ['iteration', 'list'],
+]
+
+# packages worth watching in the import times, wherever they are imported from
+HEAVY = ['requests', 'numpy', 'aiohttp', 'sqlite3']
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.startswith('/api/version'):
+            body = {'version': '6.0.0-Build.71.97facf49'}
+        else:
+            body = []
+        body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _argv(address, log_file, command):
+    return [sys.executable, CLI, '-d', address, '-u', 'user', '-p', 'password',
+            '--direct', '--log-file', log_file] + command
+
+
+def _import_times(argv):
+    """Return :dict: total and per package import time in ms of a run."""
+
+    proc = subprocess.run([argv[0], '-X', 'importtime'] + argv[1:],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, name.strip().split('.')[0], int(cumulative)))
+
+    # entries are printed after their nested imports, walk them parents first
+    total = 0
+    packages = dict((name, 0) for name in HEAVY)
+    parents = []
+    for depth, package, cumulative in reversed(entries):
+        while parents and parents[-1][0] >= depth:
+            parents.pop()
+        if not parents:
+            total += cumulative
+        # the outermost import of a package includes all its nested ones
+        if package in packages and package not in [parent for _, parent in parents]:
+            packages[package] += cumulative
+        parents.append((depth, package))
+
+    return {
+        'import_ms': round(total / 1000.0, 1),
+        'modules': len(entries),
+        'packages_ms': dict((name, round(us / 1000.0, 1)) for name, us in packages.items() if us),
+    }
+
+
+def _run(argv, count):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    times.sort()
+    result = {
+        'runs': count,
+        'wall_ms_min': round(times[0] * 1000, 1),
+        'wall_ms_median': round(times[len(times) // 2] * 1000, 1),
+        'wall_ms_max': round(times[-1] * 1000, 1),
+    }
+    result.update(_import_times(argv))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=10, help="Number of cold starts per subcommand")
+    parser.add_argument('-o', '--output', help="File to save the JSON result to")
+    args = parser.parse_args()
+
+    server = _start_stub()
+    address = "127.0.0.1:%d" % server.server_address[1]
+    log_file = os.path.join(tempfile.mkdtemp(), 'workloader.log')
+
+    baseline = _run([sys.executable, '-c', 'pass'], args.count)
+    result = {'python': {'wall_ms_median': baseline['wall_ms_median'], 'import_ms': baseline['import_ms']}}
+    for command in COMMANDS:
+        result[' '.join(command)] = _run(_argv(address, log_file, command), args.count)
+
+    server.shutdown()
+    output = json.dumps(result, indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as p:
+            p.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""Connection reuse benchmark of util.rest_get against a local stub server.
+
+Usage::
+
+    python benchmarks/bench_transport.py -n 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    sys.exit("python 3.7+ is required to run the benchmark")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from workloader import util
+from workloader.transport import Transport
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    body = json.dumps({'version': '6.0.0-Build.71.97facf49'}).encode()
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _run(server, url, count, transport):
+    server.connections = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        util.rest_get(url, 'user', 'password', transport=transport)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': count,
+        'seconds': round(elapsed, 4),
+        'requests_per_second': round(count / elapsed, 1),
+        'connections': server.connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=500, help="Number of GET requests per run")
+    args = parser.parse_args()
+
+    server = _start_stub()
+    url = "http://127.0.0.1:%d/api/version" % server.server_address[1]
+
+    result = {'cold': _run(server, url, args.count, None)}
+    with Transport('user', 'password') as transport:
+        result['pooled'] = _run(server, url, args.count, transport)
+    result['speedup'] = round(result['cold']['seconds'] / result['pooled']['seconds'], 2)
+
+    server.shutdown()
+    print(json.dumps(result, indent=4, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
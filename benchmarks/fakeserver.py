@@ -0,0 +1,930 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""Local stand-in of a WorkloadWisdom for offline benchmarking.
+
+Serves every endpoint used by WorkloadWisdom, with entities built out of the
+sample/*.json payloads. Tests and iteration test suites go through starting,
+running, stopping and finished as time passes, ``speed`` times faster than
+real time, and keep the ports of their testbed running meanwhile. Result
+files are generated on the fly at the configured sizes, traces are valid
+pcap files, and downloads can be resumed with Range requests.
+
+Usage::
+
+    python benchmarks/fakeserver.py --port 8080 --projects 10000 --latency 0.02 --jitter 0.01
+    python workLoader.py -d 127.0.0.1:8080 -u user -p password --direct workload list
+
+or from a benchmark::
+
+    with FakeWorkloadWisdom(projects=10000, error_rate=0.01) as server:
+        ww = WorkloadWisdom(server.url, 'user', 'password')
+
+**Classes**
+
+    FakeWorkloadWisdom
+"""
+
+import argparse
+import bisect
+import copy
+import io
+import json
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import zipfile
+
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    sys.exit("python 3.7+ is required to run the fake server")
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sample')
+
+KB = 1024
+MB = 1024 * KB
+
+_ID = r'([0-9a-f]{24})'
+_CHUNK_SIZE = MB
+
+
+def _iso(epoch):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(epoch)) + '.%03dZ' % (epoch % 1 * 1000)
+
+
+class _BytesArtifact(object):
+    """A result file held in memory."""
+
+    def __init__(self, data):
+        self._data = data
+        self.size = len(data)
+
+    def read(self, offset, length):
+        return self._data[offset:offset + length]
+
+
+class _PcapArtifact(object):
+    """A pcap file of UDP packets computed on the fly, of about ``size`` bytes.
+
+    Packet sizes cycle through PACKET_SIZES, so any byte range is produced
+    without generating what comes before it.
+
+    """
+
+    HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+    PACKET_SIZES = (1514, 1514, 590, 64, 1514, 1514, 1514, 128, 1514, 74, 1514, 1514, 342, 1514, 64, 1514)
+    RECORD_HEADER = struct.Struct('<IIII')
+
+    def __init__(self, size, start, port_id, interval=0.0001):
+        """Create a trace.
+
+        :param size: approximate size in bytes
+        :param start: epoch seconds of the first packet
+        :param port_id: port id, in the addresses of the packets
+        :param interval: seconds between two packets
+        """
+
+        self._start = start
+        self._interval = interval
+        self._frames = [self._frame(length, port_id) for length in self.PACKET_SIZES]
+        # offsets of the records in a cycle of PACKET_SIZES, relative to the cycle
+        self._offsets = [0]
+        for length in self.PACKET_SIZES:
+            self._offsets.append(self._offsets[-1] + self.RECORD_HEADER.size + length)
+        self._cycle = self._offsets[-1]
+
+        cycles, rest = divmod(max(0, size - len(self.HEADER)), self._cycle)
+        self.packets = cycles * len(self.PACKET_SIZES) + bisect.bisect_right(self._offsets, rest) - 1
+        self.size = self._offset(self.packets)
+
+    @staticmethod
+    def _frame(length, port_id):
+        ethernet = b'\x00\x1b\x21\x00\x00\x02' + b'\x00\x1b\x21\x00\x00\x01' + b'\x08\x00'
+        ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, length - 14, 0, 0, 64, 17, 0,
+                         bytes([10, 0, port_id % 256, 1]), bytes([10, 0, port_id % 256, 2]))
+        udp = struct.pack('!HHHH', 40000 + port_id, 2049, length - 34, 0)
+        header = ethernet + ip + udp
+        return (header + bytes(range(256)) * (length // 256 + 1))[:length]
+
+    def _offset(self, index):
+        """Offset of the record of packet ``index``."""
+
+        cycles, position = divmod(index, len(self.PACKET_SIZES))
+        return len(self.HEADER) + cycles * self._cycle + self._offsets[position]
+
+    def _index(self, offset):
+        """Index of the packet whose record holds byte ``offset``."""
+
+        cycles, rest = divmod(offset - len(self.HEADER), self._cycle)
+        return cycles * len(self.PACKET_SIZES) + bisect.bisect_right(self._offsets, rest) - 1
+
+    def read(self, offset, length):
+        end = min(self.size, offset + length)
+        if offset >= end:
+            return b''
+
+        data = bytearray()
+        if offset < len(self.HEADER):
+            data += self.HEADER[offset:end]
+            offset = len(self.HEADER)
+            if offset >= end:
+                return bytes(data)
+
+        first = self._index(offset)
+        last = self._index(end - 1)
+        base = self._offset(first)
+        records = bytearray()
+        for index in range(first, last + 1):
+            frame = self._frames[index % len(self._frames)]
+            seconds, micros = divmod(int((self._start + index * self._interval) * 1000000), 1000000)
+            records += self.RECORD_HEADER.pack(seconds, micros, len(frame), len(frame))
+            records += frame
+        data += records[offset - base:end - base]
+
+        return bytes(data)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.fake.handle(self)
+
+    do_POST = do_PUT = do_DELETE = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeWorkloadWisdom(object):
+    """An in memory WorkloadWisdom served over HTTP on localhost.
+
+    Times below are test seconds, ``speed`` of them pass per real second.
+
+    """
+
+    VERSION = '6.0.0-Build.71.97facf49'
+    # seconds a test spends starting and stopping
+    STARTING = 10
+    STOPPING = 5
+    ACTIONS = ('READ', 'WRITE', 'OPEN', 'CLOSE', 'GETATTR', 'SETATTR', 'LOOKUP', 'CREATE')
+    ACTION_METRICS = ('attempts', 'succeeds', 'fails', 'latency_avg', 'latency_max', 'bytes')
+    CHARTS = ('Throughput', 'Latency', 'Scenario Attempts', 'Scenario Success Rate')
+
+    def __init__(self, sample_dir=SAMPLE_DIR, appliances=4, testbeds=10, ports_per_testbed=2, projects=50,
+                 composites=10, iteration_suites=20, project_suites=5, tests=20, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503, speed=60.0, trace_size=MB, summary_size=64 * KB,
+                 log_size=16 * KB, chart_points=1000, stats_per_port=20, seed=0):
+        """Create the entities of a fake WorkloadWisdom.
+
+        :param sample_dir: directory of the sample JSON payloads used as templates
+        :param appliances: number of appliances, with the ports of the sample one each
+        :param testbeds: number of testbeds
+        :param ports_per_testbed: number of ports of each testbed, testbeds share ports when there are not enough
+        :param projects: number of projects (workloads)
+        :param composites: number of composite workloads
+        :param iteration_suites: number of iteration suites, each with a finished iteration test suite
+        :param project_suites: number of workload suites
+        :param tests: number of finished tests, spread over the projects
+        :param latency: seconds added to every response
+        :param jitter: max seconds randomly added to or removed from the latency
+        :param error_rate: share of the requests answered with error_status, 0 to 1
+        :param error_status: HTTP status of the injected errors
+        :param speed: test seconds passing per real second
+        :param trace_size: bytes of each trace file
+        :param summary_size: bytes of each summary file
+        :param log_size: bytes of each log file
+        :param chart_points: rows of each CSV of the chart export
+        :param stats_per_port: number of stats returned per port, at least the scenario counters
+        :param seed: seed of the random ids, names and injected errors
+        """
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.speed = float(speed)
+        self.trace_size = trace_size
+        self.summary_size = summary_size
+        self.log_size = log_size
+        self.chart_points = chart_points
+        self.stats_per_port = stats_per_port
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+        self.url = None
+
+        self.requests = Counter()
+        self.errors = Counter()
+        self.bytes_sent = 0
+
+        self._samples = {}
+        for name in ('appliance', 'projects', 'composite_workloads', 'iteration_suites',
+                     'iteration_test_suites', 'project_suites'):
+            with open(os.path.join(sample_dir, name + '.json'), "r") as p:
+                self._samples[name] = json.load(p)
+
+        # collection -> id -> JSON object
+        self._stores = dict((name, {}) for name in ('appliances', 'test_beds', 'projects', 'composite_workloads',
+                                                    'iteration_suites', 'project_suites'))
+        # test or iteration test suite id -> run
+        self._tests = {}
+        self._iterations = {}
+        # ids of the runs which may still hold ports
+        self._active = set()
+        self._charts = {}
+
+        self._build(appliances, testbeds, ports_per_testbed, projects, composites, iteration_suites,
+                    project_suites, tests)
+        self._routes = self._build_routes()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # entities
+    def _new_id(self):
+        with self._lock:
+            return '%024x' % self._random.getrandbits(96)
+
+    def _now(self):
+        return time.time()
+
+    def _build(self, appliances, testbeds, ports_per_testbed, projects, composites, iteration_suites,
+               project_suites, tests):
+        now = self._now()
+        created = _iso(now - 86400)
+
+        all_ports = []
+        for i in range(appliances):
+            appliance = copy.deepcopy(self._samples['appliance'])
+            appliance['id'] = self._new_id()
+            appliance['name'] = 'LDX_%03d' % i
+            appliance['address'] = '10.0.%d.%d' % (i // 250, i % 250 + 1)
+            for port in appliance['ports']:
+                port['_id'] = self._new_id()
+                port['appliance_id'] = appliance['id']
+                port['state'] = 'idle'
+                port['usage'] = {}
+                all_ports.append((appliance['id'], port['port_id']))
+            self._stores['appliances'][appliance['id']] = appliance
+
+        for i in range(testbeds):
+            clients = []
+            for j in range(min(ports_per_testbed, len(all_ports))):
+                appliance_id, port_id = all_ports[(i * ports_per_testbed + j) % len(all_ports)]
+                clients.append({'name': 'client_%d' % j, 'appliance_id': appliance_id, 'port': port_id})
+            testbed = {
+                'id': self._new_id(),
+                'name': 'TB_%04d' % i,
+                'description': '',
+                'private': False,
+                'owner_name': 'Stephen Shao',
+                'created_at': created,
+                'updated_at': created,
+                'clients': clients,
+            }
+            self._stores['test_beds'][testbed['id']] = testbed
+
+        testbed_ids = list(self._stores['test_beds'])
+        for store, sample, count in (('projects', 'projects', projects),
+                                     ('composite_workloads', 'composite_workloads', composites),
+                                     ('iteration_suites', 'iteration_suites', iteration_suites),
+                                     ('project_suites', 'project_suites', project_suites)):
+            for i in range(count):
+                obj = copy.deepcopy(self._samples[sample])
+                obj['id'] = self._new_id()
+                obj['name'] = '%s %05d' % (self._samples[sample]['name'], i)
+                obj['created_at'] = obj['updated_at'] = created
+                if 'tests' in obj:
+                    obj['tests'] = []
+                if store == 'iteration_suites':
+                    obj['test_suites'] = []
+                    if testbed_ids:
+                        testbed = self._stores['test_beds'][testbed_ids[i % len(testbed_ids)]]
+                        obj['test_bed'] = {'id': testbed['id'], 'name': testbed['name']}
+                self._stores[store][obj['id']] = obj
+
+        # finished runs, started long enough ago
+        project_ids = list(self._stores['projects'])
+        for i in range(tests if project_ids and testbed_ids else 0):
+            project = self._stores['projects'][project_ids[i % len(project_ids)]]
+            testbed = self._stores['test_beds'][testbed_ids[i % len(testbed_ids)]]
+            self._start_test(project, testbed, 600, start=now - 86400 - i * 60)
+        for suite in list(self._stores['iteration_suites'].values()):
+            if testbed_ids:
+                testbed = self._stores['test_beds'][suite['test_bed']['id']]
+                self._start_iteration(suite, testbed, start=now - 86400 * 30)
+        self._active.clear()
+
+    def _run_state(self, run, now=None):
+        """Return :tuple: (state, test seconds run) of a test or iteration test suite."""
+
+        now = now if now is not None else self._now()
+        elapsed = (now - run['start']) * self.speed
+        duration = run['duration']
+        if run['stopped_at'] is not None:
+            stopped = (run['stopped_at'] - run['start']) * self.speed
+            actual = min(duration, max(0, stopped - self.STARTING))
+            if elapsed < stopped + self.STOPPING:
+                return 'stopping', actual
+            return 'aborted_by_user', actual
+        if elapsed < self.STARTING:
+            return 'starting', 0
+        if elapsed < self.STARTING + duration:
+            return 'running', elapsed - self.STARTING
+        if elapsed < self.STARTING + duration + self.STOPPING:
+            return 'stopping', duration
+        return 'finished', duration
+
+    def _finished_at(self, run):
+        if run['stopped_at'] is not None:
+            return run['stopped_at'] + self.STOPPING / self.speed
+        return run['start'] + (self.STARTING + run['duration'] + self.STOPPING) / self.speed
+
+    def _busy_ports(self):
+        """Return :dict: (appliance_id, port_id) -> usage dict of the ports held by active runs."""
+
+        now = self._now()
+        busy = {}
+        with self._lock:
+            for run_id in list(self._active):
+                run = self._tests.get(run_id) or self._iterations[run_id]
+                if self._run_state(run, now)[0] not in ('starting', 'running', 'stopping'):
+                    self._active.discard(run_id)
+                    continue
+                for client in run['testbed']['clients']:
+                    busy[(client['appliance_id'], client['port'])] = {
+                        'used_by': run['owner'], 'test_id': run['id']}
+        return busy
+
+    def _start_test(self, project, testbed, duration, start=None):
+        run = {
+            'id': self._new_id(),
+            'project': project,
+            'testbed': testbed,
+            'duration': float(duration),
+            'start': start if start is not None else self._now(),
+            'stopped_at': None,
+            'owner': project.get('owner_name'),
+        }
+        with self._lock:
+            self._tests[run['id']] = run
+            self._active.add(run['id'])
+            project.setdefault('tests', []).insert(0, {'id': run['id']})
+        return run
+
+    def _start_iteration(self, suite, testbed, start=None):
+        iterations = max(1, len(suite.get('iteration_parameters') or []))
+        run = {
+            'id': self._new_id(),
+            'suite': suite,
+            'testbed': testbed,
+            'duration': float(suite.get('iteration_duration') or 60) * iterations,
+            'start': start if start is not None else self._now(),
+            'stopped_at': None,
+            'owner': suite.get('owner_name'),
+        }
+        with self._lock:
+            self._iterations[run['id']] = run
+            self._active.add(run['id'])
+            # new runs do not bump updated_at of the suite on the real server either
+            suite['test_suites'].insert(0, {'id': run['id']})
+        return run
+
+    # JSON views
+    def _test_json(self, run):
+        state, actual = self._run_state(run)
+        ports = range(len(run['testbed']['clients']))
+        return {
+            'id': run['id'],
+            'name': run['project']['name'],
+            'state': state,
+            'project': {'id': run['project']['id'], 'name': run['project']['name']},
+            'test_bed': {'id': run['testbed']['id'], 'name': run['testbed']['name']},
+            'owner_name': run['owner'],
+            'created_at': _iso(run['start']),
+            'duration_planned': int(run['duration']),
+            'duration_actual': int(actual),
+            'ports': [{'id': port_id} for port_id in ports],
+            'result_files': {
+                'config': 'files/config',
+                'logs': ['files/ports/%d/log' % port_id for port_id in ports],
+                'summary': ['files/ports/%d/summary' % port_id for port_id in ports],
+                'traces': ['files/ports/%d/trace' % port_id for port_id in ports],
+            },
+        }
+
+    def _iteration_json(self, run):
+        state, _ = self._run_state(run)
+        iteration = copy.deepcopy(self._samples['iteration_test_suites'])
+        iteration.update({
+            'id': run['id'],
+            'name_cache': run['suite']['name'],
+            'state': state,
+            'created_at': _iso(run['start']),
+            'finished_at': _iso(self._finished_at(run)) if state in ('finished', 'aborted_by_user') else None,
+            'iteration_duration': run['suite'].get('iteration_duration'),
+            'project': run['suite'].get('project'),
+            'test_bed': {'id': run['testbed']['id'], 'name': run['testbed']['name']},
+        })
+        return iteration
+
+    def _appliance_json(self, appliance):
+        busy = self._busy_ports()
+        appliance = copy.deepcopy(appliance)
+        for port in appliance['ports']:
+            usage = busy.get((appliance['id'], port['port_id']))
+            port['state'] = 'running' if usage else 'idle'
+            port['usage'] = usage or {}
+        return appliance
+
+    def _suite_json(self, suite):
+        suite = copy.deepcopy(suite)
+        test_suites = []
+        for item in suite['test_suites']:
+            iteration = self._iteration_json(self._iterations[item['id']])
+            test_suites.append(dict((key, iteration[key]) for key in
+                                    ('id', 'name_cache', 'state', 'created_at', 'finished_at')))
+        suite['test_suites'] = test_suites
+        return suite
+
+    def _port_stats(self, run, port_id):
+        state, actual = self._run_state(run)
+        if state == 'starting':
+            return {'tests': []}
+
+        rate = 1000 + 100 * port_id
+        attempts = int(rate * actual)
+        aborts = attempts // 1000
+        fails = attempts // 100
+        stats = [
+            ('load.scenarios.attempts', attempts),
+            ('load.scenarios.succeeds', attempts - fails - aborts),
+            ('load.scenarios.fails', fails),
+            ('load.scenarios.aborts', aborts),
+            ('load.throughput.total', rate * 65536),
+            ('load.latency.average', round(0.5 + 0.01 * port_id, 3)),
+        ]
+        for i in range(len(stats), self.stats_per_port):
+            stats.append(('load.actions.metric_%02d' % i, int(actual * i)))
+        return {'tests': [{'stat_string': name, 'value': str(value)} for name, value in stats]}
+
+    # result files
+    def _summary(self, run, port_id):
+        lines = ['# WorkloadWisdom port summary',
+                 '# test_id=%s port=%d duration=%d' % (run['id'], port_id, run['duration']),
+                 'Time,Action,Metric,Value']
+        size = sum(len(line) + 1 for line in lines)
+        second = 0
+        while size < self.summary_size:
+            second += 1
+            for a, action in enumerate(self.ACTIONS):
+                attempts = second * (100 + 10 * a + port_id)
+                values = (attempts, attempts - second, second, 0.2 + 0.01 * a, 2.0 + a, attempts * 4096)
+                for metric, value in zip(self.ACTION_METRICS, values):
+                    line = '%d,%s,%s,%s' % (second, action, metric, value)
+                    lines.append(line)
+                    size += len(line) + 1
+        return _BytesArtifact(('\n'.join(lines) + '\n').encode('ascii')[:self.summary_size])
+
+    def _log(self, run, port_id):
+        lines = []
+        size = 0
+        index = 0
+        while size < self.log_size:
+            line = '%s info Port %d: step %d of test %s completed successfully' % (
+                _iso(run['start'] + index), port_id, index, run['id'])
+            lines.append(line)
+            size += len(line) + 1
+            index += 1
+        return _BytesArtifact(('\n'.join(lines) + '\n').encode('ascii')[:self.log_size])
+
+    def _export_charts(self, run):
+        with self._lock:
+            if run['id'] in self._charts:
+                return self._charts[run['id']]
+
+        ports = range(len(run['testbed']['clients']))
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for c, chart in enumerate(self.CHARTS):
+                rows = ['Time,' + ','.join('Port %d' % port_id for port_id in ports)]
+                step = max(1.0, run['duration'] / self.chart_points)
+                for point in range(self.chart_points):
+                    rows.append('%g,' % (point * step) + ','.join(
+                        '%.3f' % ((c + 1) * (100 + port_id) * (1 + 0.1 * ((point + port_id) % 7))) for port_id in ports))
+                archive.writestr(chart + '.csv', '\n'.join(rows) + '\n')
+
+        artifact = _BytesArtifact(buf.getvalue())
+        with self._lock:
+            self._charts[run['id']] = artifact
+        return artifact
+
+    # request handlers, each returns (status, JSON object or artifact)
+    def _build_routes(self):
+        routes = [
+            ('GET', r'/api/version', lambda m, form: (200, {'version': self.VERSION})),
+            ('GET', r'/api/appliances', self._list_appliances),
+            ('GET', r'/api/appliances/%s' % _ID, self._show_appliance),
+            ('GET', r'/api/tests', self._list_tests),
+            ('POST', r'/api/tests', self._post_test),
+            ('GET', r'/api/tests/%s' % _ID, self._show_test),
+            ('PUT', r'/api/tests/%s/stop' % _ID, self._stop_test),
+            ('GET', r'/api/tests/%s/stats/ports/(\d+)' % _ID, self._show_port_stats),
+            ('GET', r'/api/tests/%s/(?:config|files/config)' % _ID, self._show_test_config),
+            ('GET', r'/api/tests/%s/logs' % _ID, self._show_test_logs),
+            ('GET', r'/api/tests/%s/files/ports/(\d+)/(log|summary|trace)' % _ID, self._get_test_file),
+            ('GET', r'/api/tests/%s/export_charts' % _ID, self._get_export_charts),
+            ('GET', r'/api/projects/library', self._list('projects')),
+            ('GET', r'/api/iteration_test_suites', self._list_iterations),
+            ('POST', r'/api/iteration_test_suites', self._post_iteration),
+            ('GET', r'/api/iteration_test_suites/%s' % _ID, self._show_iteration),
+            ('PUT', r'/api/iteration_test_suites/%s/stop' % _ID, self._stop_iteration),
+            ('GET', r'/api/iteration_suites/%s' % _ID, self._show_suite),
+            ('DELETE', r'/test_beds/%s' % _ID, self._delete('test_beds')),
+        ]
+        for store in ('test_beds', 'projects', 'composite_workloads', 'iteration_suites', 'project_suites'):
+            routes.append(('GET', r'/api/%s' % store, self._list(store)))
+            routes.append(('GET', r'/api/%s/%s' % (store, _ID), self._show(store)))
+            routes.append(('POST', r'/api/%s/%s/clone' % (store, _ID), self._clone(store)))
+            routes.append(('PUT', r'/api/%s/%s/privacy' % (store, _ID), self._privacy(store)))
+            routes.append(('DELETE', r'/api/%s/%s' % (store, _ID), self._delete(store)))
+
+        # e.g. 'GET /api/tests/:id/stats/ports/:port', the key of the request counters
+        return [(method, re.compile(pattern + '/?$'), '%s %s' % (method, pattern.replace(_ID, ':id').replace(
+            r'(\d+)', ':port').replace('(log|summary|trace)', ':file')), handler)
+                for method, pattern, handler in routes]
+
+    def _get(self, store, object_id):
+        obj = self._stores[store].get(object_id)
+        if obj is None:
+            raise KeyError("%s %s not found" % (store, object_id))
+        return obj
+
+    def _list(self, store):
+        def handler(m, form):
+            return 200, [{'id': obj['id'], 'name': obj['name']} for obj in list(self._stores[store].values())]
+        return handler
+
+    def _show(self, store):
+        def handler(m, form):
+            obj = self._get(store, m.group(1))
+            if store == 'iteration_suites':
+                return 200, self._suite_json(obj)
+            return 200, obj
+        return handler
+
+    def _clone(self, store):
+        def handler(m, form):
+            obj = copy.deepcopy(self._get(store, m.group(1)))
+            obj['id'] = self._new_id()
+            obj['name'] = form.get('name') or obj['name'] + ' copy'
+            obj['created_at'] = obj['updated_at'] = _iso(self._now())
+            if 'tests' in obj:
+                obj['tests'] = []
+            if 'test_suites' in obj:
+                obj['test_suites'] = []
+            with self._lock:
+                self._stores[store][obj['id']] = obj
+            return 200, obj
+        return handler
+
+    def _privacy(self, store):
+        def handler(m, form):
+            obj = self._get(store, m.group(1))
+            with self._lock:
+                obj['private'] = str(form.get('private')).lower() == 'true'
+                obj['updated_at'] = _iso(self._now())
+            return 200, obj
+        return handler
+
+    def _delete(self, store):
+        def handler(m, form):
+            with self._lock:
+                self._get(store, m.group(1))
+                del self._stores[store][m.group(1)]
+            return 200, {'redirect': '%s/%s' % (self.url, store)}
+        return handler
+
+    def _list_appliances(self, m, form):
+        return 200, [{'id': obj['id'], 'name': obj['name']} for obj in list(self._stores['appliances'].values())]
+
+    def _show_appliance(self, m, form):
+        return 200, self._appliance_json(self._get('appliances', m.group(1)))
+
+    def _list_tests(self, m, form):
+        return 200, [{'id': test_id} for test_id in list(self._tests)]
+
+    def _test(self, test_id):
+        run = self._tests.get(test_id)
+        if run is None:
+            raise KeyError("test %s not found" % test_id)
+        return run
+
+    def _post_test(self, m, form):
+        project_id = form.get('projectid')
+        project = self._stores['projects'].get(project_id) or self._get('composite_workloads', project_id)
+        testbed = self._get('test_beds', form.get('test_bed_id'))
+        run = self._start_test(project, testbed, float(form.get('duration') or 60))
+        return 200, self._test_json(run)
+
+    def _show_test(self, m, form):
+        return 200, self._test_json(self._test(m.group(1)))
+
+    def _stop_test(self, m, form):
+        run = self._test(m.group(1))
+        with self._lock:
+            if run['stopped_at'] is None and self._run_state(run)[0] in ('starting', 'running'):
+                run['stopped_at'] = self._now()
+        return 200, self._test_json(run)
+
+    def _show_port_stats(self, m, form):
+        run = self._test(m.group(1))
+        port_id = int(m.group(2))
+        if port_id >= len(run['testbed']['clients']):
+            raise KeyError("port %d not found" % port_id)
+        return 200, self._port_stats(run, port_id)
+
+    def _show_test_config(self, m, form):
+        run = self._test(m.group(1))
+        return 200, {
+            'test_id': run['id'],
+            'project': copy.deepcopy(run['project']),
+            'test_bed': copy.deepcopy(run['testbed']),
+            'duration': int(run['duration']),
+        }
+
+    def _show_test_logs(self, m, form):
+        run = self._test(m.group(1))
+        ports = range(len(run['testbed']['clients']))
+        return 200, {'tests': [{'time': _iso(self._finished_at(run)), 'status': 'info',
+                                'message': 'Downloading summary for port %s:%d completed successfully' % (
+                                    client['appliance_id'], port_id)}
+                               for port_id, client in zip(ports, run['testbed']['clients'])]}
+
+    def _get_test_file(self, m, form):
+        run = self._test(m.group(1))
+        port_id = int(m.group(2))
+        if port_id >= len(run['testbed']['clients']):
+            raise KeyError("port %d not found" % port_id)
+        if m.group(3) == 'trace':
+            return 200, _PcapArtifact(self.trace_size, run['start'] + self.STARTING / self.speed, port_id)
+        if m.group(3) == 'summary':
+            return 200, self._summary(run, port_id)
+        return 200, self._log(run, port_id)
+
+    def _get_export_charts(self, m, form):
+        return 200, self._export_charts(self._test(m.group(1)))
+
+    def _list_iterations(self, m, form):
+        return 200, [{'id': iteration_id} for iteration_id in list(self._iterations)]
+
+    def _iteration(self, iteration_id):
+        run = self._iterations.get(iteration_id)
+        if run is None:
+            raise KeyError("iteration test suite %s not found" % iteration_id)
+        return run
+
+    def _post_iteration(self, m, form):
+        suite = self._get('iteration_suites', form.get('iteration_suite_id'))
+        testbed = self._get('test_beds', form.get('test_bed_id'))
+        return 200, self._iteration_json(self._start_iteration(suite, testbed))
+
+    def _show_iteration(self, m, form):
+        return 200, self._iteration_json(self._iteration(m.group(1)))
+
+    def _stop_iteration(self, m, form):
+        run = self._iteration(m.group(1))
+        with self._lock:
+            if run['stopped_at'] is None and self._run_state(run)[0] in ('starting', 'running'):
+                run['stopped_at'] = self._now()
+        return 200, self._iteration_json(run)
+
+    def _show_suite(self, m, form):
+        return 200, self._suite_json(self._get('iteration_suites', m.group(1)))
+
+    # HTTP
+    def _read_form(self, request):
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        if not body:
+            return {}
+        if 'json' in (request.headers.get('Content-Type') or ''):
+            return json.loads(body.decode('utf-8'))
+        return dict((key, values[-1]) for key, values in parse_qs(body.decode('utf-8')).items())
+
+    def _route(self, method, path):
+        for route_method, pattern, name, handler in self._routes:
+            if route_method == method:
+                m = pattern.match(path)
+                if m:
+                    return name, m, handler
+        return '%s %s' % (method, path), None, None
+
+    def handle(self, request):
+        """Answer a request of the HTTP server."""
+
+        form = self._read_form(request)
+        path = urlsplit(request.path).path
+        # counters of the fake itself, not counted, e.g. to reset them once a benchmark is set up
+        if path.rstrip('/') == '/_fake/stats':
+            if request.command != 'GET':
+                self.reset_stats()
+            self._send(request, 200, json.dumps(self.stats()).encode('utf-8'), 'application/json', count=False)
+            return
+
+        name, m, handler = self._route(request.command, path)
+
+        with self._lock:
+            self.requests[name] += 1
+            delay = self.latency + (self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+            injected = self.error_rate and self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+
+        if injected:
+            status, body = self.error_status, {'error': 'injected failure'}
+        elif handler is None:
+            status, body = 404, {'error': 'no route %s %s' % (request.command, path)}
+        else:
+            try:
+                status, body = handler(m, form)
+            except KeyError as e:
+                status, body = 404, {'error': str(e.args[0])}
+            except (TypeError, ValueError) as e:
+                status, body = 400, {'error': str(e)}
+        if status >= 400:
+            with self._lock:
+                self.errors[name] += 1
+
+        try:
+            if isinstance(body, (_BytesArtifact, _PcapArtifact)):
+                self._send_artifact(request, body)
+            else:
+                self._send(request, status, json.dumps(body).encode('utf-8'), 'application/json')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send(self, request, status, data, content_type, headers=(), count=True):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(data)))
+        for header in headers:
+            request.send_header(*header)
+        request.end_headers()
+        request.wfile.write(data)
+        if count:
+            with self._lock:
+                self.bytes_sent += len(data)
+
+    def _send_artifact(self, request, artifact):
+        start, end = 0, artifact.size
+        status = 200
+        m = re.match(r'bytes=(\d+)-(\d*)', request.headers.get('Range') or '')
+        if m:
+            start = int(m.group(1))
+            if start >= artifact.size:
+                self._send(request, 416, b'', 'application/octet-stream',
+                           [('Content-Range', 'bytes */%d' % artifact.size)])
+                return
+            if m.group(2):
+                end = min(end, int(m.group(2)) + 1)
+            status = 206
+
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/octet-stream')
+        request.send_header('Content-Length', str(end - start))
+        request.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            request.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, artifact.size))
+        request.end_headers()
+
+        offset = start
+        while offset < end:
+            chunk = artifact.read(offset, min(_CHUNK_SIZE, end - offset))
+            request.wfile.write(chunk)
+            offset += len(chunk)
+            with self._lock:
+                self.bytes_sent += len(chunk)
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serve in a background thread.
+
+        :param host: address to listen on
+        :param port: port to listen on, any free one if 0
+        :return: :FakeWorkloadWisdom: self, its url attribute set
+        :rtype: FakeWorkloadWisdom
+        """
+
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self.url = "http://%s:%d" % self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        """Counters of the served requests, also served by GET /_fake/stats, reset by POST /_fake/stats.
+
+        :return: :dict: requests and errors per route, bytes sent
+        :rtype: dict
+        """
+
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'bytes_sent': self.bytes_sent,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests.clear()
+            self.errors.clear()
+            self.bytes_sent = 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on")
+    parser.add_argument('--sample-dir', default=SAMPLE_DIR, help="Directory of the sample JSON payloads")
+    parser.add_argument('--appliances', type=int, default=4, help="Number of appliances, 8 ports each")
+    parser.add_argument('--testbeds', type=int, default=10, help="Number of testbeds")
+    parser.add_argument('--ports-per-testbed', type=int, default=2, help="Number of ports of each testbed")
+    parser.add_argument('--projects', type=int, default=50, help="Number of workloads")
+    parser.add_argument('--composites', type=int, default=10, help="Number of composite workloads")
+    parser.add_argument('--iteration-suites', type=int, default=20, help="Number of iteration suites")
+    parser.add_argument('--tests', type=int, default=20, help="Number of finished tests")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Max seconds added to or removed from the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests failed, 0 to 1")
+    parser.add_argument('--error-status', type=int, default=503, help="HTTP status of the failed requests")
+    parser.add_argument('--speed', type=float, default=60.0, help="Test seconds passing per real second")
+    parser.add_argument('--trace-size', type=int, default=MB, help="Bytes of each trace file")
+    parser.add_argument('--summary-size', type=int, default=64 * KB, help="Bytes of each summary file")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the ids and injected errors")
+    args = parser.parse_args()
+
+    server = FakeWorkloadWisdom(
+        sample_dir=args.sample_dir, appliances=args.appliances, testbeds=args.testbeds,
+        ports_per_testbed=args.ports_per_testbed, projects=args.projects, composites=args.composites,
+        iteration_suites=args.iteration_suites, tests=args.tests, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, error_status=args.error_status, speed=args.speed,
+        trace_size=args.trace_size, summary_size=args.summary_size, seed=args.seed)
+    server.start(args.host, args.port)
+    print("fake WorkloadWisdom %s on %s, Ctrl-C to stop" % (server.VERSION, server.url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.stats(), indent=4, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -36,5 +36,8 @@ setup(
     packages = find_packages(exclude=['docs', 'ext']),
     include_package_data = True,
     platforms = 'any',
-    install_requires = ['requests'],
+    install_requires = ['requests', 'numpy'],
+    extras_require = {
+        'yaml': ['PyYAML'],
+    },
 )
@@ -17,27 +17,180 @@
 
 import logging
 import argparse
+import json
+import os
+import sys
+import threading
+import time
 
-from workloader.workloadwisdom import WorkloadWisdom
+# only light modules here, the client and its requests/numpy imports are
+# loaded by the commands needing them, not for forwarding, -h or completion
+from workloader.daemon import DEFAULT_SOCKET
 
 LOGGING_FORMAT = u'%(asctime)s %(filename)s[line:%(lineno)d] %(levelname)s %(message)s'
 DATE_FORMAT = u'%a, %d %b %Y %H:%M:%S'
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+# arguments naming local files, made absolute against the client directory when served
+PATH_ARGS = ['path', 'record', 'manifest', 'report', 'metrics_file', 'trace']
+LOGO_FILE = '/opt/workloader/.workloaderascii'
+
+# (url, username, password) -> WorkloadWisdom, kept warm between commands when serving
+_sessions = None
+# (url, username, password) -> SharedTestMonitor polling the tests of all commands of a session
+_monitors = None
+_sessions_lock = threading.Lock()
+
+
+def _setup_logging(level, log_file):
+    """Log to a file and the console through a background thread."""
+
+    from workloader import util
+
+    formatter = logging.Formatter(datefmt=DATE_FORMAT, fmt=LOGGING_FORMAT)
+    file_handler = logging.FileHandler(log_file, mode='w')
+    console = logging.StreamHandler()
+    for handler in (file_handler, console):
+        handler.setFormatter(formatter)
+        # the daemon lets every record through the root logger for its clients, these keep to -l
+        handler.setLevel(level)
+
+    logging.getLogger('').setLevel(level)
+    return util.start_log_listener([file_handler, console])
 
 
 def _get_workload_wisdom(args):
+    from workloader.workloadwisdom import WorkloadWisdom
+
     logging.debug(args)
     url = u"http://" + args.ip
     username = args.username
     password = args.password
-    ww = WorkloadWisdom(url, username, password)
-
+    tracer = getattr(args, 'tracer', None)
+    if tracer is not None:
+        # a traced command gets its own session, warm ones would mix the spans of other commands
+        if getattr(args, 'workload_wisdom', None) is None:
+            args.workload_wisdom = WorkloadWisdom(url, username, password, tracer=tracer)
+        return args.workload_wisdom
+    elif _sessions is None:
+        ww = WorkloadWisdom(url, username, password)
+    else:
+        from workloader import daemon
+        from workloader.monitor import SharedTestMonitor
+
+        with _sessions_lock:
+            key = (url, username, password)
+            if key not in _sessions:
+                _sessions[key] = WorkloadWisdom(url, username, password)
+                _monitors[key] = SharedTestMonitor(_sessions[key], merge_contexts=daemon.merge_contexts)
+            ww = _sessions[key]
+            args.monitor = _monitors[key]
+
+    if getattr(args, 'refresh', False):
+        ww.invalidate_catalog()
+    # its request metrics are reported at the end of the command
+    args.workload_wisdom = ww
     return ww
 
 
+def _wait_until_complete(args, ww, test_ids, iteration_ids=(), recorder=None):
+    """Yield (kind, object) of tests and iteration test suites as they complete.
+
+    When served, they are polled by the warm monitor of the session along with
+    the waits of the other commands, a test finished a moment ago is returned
+    at once.
+    """
+
+    from workloader.monitor import PollError
+
+    monitor = getattr(args, 'monitor', None)
+    if monitor is None or recorder is not None:
+        completed = ww.wait_until_tests_complete(test_ids, iteration_ids, recorder=recorder)
+    else:
+        completed = monitor.wait(test_ids, iteration_ids)
+
+    try:
+        for item in completed:
+            yield item
+    except PollError as e:
+        # the command fails once done, like a test whose results could not be saved
+        for kind, object_id, message in e.failed:
+            logging.error("%s %s not polled: %s", kind, object_id, message)
+            args.failed_results = getattr(args, 'failed_results', []) + [(object_id, [message])]
+
+
+def _report_metrics(args):
+    """Log the request metrics table and save them to a file, as asked on the command line."""
+
+    ww = getattr(args, 'workload_wisdom', None)
+    if ww is None or not (args.metrics or args.metrics_file):
+        return
+
+    if args.metrics:
+        for line in ww.metrics.summary():
+            logging.info("%s", line)
+    if args.metrics_file:
+        ww.metrics.dump(args.metrics_file)
+
+
+def _save_results(args, ww, test):
+    """Save all results of a test, the files not saved fail the command once it is done."""
+
+    manifest = ww.save_all_test_results(test, args.path)
+    failed = [entry['name'] for entry in manifest if entry['error']]
+    if failed:
+        args.failed_results = getattr(args, 'failed_results', []) + [(test['id'], failed)]
+
+
+def _check_results(args):
+    """Exit 1 if results of a test of the command could not be saved."""
+
+    failed = getattr(args, 'failed_results', None)
+    if not failed:
+        return
+
+    for test_id, names in failed:
+        logging.error("results of test %s not saved: %s", test_id, ", ".join(names))
+    sys.exit(1)
+
+
+def _run_command(args, argv):
+    """Run a parsed command, traced and its metrics reported as asked on the command line."""
+
+    if not args.trace:
+        try:
+            args.func(args)
+        finally:
+            _report_metrics(args)
+        _check_results(args)
+        return
+
+    from workloader.tracing import Tracer
+
+    # e.g. 'test start', the module and action named on the command line
+    modules = [name for name, _, _ in MODULES]
+    first = next((i for i, arg in enumerate(argv) if arg in modules), len(argv))
+    args.tracer = Tracer()
+    try:
+        with args.tracer.span(" ".join(argv[first:first + 2]), 'command'):
+            args.func(args)
+    finally:
+        _report_metrics(args)
+        args.tracer.save(args.trace)
+        if getattr(args, 'workload_wisdom', None) is not None:
+            args.workload_wisdom.close()
+    _check_results(args)
+
+
+def _log_result(result):
+    """Log the result of a list or show command in full, whatever the log level."""
+
+    logging.info("%s", json.dumps(result, indent=4, sort_keys=True))
+
+
 def _workloads_list(args):
     ww = _get_workload_wisdom(args)
     logging.info("list of workloads")
-    ww.list_projects()
+    _log_result(ww.list_projects())
 
 
 def _workloads_private(args):
@@ -50,7 +203,7 @@ def _workloads_private(args):
 def _workloads_show(args):
     ww = _get_workload_wisdom(args)
     logging.info("show workload %s", args.name)
-    ww.get_project_by_name(args.name)
+    _log_result(ww.get_project_by_name(args.name))
 
 
 def _workloads_delete(args):
@@ -70,25 +223,25 @@ def _workloads_clone(args):
 def _generator_list(args):
     ww = _get_workload_wisdom(args)
     logging.info("list of generators")
-    ww.list_appliances()
+    _log_result(ww.list_appliances())
 
 
 def _generator_show(args):
     ww = _get_workload_wisdom(args)
     logging.info("show generator: %s", args.name)
-    ww.get_appliance_by_name(args.name)
+    _log_result(ww.get_appliance_by_name(args.name))
 
 
 def _testbed_list(args):
     ww = _get_workload_wisdom(args)
     logging.info("list of testbeds")
-    ww.list_testbeds()
+    _log_result(ww.list_testbeds())
 
 
 def _testbed_show(args):
     ww = _get_workload_wisdom(args)
     logging.info("show testbed: %s", args.name)
-    ww.get_testbed_by_name(args.name)
+    _log_result(ww.get_testbed_by_name(args.name))
 
 
 def _testbed_delete(args):
@@ -112,18 +265,44 @@ def _testbed_private(args):
     ww.set_testbed_privacy(testbed['id'], args.yes)
 
 
+def _testbed_ports(args):
+    from workloader.inventory import testbed_ports
+
+    ww = _get_workload_wisdom(args)
+    logging.info("ports of testbed: %s", args.name)
+    testbed = ww.get_testbed_by_name(args.name)
+    snapshot = ww.inventory.snapshot(testbed_ports(testbed))
+    for (appliance_id, port_id), port in sorted(snapshot.items(), key=lambda item: str(item[0])):
+        usage = (port or {}).get('usage') or {}
+        logging.info("appliance %s port %s: %s %s", appliance_id, port_id,
+                     port['state'] if port else 'unknown',
+                     "used by %s, test %s" % (usage.get('used_by'), usage.get('test_id')) if usage else "")
+
+
 def _test_list(args):
     ww = _get_workload_wisdom(args)
     logging.info("list of tests")
-    ww.list_tests()
+    _log_result(ww.list_tests())
+
+
+def _get_recorder(args):
+    if not args.record:
+        return None
+
+    from workloader.recorder import StatsRecorder
+    logging.info("record port stats to %s", args.record)
+    return StatsRecorder(args.record)
 
 
 def _test_show(args):
     ww = _get_workload_wisdom(args)
     logging.info("show test: %s", args.id)
     test = ww.show_test(args.id)
-    complete = ww.wait_until_test_complete(test['id'])
-    ww.save_all_test_results(complete, args.path)
+    recorder = _get_recorder(args)
+    for _, complete in _wait_until_complete(args, ww, [test['id']], recorder=recorder):
+        _save_results(args, ww, complete)
+    if recorder:
+        recorder.close()
 
 
 def _test_start(args):
@@ -135,8 +314,72 @@ def _test_start(args):
         duration=args.duration
     )
 
-    complete = ww.wait_until_test_complete(test['id'])
-    ww.save_all_test_results(complete, args.path)
+    recorder = _get_recorder(args)
+    for _, complete in _wait_until_complete(args, ww, [test['id']], recorder=recorder):
+        _save_results(args, ww, complete)
+    if recorder:
+        recorder.close()
+
+
+def _test_wait(args):
+    ww = _get_workload_wisdom(args)
+    logging.info("wait for tests: %s", args.id)
+    recorder = _get_recorder(args)
+    # results of each test are saved as soon as it completes
+    for _, test in _wait_until_complete(args, ww, args.id, recorder=recorder):
+        _save_results(args, ww, test)
+    if recorder:
+        recorder.close()
+
+
+def _test_schedule(args):
+    import requests
+    from workloader.scheduler import TestScheduler
+
+    ww = _get_workload_wisdom(args)
+    scheduler = TestScheduler(ww, poll_interval=args.interval)
+    for project, testbed, duration in args.test or []:
+        scheduler.add_test(project, testbed, duration)
+    for iteration_suite, testbed in args.iteration or []:
+        scheduler.add_iteration(iteration_suite, testbed)
+
+    logging.info("scheduling %d jobs", len(scheduler))
+    for job in scheduler.run():
+        if job['error']:
+            logging.error("%s %s on testbed %s not started: %s", job['kind'], job['name'], job['testbed'], job['error'])
+        elif job['kind'] == TestScheduler.TEST:
+            # the other jobs keep running if the results of one cannot be saved
+            try:
+                _save_results(args, ww, job['result'])
+            except (requests.exceptions.RequestException, OSError, KeyError, ValueError) as e:
+                logging.error("failed saving the results of test %s: %s", job['id'], e)
+                args.failed_results = getattr(args, 'failed_results', []) + [(job['id'], [str(e)])]
+
+
+def _test_stats(args):
+    from workloader.stats import SCENARIO_METRICS, SUCCEEDS, ATTEMPTS
+
+    ww = _get_workload_wisdom(args)
+    logging.info("stats of test: %s", args.id)
+    test = ww.show_test(args.id)
+    stats = ww.get_test_stats(test)
+    rates = None
+    if args.interval:
+        time.sleep(args.interval)
+        previous, stats = stats, ww.get_test_stats(test)
+        rates = stats.rates(previous).column(ATTEMPTS)
+
+    counters = stats.select(SCENARIO_METRICS)
+    ratios = stats.ratio(SUCCEEDS, ATTEMPTS)
+    logging.info("%-12s %14s %14s %14s %14s %10s %12s",
+                 "port", "attempts", "succeeds", "fails", "aborts", "success", "attempts/s")
+    for i, port_id in enumerate(stats.port_ids):
+        logging.info("%-12s %14g %14g %14g %14g %10.4f %12g", port_id, *(
+            list(counters[i]) + [ratios[i], rates[i] if rates is not None else float('nan')]))
+    totals = stats.totals(SCENARIO_METRICS)
+    logging.info("%-12s %14g %14g %14g %14g %10.4f %12g", "total", *(
+        [totals[name] for name in SCENARIO_METRICS] + [stats.total_ratio(SUCCEEDS, ATTEMPTS),
+                                                        rates.sum() if rates is not None else float('nan')]))
 
 
 def _test_stop(args):
@@ -150,13 +393,13 @@ def _test_stop(args):
         test = ww.stop_test_by_project_name(project_name=args.project)
 
     if test:
-        ww.save_all_test_results(test, args.path)
+        _save_results(args, ww, test)
 
 
 def _composite_workload_list(args):
     ww = _get_workload_wisdom(args)
     logging.info("list of composite workloads")
-    ww.list_composite_workloads()
+    _log_result(ww.list_composite_workloads())
 
 
 def _composite_workload_private(args):
@@ -169,7 +412,7 @@ def _composite_workload_private(args):
 def _composite_workload_show(args):
     ww = _get_workload_wisdom(args)
     logging.info("show composite workload %s", args.name)
-    ww.get_composite_workload_by_name(args.name)
+    _log_result(ww.get_composite_workload_by_name(args.name))
 
 
 def _composite_workload_delete(args):
@@ -189,16 +432,16 @@ def _composite_workload_clone(args):
 def _iteration_suites_list(args):
     ww = _get_workload_wisdom(args)
     logging.info("list of iteration test suites")
-    ww.list_iteration_suite()
+    _log_result(ww.list_iteration_suite())
 
 def _iteration_suites_show(args):
     ww = _get_workload_wisdom(args)
     if args.id:
         logging.info("show iteration test suite by id: %s", args.id)
-        ww.show_iteration_suite(args.id)
+        _log_result(ww.show_iteration_suite(args.id))
     elif args.name:
         logging.info("show iteration test suite by name: %s", args.name)
-        ww.get_iteration_suite_by_name(args.name)
+        _log_result(ww.get_iteration_suite_by_name(args.name))
 
 def _iteration_test_suites_start(args):
     ww = _get_workload_wisdom(args)
@@ -209,7 +452,8 @@ def _iteration_test_suites_start(args):
         testbed_name=args.testbed,
     )
 
-    ww.wait_until_iteration_complete(iteration['id'])
+    for _ in _wait_until_complete(args, ww, [], [iteration['id']]):
+        pass
 
 def _iteration_test_suites_stop(args):
     ww = _get_workload_wisdom(args)
@@ -222,16 +466,63 @@ def _iteration_test_suites_stop(args):
         ww.stop_iteration_test_suite_by_name(iteration_suite_name=args.name)
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-d', '--ip', action="store", default='10.228.56.32', help="WorkloadWisdom IP")
-    parser.add_argument('-u', '--username', action="store", required=True, help="WorkloadWisdom Username")
-    parser.add_argument('-p', '--password', action="store", required=True, help="WorkloadWisdom Password")
+def _batch(args):
+    from workloader import batch
+
+    operations, workers = batch.load_manifest(args.manifest)
+    workers = args.workers or workers or batch.DEFAULT_WORKERS
+    ww = _get_workload_wisdom(args)
+    logging.info("run %d operations of %s, %d at a time", len(operations), args.manifest, workers)
+    report = batch.run_batch(ww, operations, workers=workers)
+
+    monitor = getattr(args, 'monitor', None)
+    if monitor is not None:
+        # polled from now on, a later wait for them is answered as soon as they finish
+        for entry in report:
+            if entry['op'] == 'start' and entry['id']:
+                if entry['kind'] == 'test':
+                    monitor.add_test(entry['id'])
+                else:
+                    monitor.add_iteration(entry['id'])
+
+    logging.info("%-5s %-8s %-10s %-40s %-7s %-26s %8s", "#", "op", "kind", "target", "status", "id", "seconds")
+    for entry in report:
+        logging.info("%-5d %-8s %-10s %-40s %-7s %-26s %8.3f", entry['index'], entry['op'], entry['kind'],
+                     entry['target'], entry['status'], entry['id'] or entry['error'] or '', entry['duration'])
+    failed = len([entry for entry in report if entry['status'] != 'ok'])
+    logging.info("%d operations ok, %d failed", len(report) - failed, failed)
+
+    if args.report:
+        with open(args.report, "w") as p:
+            json.dump(report, p, indent=4)
+
+
+def _dispatch(argv, cwd):
+    """Run a command forwarded to the daemon."""
+
+    args = _parse_args(argv)
+    for name in PATH_ARGS:
+        if getattr(args, name, None):
+            setattr(args, name, os.path.join(cwd, getattr(args, name)))
+    logging.info("run: %s", " ".join(arg for arg in argv if arg not in (args.password,)))
+    _run_command(args, argv)
+
+
+def _serve(args):
+    from workloader.daemon import WorkloaderDaemon
+
+    global _sessions, _monitors
+    _sessions = {}
+    _monitors = {}
+    formatter = logging.Formatter(datefmt=DATE_FORMAT, fmt=LOGGING_FORMAT)
+    WorkloaderDaemon(_dispatch, args.socket, formatter=formatter).serve_forever()
+    for monitor in _monitors.values():
+        monitor.close()
+    for ww in _sessions.values():
+        ww.close()
 
-    sub_parser = parser.add_subparsers(help="Workloader Command help")
 
-    # Generator Module
-    gen_parser = sub_parser.add_parser('generator', help='Generator Module')
+def _add_generator_actions(gen_parser):
     gen_sub_parser = gen_parser.add_subparsers(help="Action to perform")
     gen_list_parser = gen_sub_parser.add_parser('list', help='List of generators')
     gen_show_parser = gen_sub_parser.add_parser('show', help='Show a generator')
@@ -239,8 +530,8 @@ def main():
     gen_list_parser.set_defaults(func=_generator_list)
     gen_show_parser.set_defaults(func=_generator_show)
 
-    # Workload Module
-    workload_parser = sub_parser.add_parser('workload', help='Workloads Module')
+
+def _add_workload_actions(workload_parser):
     workload_sub_parser = workload_parser.add_subparsers(help="Action to perform")
     # list
     workload_list_parser = workload_sub_parser.add_parser('list', help='List of workloads')
@@ -265,8 +556,8 @@ def main():
     workload_del_parser.set_defaults(func=_workloads_delete)
     workload_clone_parser.set_defaults(func=_workloads_clone)
 
-    # Testbed Module
-    tb_parser = sub_parser.add_parser('testbed', help='Testbeds Module')
+
+def _add_testbed_actions(tb_parser):
     tb_sub_parser = tb_parser.add_subparsers(help="Action to perform")
     # list
     tb_list_parser = tb_sub_parser.add_parser('list', help='List of testbeds')
@@ -284,15 +575,19 @@ def main():
     tb_clone_parser = tb_sub_parser.add_parser('clone', help='Clone a testbed')
     tb_clone_parser.add_argument('-old', action='store', help='Name of the old testbed')
     tb_clone_parser.add_argument('-new', action='store', help='Name of the new testbed')
+    # ports
+    tb_ports_parser = tb_sub_parser.add_parser('ports', help='Show port states of a testbed')
+    tb_ports_parser.add_argument('-name', action='store', help='Name of the testbed')
 
     tb_list_parser.set_defaults(func=_testbed_list)
     tb_private_parser.set_defaults(func=_testbed_private)
     tb_show_parser.set_defaults(func=_testbed_show)
     tb_del_parser.set_defaults(func=_testbed_delete)
     tb_clone_parser.set_defaults(func=_testbed_clone)
+    tb_ports_parser.set_defaults(func=_testbed_ports)
+
 
-    # Test Module
-    test_parser = sub_parser.add_parser('test', help='Tests Module')
+def _add_test_actions(test_parser):
     test_sub_parser = test_parser.add_subparsers(help="Action to perform")
     # list
     test_list_parser = test_sub_parser.add_parser('list', help='List of tests')
@@ -300,26 +595,50 @@ def main():
     test_show_parser = test_sub_parser.add_parser('show', help='Show a test')
     test_show_parser.add_argument('-id', action='store', help='Id of the test to show')
     test_show_parser.add_argument('-path', action='store', default='./', help='Path to store the test results')
+    test_show_parser.add_argument('-record', action='store', help='File to record all port stats samples to')
     # start
     test_start_parser = test_sub_parser.add_parser('start', help='Start a test')
     test_start_parser.add_argument('-project', action='store', help='Name of the project to start')
     test_start_parser.add_argument('-testbed', action='store', help='Name of the testbed under test')
     test_start_parser.add_argument('-duration', action='store', help='Duration of the test in seconds')
     test_start_parser.add_argument('-path', action='store', default='./', help='Path to store the test results')
+    test_start_parser.add_argument('-record', action='store', help='File to record all port stats samples to')
     # stop, either by id or by name
     test_stop_parser = test_sub_parser.add_parser('stop', help='Stop a test')
     group = test_stop_parser.add_mutually_exclusive_group()
     group.add_argument('-id', action='store', help='Id of the test to stop')
     group.add_argument('-project', action='store', help='Name of the project to stop')
     test_stop_parser.add_argument('-path', action='store', default='./', help='Path to store the test results')
+    # schedule, tests and iteration test suites started as soon as their ports are idle
+    test_schedule_parser = test_sub_parser.add_parser('schedule', help='Run queued tests as their ports get idle')
+    test_schedule_parser.add_argument('-test', action='append', nargs=3, metavar=('PROJECT', 'TESTBED', 'DURATION'),
+                                      help='Test to queue, may be repeated')
+    test_schedule_parser.add_argument('-iteration', action='append', nargs=2, metavar=('SUITE', 'TESTBED'),
+                                      help='Iteration test suite to queue, may be repeated')
+    test_schedule_parser.add_argument('-interval', action='store', type=float, default=10,
+                                      help='Seconds between two checks of the ports')
+    test_schedule_parser.add_argument('-path', action='store', default='./', help='Path to store the test results')
+    # stats, of all ports of a test
+    test_stats_parser = test_sub_parser.add_parser('stats', help='Show port stats of a test')
+    test_stats_parser.add_argument('-id', action='store', help='Id of the test')
+    test_stats_parser.add_argument('-interval', action='store', type=float, default=0,
+                                   help='Seconds between two samples to compute rates')
+    # wait, for multiple tests at once
+    test_wait_parser = test_sub_parser.add_parser('wait', help='Wait until tests complete')
+    test_wait_parser.add_argument('-id', action='store', nargs='+', help='Ids of the tests to wait for')
+    test_wait_parser.add_argument('-path', action='store', default='./', help='Path to store the test results')
+    test_wait_parser.add_argument('-record', action='store', help='File to record all port stats samples to')
 
     test_list_parser.set_defaults(func=_test_list)
     test_show_parser.set_defaults(func=_test_show)
     test_start_parser.set_defaults(func=_test_start)
     test_stop_parser.set_defaults(func=_test_stop)
+    test_wait_parser.set_defaults(func=_test_wait)
+    test_stats_parser.set_defaults(func=_test_stats)
+    test_schedule_parser.set_defaults(func=_test_schedule)
 
-    # Composite composite Module
-    composite_parser = sub_parser.add_parser('composite', help='Composite workloads Module')
+
+def _add_composite_actions(composite_parser):
     composite_sub_parser = composite_parser.add_subparsers(help="Action to perform")
     # list
     composite_list_parser = composite_sub_parser.add_parser('list', help='List of composite workloads')
@@ -344,8 +663,8 @@ def main():
     composite_del_parser.set_defaults(func=_composite_workload_delete)
     composite_clone_parser.set_defaults(func=_composite_workload_clone)
 
-    # Iteration Suite Module
-    iteration_parser = sub_parser.add_parser('iteration', help='Iteration suite Module')
+
+def _add_iteration_actions(iteration_parser):
     iteration_sub_parser = iteration_parser.add_subparsers(help="Action to perform")
     # list
     iteration_list_parser = iteration_sub_parser.add_parser('list', help='List of Iteration suites')
@@ -376,35 +695,103 @@ def main():
     iteration_start_parser.set_defaults(func=_iteration_test_suites_start)
     iteration_stop_parser.set_defaults(func=_iteration_test_suites_stop)
 
-    args = parser.parse_args()
-    args.func(args)
 
+def _add_batch_actions(batch_parser):
+    batch_parser.add_argument('-manifest', action='store', required=True, help='JSON or YAML manifest of operations')
+    batch_parser.add_argument('-workers', action='store', type=int, help='Max number of concurrent operations')
+    batch_parser.add_argument('-report', action='store', help='File to save the JSON report to')
+    batch_parser.set_defaults(func=_batch)
+
+
+def _add_serve_actions(serve_parser):
+    serve_parser.set_defaults(func=_serve)
+
+
+# module name -> (help, function adding its actions), each module is built
+# only when named on the command line
+MODULES = [
+    ('generator', 'Generator Module', _add_generator_actions),
+    ('workload', 'Workloads Module', _add_workload_actions),
+    ('testbed', 'Testbeds Module', _add_testbed_actions),
+    ('test', 'Tests Module', _add_test_actions),
+    ('composite', 'Composite workloads Module', _add_composite_actions),
+    ('iteration', 'Iteration suite Module', _add_iteration_actions),
+    ('batch', 'Run a manifest of operations concurrently', _add_batch_actions),
+    ('serve', 'Serve commands with warm sessions over a Unix socket', _add_serve_actions),
+]
 
-def show_logo(logo_file='/opt/workloader/.workloaderascii'):
+
+def _build_parser(argv=None):
+    """Build the parser of a command line, all modules if argv is None."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--ip', action="store", default='10.228.56.32', help="WorkloadWisdom IP")
+    parser.add_argument('-u', '--username', action="store", help="WorkloadWisdom Username, required except by serve")
+    parser.add_argument('-p', '--password', action="store", help="WorkloadWisdom Password, required except by serve")
+    parser.add_argument('-l', '--log-level', action="store", default='INFO', choices=LOG_LEVELS,
+                        help="Log level, DEBUG dumps the REST responses")
+    parser.add_argument('--log-file', action="store", default='./workloader.log', help="Log file")
+    parser.add_argument('--socket', action="store", default=DEFAULT_SOCKET, help="Unix socket of the daemon")
+    parser.add_argument('--direct', action="store_true", help="Do not forward the command to a running daemon")
+    parser.add_argument('--refresh', action="store_true",
+                        help="Fetch the iteration suites again instead of using the local catalog")
+    parser.add_argument('--metrics', action="store_true",
+                        help="Log the requests per endpoint at exit, since the daemon started when served")
+    parser.add_argument('--metrics-file', action="store",
+                        help="File to save the request metrics to, Prometheus text if .prom or .txt, JSON otherwise")
+    parser.add_argument('--trace', action="store",
+                        help="File to save a Chrome trace-event timeline of the command to, e.g. start.trace.json")
+
+    sub_parser = parser.add_subparsers(help="Workloader Command help")
+    wanted = set(argv) if argv is not None else None
+    for name, module_help, add_actions in MODULES:
+        module_parser = sub_parser.add_parser(name, help=module_help)
+        if wanted is None or name in wanted:
+            add_actions(module_parser)
+
+    return parser
+
+
+def _parse_args(argv):
+    """Parse a command line, the daemon serves the credentials of each command, not its own."""
+
+    parser = _build_parser(argv)
+    args = parser.parse_args(argv)
+    if getattr(args, 'func', None) is not _serve and not (args.username and args.password):
+        parser.error("the following arguments are required: -u/--username, -p/--password")
+
+    return args
+
+
+def main():
+    args = _parse_args(sys.argv[1:])
+    if args.func is not _serve and not args.direct:
+        from workloader import daemon
+        # served in milliseconds by a running daemon, run here otherwise
+        status = daemon.forward(sys.argv[1:], args.socket, args.log_level)
+        if status is not None:
+            sys.exit(status)
+
+    listener = _setup_logging(args.log_level, args.log_file)
     try:
-        p = open(logo_file, "r")
-        logo = p.read()
-        p.close()
-        logging.info("\n" + logo)
-    except:
-        logging.warn("failed to find %s", logo_file)
+        show_logo()
+        _run_command(args, sys.argv[1:])
+    finally:
+        listener.stop()
+
+
+def show_logo(logo_file=LOGO_FILE):
+    # the logo is optional, most installs have none
+    if not os.path.isfile(logo_file):
         return
 
+    try:
+        with open(logo_file, "r") as p:
+            logo = p.read()
+        logging.info("\n" + logo)
+    except (OSError, UnicodeDecodeError):
+        logging.debug("failed to read %s", logo_file)
+
 
 if __name__ == "__main__":
-    log_file = './workloader.log'
-    logging.basicConfig(
-        format=LOGGING_FORMAT,
-        level=logging.DEBUG,
-        datefmt=DATE_FORMAT,
-        filename=log_file,
-        filemode='w'
-    )
-
-    console = logging.StreamHandler()
-    console.setLevel(logging.DEBUG)
-    formatter = logging.Formatter(datefmt=DATE_FORMAT, fmt=LOGGING_FORMAT)
-    console.setFormatter(formatter)
-    logging.getLogger('').addHandler(console)
-    show_logo()
     main()
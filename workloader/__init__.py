@@ -15,4 +15,25 @@
 # option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
 # the full text of the license.
 
-from .workloadwisdom import WorkloadWisdom
\ No newline at end of file
+__all__ = ['WorkloadWisdom', 'AsyncWorkloadWisdom']
+
+# the clients pull in requests and numpy, imported on first access
+# only so that e.g. the CLI forwarding to a daemon starts quickly
+_CLIENTS = {
+    'WorkloadWisdom': '.workloadwisdom',
+    'AsyncWorkloadWisdom': '.aioworkloadwisdom',
+}
+
+
+def __getattr__(name):
+    if name not in _CLIENTS:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    import importlib
+    value = getattr(importlib.import_module(_CLIENTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``AsyncWorkloadWisdom`` module, a thread-offload wrapper of WorkloadWisdom for asyncio
+
+Every public method of ``WorkloadWisdom`` is mirrored as a coroutine when
+this module is imported, so both clients share one implementation of the
+requests, the name indexes, the port inventory, the retry, circuit breaker
+and rate limits, and the resumable downloads. It is not a non-blocking
+client: each call runs the blocking WorkloadWisdom method on a worker
+thread, one thread per request in flight, and the event loop stays free
+while it runs.
+
+**Classes**
+
+    AsyncWorkloadWisdom
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+from workloader.workloadwisdom import WorkloadWisdom
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncWorkloadWisdom(object):
+    """A Workload Wisdom driven from asyncio, its calls offloaded to threads.
+
+    Mirrors the ``WorkloadWisdom`` API with coroutines, each call runs the
+    WorkloadWisdom method on a pool of ``concurrency`` threads. A method
+    exiting the process on a missing name, e.g. get_project_by_name, raises
+    a RuntimeError instead, the event loop keeps running. Calls awaited
+    together run in parallel, fan-out calls such as appliance hydration and
+    port polling also run concurrently inside WorkloadWisdom, the requests in
+    flight are bounded by its limiter. Waits, e.g. wait_until_test_complete or
+    stop_test, run on their own threads so they never hold up other calls.
+
+    Usage::
+
+        async with AsyncWorkloadWisdom(url, username, password) as ww:
+            tests = await ww.list_tests()
+            async for kind, test in ww.wait_until_tests_complete(test_ids):
+                await ww.save_all_test_results(test)
+
+    """
+
+    PORT_STATUS_RUNNING = WorkloadWisdom.PORT_STATUS_RUNNING
+    PORT_STATUS_IDLE = WorkloadWisdom.PORT_STATUS_IDLE
+    TEST_ACTIVE_STATES = WorkloadWisdom.TEST_ACTIVE_STATES
+    TEST_FINISHED_STATES = WorkloadWisdom.TEST_FINISHED_STATES
+
+    DEFAULT_CONCURRENCY = 8
+    # max number of waits in progress at a time, they mostly sleep
+    MAX_WAITS = 64
+    # methods polling until the server reaches a state
+    WAIT_PREFIXES = ('wait_until_', 'stop_')
+
+    def __init__(self, url, username, password, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+        """Create a client, nothing is sent until a method is awaited.
+
+        :param url: url of the WorkloadWisdom
+        :param username: username
+        :param password: password
+        :param concurrency: max number of calls running at a time, waits excluded
+        :param kwargs: options of WorkloadWisdom, e.g. pool_size, timeout, rate_limit, retries
+        """
+
+        self._ww = WorkloadWisdom(url, username, password, **kwargs)
+        self._concurrency = concurrency
+        self._executor = None
+        self._waits = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        """Start the worker threads, the version is only fetched by get_version()."""
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix='aww')
+            self._waits = ThreadPoolExecutor(max_workers=self.MAX_WAITS, thread_name_prefix='aww-wait')
+
+    async def close(self):
+        """Close the pooled connections and stop the worker threads."""
+
+        if self._executor is not None:
+            await self._run('close', self._ww.close)
+            self._executor.shutdown(wait=False)
+            self._waits.shutdown(wait=False)
+            self._executor = None
+            self._waits = None
+
+    def _submit(self, name, func, *args):
+        """Return :concurrent.futures.Future: of func(*args) run on a worker thread, in the context of the caller."""
+
+        if self._executor is None:
+            raise RuntimeError("client not opened, use open() or async with")
+
+        executor = self._waits if name.startswith(self.WAIT_PREFIXES) else self._executor
+        return executor.submit(contextvars.copy_context().run, _call, name, func, *args)
+
+    def _run(self, name, func, *args):
+        """Return :asyncio.Future: of func(*args) run on a worker thread."""
+
+        return asyncio.wrap_future(self._submit(name, func, *args))
+
+    @property
+    def sync(self):
+        """:WorkloadWisdom: client running the calls, e.g. to hand to a TestScheduler"""
+
+        return self._ww
+
+    @property
+    def version(self):
+        """:awaitable: version of the WorkloadWisdom, fetched once then cached, e.g. await ww.version"""
+
+        return self._run('version', lambda: self._ww.version)
+
+    @property
+    def inventory(self):
+        """:PortInventory: snapshot of the appliance ports, shared with the WorkloadWisdom calls"""
+
+        return self._ww.inventory
+
+    @property
+    def metrics(self):
+        """:RequestMetrics: requests per endpoint, e.g. metrics.dump('workloader.prom') or metrics.summary()"""
+
+        return self._ww.metrics
+
+
+def _call(name, func, *args):
+    """Run func(*args), a SystemExit of the sync client raised as RuntimeError."""
+
+    try:
+        return func(*args)
+    except SystemExit as e:
+        raise RuntimeError("%s failed, the sync client exited with %s" % (name, e.code))
+
+
+def _coroutine(name, func):
+    @functools.wraps(func)
+    async def method(self, *args, **kwargs):
+        return await self._run(name, functools.partial(getattr(self._ww, name), *args, **kwargs))
+
+    return method
+
+
+def _async_generator(name, func):
+    @functools.wraps(func)
+    async def method(self, *args, **kwargs):
+        # creating the generator sends nothing, each item is fetched on a worker thread
+        items = getattr(self._ww, name)(*args, **kwargs)
+        done = object()
+        pending = None
+        try:
+            while True:
+                pending = self._submit(name, next, items, done)
+                item = await asyncio.wrap_future(pending)
+                pending = None
+                if item is done:
+                    break
+                yield item
+        finally:
+            # closed on a thread, once next() returns if a cancelled await left it running
+            if self._waits is not None:
+                self._waits.submit(_close, pending, items)
+            else:
+                items.close()
+
+    return method
+
+
+def _close(pending, items):
+    if pending is not None:
+        futures.wait([pending])
+    items.close()
+
+
+def _mirror(cls, source):
+    """Add a coroutine to cls for every public method of source it does not define itself."""
+
+    for name in dir(source):
+        if name.startswith('_') or name in cls.__dict__:
+            continue
+        func = inspect.getattr_static(source, name)
+        if not inspect.isfunction(func):
+            continue
+        method = _async_generator(name, func) if inspect.isgeneratorfunction(func) else _coroutine(name, func)
+        method.__qualname__ = "%s.%s" % (cls.__name__, name)
+        setattr(cls, name, method)
+
+
+_mirror(AsyncWorkloadWisdom, WorkloadWisdom)
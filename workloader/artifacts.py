@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""Module downloading test artifacts concurrently
+
+**Functions**
+
+    fetch_artifacts
+"""
+
+import logging
+import os
+import time
+
+import requests
+
+from workloader.util import ContextThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 2
+# seconds before the first retry, doubled on each following one
+DEFAULT_BACKOFF = 2
+
+
+def _fetch(name, fetch, retries, backoff):
+    """Run one artifact job with retries. Returns :dict: its manifest entry."""
+
+    entry = {
+        'name': name,
+        'path': None,
+        'size': None,
+        'duration': None,
+        'attempts': 0,
+        'error': None,
+    }
+
+    start = time.time()
+    while True:
+        entry['attempts'] += 1
+        try:
+            entry['path'] = fetch()
+            entry['size'] = os.path.getsize(entry['path'])
+            entry['error'] = None
+            break
+        except (requests.exceptions.RequestException, IOError, OSError) as e:
+            entry['error'] = str(e)
+            if entry['attempts'] > retries:
+                LOGGER.error("failed saving %s after %d attempts: %s", name, entry['attempts'], e)
+                break
+            delay = backoff * 2 ** (entry['attempts'] - 1)
+            LOGGER.warning("failed saving %s: %s, retry in %s seconds", name, e, delay)
+            time.sleep(delay)
+
+    entry['duration'] = round(time.time() - start, 3)
+    return entry
+
+
+def fetch_artifacts(jobs, workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Run artifact jobs on a bounded thread pool.
+
+    A failed job is retried on its own, an interrupted download resumes from its
+    partial file, so one slow or broken artifact does not hold up the others.
+
+    :param jobs: list of (name, fetch) tuples, fetch is a callable returning the saved file name
+    :param workers: max number of concurrent downloads
+    :param retries: number of retries of a failed job
+    :param backoff: seconds before the first retry, doubled on each following one
+    :return: :list: manifest, a dict per job with name, path, size, duration, attempts and error
+    :rtype: list
+    """
+
+    if not jobs:
+        return []
+
+    with ContextThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        futures = [executor.submit(_fetch, name, fetch, retries, backoff) for name, fetch in jobs]
+        return [future.result() for future in futures]
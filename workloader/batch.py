@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""Module running a manifest of operations concurrently
+
+A manifest is a JSON or YAML file, either a list of operations or a dict
+with 'operations' and optionally 'workers'::
+
+    {
+        "workers": 8,
+        "operations": [
+            {"op": "clone", "kind": "workload", "name": "xxx", "new": "yyy"},
+            {"op": "privacy", "kind": "testbed", "name": "aaa", "private": false},
+            {"op": "delete", "kind": "composite", "name": "zzz"},
+            {"op": "start", "kind": "test", "project": "xxx", "testbed": "aaa", "duration": 600},
+            {"op": "start", "kind": "iteration", "name": "sss", "testbed": "aaa"},
+            {"op": "stop", "kind": "test", "id": "5bbed2b6421aa947292321de"},
+            {"op": "stop", "kind": "iteration", "name": "sss"}
+        ]
+    }
+
+Operations run independently of each other, e.g. a workload cloned in a
+manifest cannot be changed by the same manifest.
+
+**Functions**
+
+    load_manifest
+    run_batch
+"""
+
+import json
+import logging
+import time
+
+import requests
+
+from workloader.util import ContextThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+
+# kind of an operation -> kind of its name in WorkloadWisdom.resolve_names()
+NAME_KINDS = {
+    'workload': 'project',
+    'testbed': 'testbed',
+    'composite': 'composite',
+    'iteration': 'iteration_suite',
+}
+
+OPERATIONS = {
+    'clone': ('workload', 'testbed', 'composite'),
+    'delete': ('workload', 'testbed', 'composite'),
+    'privacy': ('workload', 'testbed', 'composite'),
+    'start': ('test', 'iteration'),
+    'stop': ('test', 'iteration'),
+}
+
+# name kind of the workload of a test, composite workloads start as projects too
+TEST_PROJECT_KINDS = ('project', 'composite')
+
+# fields of an operation which are names to resolve, field -> name kind or kinds searched in order
+_NAME_FIELDS = {
+    ('test', 'project'): TEST_PROJECT_KINDS,
+    ('test', 'testbed'): 'testbed',
+    ('iteration', 'testbed'): 'testbed',
+}
+
+
+def load_manifest(path):
+    """Load and check a manifest file, YAML needs PyYAML installed.
+
+    :param path: file name of the manifest, '.yml' or '.yaml' for YAML, JSON otherwise
+    :return: :tuple: (list of operation dicts, workers or None)
+    :rtype: tuple
+    """
+
+    with open(path, "r") as p:
+        if path.endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required for YAML manifests, pip install workloader[yaml]")
+            manifest = yaml.safe_load(p)
+        else:
+            manifest = json.load(p)
+
+    workers = None
+    if isinstance(manifest, dict):
+        workers = manifest.get('workers')
+        manifest = manifest.get('operations')
+    if not isinstance(manifest, list):
+        raise ValueError("manifest %s has no list of operations" % path)
+
+    for index, operation in enumerate(manifest):
+        if not isinstance(operation, dict):
+            raise ValueError("operation %d: not a dict of op, kind and fields" % index)
+        op = operation.get('op')
+        kind = operation.get('kind')
+        if kind not in OPERATIONS.get(op, ()):
+            raise ValueError("operation %d: unsupported %s of %s" % (index, op, kind))
+        if op == 'clone' and not operation.get('new'):
+            raise ValueError("operation %d: clone needs 'new'" % index)
+        if op == 'start':
+            if not operation.get('testbed'):
+                raise ValueError("operation %d: start needs 'testbed'" % index)
+            if kind == 'test' and not (operation.get('project') and operation.get('duration')):
+                raise ValueError("operation %d: start of a test needs 'project' and 'duration'" % index)
+            if kind == 'iteration' and not operation.get('name'):
+                raise ValueError("operation %d: start of an iteration needs 'name'" % index)
+        elif op == 'stop' and kind == 'test':
+            if not (operation.get('id') or operation.get('project')):
+                raise ValueError("operation %d: stop of a test needs 'id' or 'project'" % index)
+        elif not (operation.get('name') or operation.get('id')):
+            raise ValueError("operation %d: %s needs 'name' or 'id'" % (index, op))
+
+    return manifest, workers
+
+
+def _names(operation):
+    """Return :list: (name kind, name) of the names an operation refers to."""
+
+    names = []
+    kind = operation['kind']
+    if operation.get('name') and kind in NAME_KINDS:
+        names.append((NAME_KINDS[kind], operation['name']))
+    for (field_kind, field), name_kinds in _NAME_FIELDS.items():
+        if field_kind == kind and operation.get(field):
+            if not isinstance(name_kinds, tuple):
+                name_kinds = (name_kinds,)
+            names.extend((name_kind, operation[field]) for name_kind in name_kinds)
+
+    return names
+
+
+def _resolve(ww, operations, workers):
+    """Resolve all names of all operations, one listing per name kind."""
+
+    wanted = {}
+    for operation in operations:
+        for name_kind, name in _names(operation):
+            wanted.setdefault(name_kind, set()).add(name)
+
+    if not wanted:
+        return {}
+
+    with ContextThreadPoolExecutor(max_workers=min(workers, len(wanted))) as executor:
+        futures = dict((name_kind, executor.submit(ww.resolve_names, name_kind, names))
+                       for name_kind, names in wanted.items())
+        return dict((name_kind, future.result()) for name_kind, future in futures.items())
+
+
+def _run(ww, operation, ids):
+    op = operation['op']
+    kind = operation['kind']
+
+    def id_of(name_kind, name):
+        object_id = ids.get(name_kind, {}).get(name)
+        if object_id is None:
+            raise ValueError("%s %s not found" % (name_kind, name))
+        return object_id
+
+    def workload_of(name):
+        # AR999302 - composite workloads start as projects, searched after them
+        for name_kind in TEST_PROJECT_KINDS:
+            if ids.get(name_kind, {}).get(name) is not None:
+                return name_kind, ids[name_kind][name]
+        raise ValueError("%s %s not found" % (' or '.join(TEST_PROJECT_KINDS), name))
+
+    if kind in ('workload', 'testbed', 'composite'):
+        object_id = operation.get('id') or id_of(NAME_KINDS[kind], operation['name'])
+        suffix = {'workload': 'project', 'testbed': 'testbed', 'composite': 'composite_workload'}[kind]
+        if op == 'clone':
+            return getattr(ww, 'clone_' + suffix)(object_id, operation['new'])
+        if op == 'delete':
+            getattr(ww, 'delete_' + suffix)(object_id)
+            return {'id': object_id}
+        return getattr(ww, 'set_%s_privacy' % suffix)(object_id, operation.get('private', True))
+
+    if op == 'start':
+        testbed = ww.get_testbed(id_of('testbed', operation['testbed']))
+        if kind == 'test':
+            name_kind, project_id = workload_of(operation['project'])
+            if name_kind == 'composite':
+                project = ww.show_composite_workload(project_id)
+            else:
+                project = ww.show_project(project_id)
+            return ww.start_test(project, testbed, operation['duration'])
+        iteration_suite = ww.show_iteration_suite(id_of('iteration_suite', operation['name']))
+        return ww.start_iteration_test_suite(iteration_suite, testbed)
+
+    if kind == 'test':
+        if operation.get('id'):
+            return ww.stop_test(operation['id'])
+        workload_of(operation['project'])
+        return ww.stop_test_by_project_name(operation['project'])
+    if operation.get('id'):
+        return ww.stop_iteration_test_suite(operation['id'])
+    id_of('iteration_suite', operation['name'])
+    return ww.stop_iteration_test_suite_by_name(operation['name'])
+
+
+def _target(operation):
+    return operation.get('id') or operation.get('name') or operation.get('project')
+
+
+def _execute(ww, index, operation, ids):
+    """Run one operation. Returns :dict: its report entry."""
+
+    entry = {
+        'index': index,
+        'op': operation['op'],
+        'kind': operation['kind'],
+        'target': _target(operation),
+        'status': 'ok',
+        'id': None,
+        'error': None,
+        'duration': None,
+    }
+
+    start = time.time()
+    try:
+        result = _run(ww, operation, ids)
+        if isinstance(result, dict):
+            entry['id'] = result.get('id')
+    except (requests.exceptions.RequestException, RuntimeError, ValueError, KeyError, TypeError) as e:
+        entry['status'] = 'failed'
+        entry['error'] = str(e)
+        LOGGER.error("operation %d, %s %s %s failed: %s", index, entry['op'], entry['kind'], entry['target'], e)
+
+    entry['duration'] = round(time.time() - start, 3)
+    return entry
+
+
+def run_batch(ww, operations, workers=DEFAULT_WORKERS):
+    """Run operations concurrently, after resolving all their names at once.
+
+    :param ww: WorkloadWisdom to run the operations on
+    :param operations: list of operation dicts, see load_manifest()
+    :param workers: max number of concurrent operations
+    :return: :list: report, a dict per operation with index, op, kind, target, status, id, error and duration
+    :rtype: list
+    """
+
+    if not operations:
+        return []
+
+    ids = _resolve(ww, operations, workers)
+    LOGGER.info("resolved %d names, running %d operations",
+                sum(len(names) for names in ids.values()), len(operations))
+
+    with ContextThreadPoolExecutor(max_workers=min(workers, len(operations))) as executor:
+        futures = [executor.submit(_execute, ww, index, operation, ids) for index, operation in enumerate(operations)]
+        return [future.result() for future in futures]
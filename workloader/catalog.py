@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``SuiteCatalog`` module keeping hydrated WorkloadWisdom objects in a local SQLite file
+
+**Classes**
+
+    SuiteCatalog
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from workloader.util import ContextThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SuiteCatalog(object):
+    """A local catalog of hydrated objects, e.g. iteration suites.
+
+    Objects are stored per server and kind, keyed by id with an index on name,
+    so a lookup by name costs one list request plus the objects that changed.
+    The WorkloadWisdom listings hold no change marker, e.g. 'updated_at', so
+    an object edited under the same name is only seen once its cached body is
+    older than ``ttl`` seconds, or after invalidate().
+
+    """
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.workloader', 'catalog.sqlite')
+    # seconds a cached body without a change marker in the listing is trusted
+    DEFAULT_TTL = 300
+
+    def __init__(self, server, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        """Open or create a catalog.
+
+        :param server: url of the WorkloadWisdom the objects come from
+        :param path: file of the catalog, ':memory:' for a catalog that is not kept
+        :param ttl: seconds a body is used without a change marker, 0 to fetch it on every sync
+        """
+
+        self._server = server
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+        if path != ':memory:' and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " server TEXT, kind TEXT, id TEXT, name TEXT, updated_at TEXT, created_at TEXT, body TEXT,"
+                " PRIMARY KEY (server, kind, id))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_name ON entries (server, kind, name)")
+            # catalogs created before bodies expired have no fetch time, their bodies are fetched again
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+            if 'fetched_at' not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN fetched_at REAL")
+
+        LOGGER.debug("opened catalog: %s", path)
+
+    def close(self):
+        self._conn.close()
+
+    def _cached(self, kind):
+        rows = self._conn.execute(
+            "SELECT id, name, updated_at, body, fetched_at FROM entries WHERE server = ? AND kind = ?",
+            (self._server, kind))
+        return dict((row[0], row) for row in rows)
+
+    def invalidate(self, kind=None):
+        """Drop the cached objects of this server, they are fetched again by the next sync.
+
+        :param kind: kind of the objects to drop, all kinds if None
+        """
+
+        with self._lock, self._conn:
+            if kind is None:
+                self._conn.execute("DELETE FROM entries WHERE server = ?", (self._server,))
+            else:
+                self._conn.execute("DELETE FROM entries WHERE server = ? AND kind = ?", (self._server, kind))
+
+    def sync(self, kind, listing, fetch, name_field='name', refetch=None, prune=True, workers=8):
+        """Bring the catalog in line with a listing.
+
+        Ids that are new, renamed or whose 'updated_at' changed in the listing are
+        fetched concurrently, ids missing from the listing are dropped. Without
+        'updated_at' in the listing, a body older than the ttl is fetched again.
+
+        :param kind: kind of the objects, e.g. 'iteration_suite'
+        :param listing: list of dicts with 'id', optionally 'name' and 'updated_at'
+        :param fetch: callable returning the hydrated object of an id
+        :param name_field: field of the hydrated object to index as name
+        :param refetch: callable telling if a cached object must be fetched again anyway
+        :param prune: drop cached ids missing from the listing
+        :param workers: max number of concurrent fetches
+        :return: :int: number of objects fetched
+        :rtype: int
+        """
+
+        with self._lock:
+            cached = self._cached(kind)
+
+            now = time.time()
+            stale = []
+            for entry in listing:
+                row = cached.get(entry['id'])
+                if row is None:
+                    stale.append(entry['id'])
+                elif 'updated_at' in entry and entry['updated_at'] != row[2]:
+                    stale.append(entry['id'])
+                elif 'updated_at' not in entry and (row[4] is None or now - row[4] >= self._ttl):
+                    stale.append(entry['id'])
+                elif 'name' in entry and name_field == 'name' and entry['name'] != row[1]:
+                    stale.append(entry['id'])
+                elif refetch is not None and refetch(json.loads(row[3])):
+                    stale.append(entry['id'])
+
+            objects = []
+            if stale:
+                LOGGER.debug("fetch %d of %d %s", len(stale), len(listing), kind)
+                with ContextThreadPoolExecutor(max_workers=min(workers, len(stale))) as executor:
+                    objects = list(executor.map(fetch, stale))
+
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (server, kind, id, name, updated_at, created_at, body, fetched_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(self._server, kind, obj['id'], obj.get(name_field), obj.get('updated_at'),
+                      obj.get('created_at'), json.dumps(obj), now) for obj in objects])
+                if prune:
+                    listed = set(entry['id'] for entry in listing)
+                    self._conn.executemany(
+                        "DELETE FROM entries WHERE server = ? AND kind = ? AND id = ?",
+                        [(self._server, kind, entry_id) for entry_id in cached if entry_id not in listed])
+
+        return len(objects)
+
+    def find(self, kind, name):
+        """Find an object by name, the latest created one if several share it.
+
+        :param kind: kind of the objects, e.g. 'iteration_suite'
+        :param name: name of the object
+        :return: :dict: the object, None if not found
+        :rtype: dict
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body FROM entries WHERE server = ? AND kind = ? AND name = ?"
+                " ORDER BY created_at DESC LIMIT 1",
+                (self._server, kind, name)).fetchone()
+
+        if row is None:
+            return None
+        return json.loads(row[0])
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``ChartArchive`` module reading the chart ZIP saved by export_test_charts
+
+Each CSV member of the archive is a chart, a header row naming its columns,
+e.g. 'Time,Port 0,Port 1', then one row of numbers per point. Members are
+only decompressed when read, decoded charts are cached in a compressed
+side-car '<archive>.npz' so a later run skips the CSV parsing. The cache is
+written once, by read_all(), flush() or close(), not on every read.
+
+**Classes**
+
+    Chart
+    ChartArchive
+"""
+
+import io
+import json
+import logging
+import os
+import warnings
+import zipfile
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_SUFFIX = '.npz'
+# version of the cache layout, a cache of another version is ignored
+CACHE_VERSION = 1
+
+
+class Chart(object):
+    """Columns of a chart, one float64 array each, NaN where a cell is not a number.
+
+    Usage::
+
+        chart = archive.read('Throughput')
+        chart.columns            # ['Time', 'Port 0', 'Port 1']
+        chart['Port 0']          # values of a column
+        chart.values             # points x columns matrix
+
+    """
+
+    def __init__(self, name, columns, values):
+        """Create a chart.
+
+        :param name: name of the chart, its member name without '.csv'
+        :param columns: list of column names, from the header row
+        :param values: float64 array of shape (points, columns)
+        """
+
+        self.name = name
+        self.columns = list(columns)
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, column):
+        return self.values[:, self.columns.index(column)]
+
+    def __repr__(self):
+        return "<Chart %s: %d points, columns %s>" % (self.name, len(self.values), self.columns)
+
+
+class ChartArchive(object):
+    """Charts of a test export, listed from the ZIP directory and decoded one at a time.
+
+    Usage::
+
+        with ChartArchive('5bc054af421aa92b599bcbf4.zip') as archive:
+            archive.charts       # ['Latency', 'Scenario Attempts', 'Throughput', ...]
+            throughput = archive.read('Throughput')
+        # the charts decoded are cached on close
+
+    """
+
+    def __init__(self, path, cache=True):
+        """Open an archive, nothing is decompressed yet.
+
+        :param path: .zip file saved by export_test_charts
+        :param cache: read and save decoded charts in the side-car '<path>.npz'
+        """
+
+        self.path = path
+        self.cache_path = path + CACHE_SUFFIX if cache else None
+        self._zip = zipfile.ZipFile(path)
+        # chart name -> zipfile.ZipInfo
+        self._members = {}
+        for info in self._zip.infolist():
+            if not info.is_dir() and info.filename.lower().endswith('.csv'):
+                self._members[os.path.splitext(info.filename)[0]] = info
+        # chart name -> Chart, decoded in this process
+        self._charts = {}
+        self._cache = None
+        # True once a chart was decoded and not yet saved in the cache
+        self._dirty = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def __iter__(self):
+        return iter(self.charts)
+
+    def __getitem__(self, name):
+        return self.read(name)
+
+    def __repr__(self):
+        return "<ChartArchive %s: %s>" % (self.path, self.charts)
+
+    def close(self):
+        """Save the charts decoded in the cache, then close the archive and the cache."""
+
+        self.flush()
+        self._zip.close()
+        if self._cache is not None:
+            self._cache[1].close()
+            self._cache = None
+
+    @property
+    def charts(self):
+        """:list: sorted names of the charts in the archive"""
+
+        return sorted(self._members)
+
+    def info(self, name):
+        """Return :dict: member name, compressed and CSV sizes of a chart, without decoding it."""
+
+        info = self._member(name)
+        return {'member': info.filename, 'compressed_size': info.compress_size, 'size': info.file_size}
+
+    def _member(self, name):
+        try:
+            return self._members[name]
+        except KeyError:
+            raise KeyError("no chart %s in %s" % (name, self.path))
+
+    def read(self, name):
+        """Return :Chart: a chart, from memory, the cache or decoded from its CSV member.
+
+        :param name: name of the chart, e.g. 'Throughput'
+        :rtype: Chart
+        """
+
+        chart, decoded = self._read(name)
+        self._dirty = self._dirty or decoded
+        return chart
+
+    def read_all(self):
+        """Return :dict: name -> Chart of every chart, the cache is saved once."""
+
+        charts = {}
+        for name in self.charts:
+            charts[name], decoded = self._read(name)
+            self._dirty = self._dirty or decoded
+        self.flush()
+        return charts
+
+    def flush(self):
+        """Save the charts decoded since the last flush in the cache, one write for all of them."""
+
+        if self._dirty:
+            self._save_cache()
+            self._dirty = False
+
+    def _read(self, name):
+        """Return :tuple: (Chart, True if it was decoded from its CSV member)."""
+
+        if name in self._charts:
+            return self._charts[name], False
+
+        info = self._member(name)
+        chart = self._from_cache(name, info)
+        decoded = chart is None
+        if decoded:
+            chart = self._decode(name, info)
+        self._charts[name] = chart
+        return chart, decoded
+
+    def _decode(self, name, info):
+        """Stream a CSV member through the numpy parser, a line at a time if it has non numbers."""
+
+        with self._zip.open(info) as raw:
+            stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            header = stream.readline()
+            columns = [column.strip() for column in header.strip().split(',')]
+            try:
+                with warnings.catch_warnings():
+                    # a chart without points is fine
+                    warnings.simplefilter('ignore', UserWarning)
+                    values = np.loadtxt(stream, delimiter=',', dtype='f8', ndmin=2)
+            except ValueError:
+                values = None
+
+        if values is None:
+            values = self._decode_lines(info, len(columns))
+        elif values.size == 0:
+            values = np.empty((0, len(columns)))
+        if values.shape[1] != len(columns):
+            raise ValueError("chart %s of %s has %d columns for %d names" % (
+                name, self.path, values.shape[1], len(columns)))
+
+        LOGGER.debug("decoded chart %s of %s, %d points", name, self.path, len(values))
+        return Chart(name, columns, values)
+
+    def _decode_lines(self, info, width):
+        rows = []
+        with self._zip.open(info) as raw:
+            stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            stream.readline()
+            for line in stream:
+                if not line.strip():
+                    continue
+                cells = line.rstrip('\r\n').split(',')
+                cells += [''] * (width - len(cells))
+                rows.append([_to_float(cell) for cell in cells[:width]])
+
+        return np.array(rows, dtype='f8').reshape(len(rows), width)
+
+    def _open_cache(self):
+        """Return :tuple: (meta, NpzFile) of the cache, arrays are read on access, None if none."""
+
+        if self._cache is None and self.cache_path and os.path.exists(self.cache_path):
+            try:
+                npz = np.load(self.cache_path, allow_pickle=False)
+                meta = json.loads(str(npz['meta']))
+                if meta.get('version') != CACHE_VERSION:
+                    npz.close()
+                    return None
+                self._cache = (meta, npz)
+            except (OSError, ValueError, KeyError) as e:
+                LOGGER.warning("ignore the chart cache %s: %s", self.cache_path, e)
+                return None
+
+        return self._cache
+
+    def _from_cache(self, name, info):
+        cache = self._open_cache()
+        if cache is None:
+            return None
+
+        meta, npz = cache
+        entry = meta['charts'].get(name)
+        # the member is matched by its CRC, a new export of the test invalidates it
+        if entry is None or entry['crc'] != info.CRC or entry['size'] != info.file_size:
+            return None
+        return Chart(name, entry['columns'], npz[entry['key']])
+
+    def _save_cache(self):
+        """Save the charts decoded so far along with the cached ones, the charts are usable if it cannot."""
+
+        if not self.cache_path:
+            return
+
+        # chart name -> (entry, values)
+        charts = {}
+        cache = self._open_cache()
+        if cache is not None:
+            meta, npz = cache
+            for name, entry in meta['charts'].items():
+                if name in self._members and name not in self._charts and entry['crc'] == self._members[name].CRC:
+                    charts[name] = (entry, npz[entry['key']])
+        for name, chart in self._charts.items():
+            info = self._members[name]
+            charts[name] = ({'columns': chart.columns, 'crc': info.CRC, 'size': info.file_size}, chart.values)
+
+        arrays = {}
+        for i, name in enumerate(sorted(charts)):
+            entry, values = charts[name]
+            entry['key'] = 'chart_%d' % i
+            arrays[entry['key']] = values
+        meta = {'version': CACHE_VERSION, 'charts': dict((name, entry) for name, (entry, _) in charts.items())}
+
+        part = self.cache_path + '.part'
+        try:
+            with open(part, 'wb') as p:
+                np.savez_compressed(p, meta=np.array(json.dumps(meta)), **arrays)
+            if self._cache is not None:
+                self._cache[1].close()
+                self._cache = None
+            os.replace(part, self.cache_path)
+        except OSError as e:
+            LOGGER.warning("unable to save the chart cache %s: %s", self.cache_path, e)
+
+
+def _to_float(cell):
+    try:
+        return float(cell)
+    except ValueError:
+        return np.nan
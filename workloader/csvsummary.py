@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``PortSummary`` module reading port summaries in the CSV layout of the benchmarks fake server
+
+This is not the format of an appliance: the .sum files it saves are binary,
+their layout is not published, and they are not read here. The CSV layout is
+the one benchmarks/fakeserver.py serves: one record per line after a
+'Time,Action,Metric,Value' header, itself after '#' comment lines holding
+key=value pairs, e.g. '# test_id=.. port=0'. Columns
+are found by their header name, so extra or reordered columns are fine.
+Lines which do not parse, or a last line without its newline as left by a
+truncated download, are counted and skipped. A binary file, e.g. the .sum of
+an appliance, or a text one whose first line after the comments is not that
+header, raises ValueError.
+
+**Classes**
+
+    PortSummary
+
+**Functions**
+
+    read_summary
+    read_summaries
+    find_summaries
+"""
+
+import array
+import logging
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+# one record of a summary file, up to 2**32 action and metric names
+RECORD_DTYPE = np.dtype([('time', 'f8'), ('action', 'u4'), ('metric', 'u4'), ('value', 'f8')])
+# <test_id>_port_<port>.sum, as named by save_test_result
+SUMMARY_FILE = re.compile(r'^(?P<test_id>.+)_port_(?P<port>\d+)\.sum$')
+COLUMNS = ('time', 'action', 'metric', 'value')
+# bytes at the start of a file checked for binary content
+SNIFF_SIZE = 4096
+# characters of text parsed at a time
+CHUNK_SIZE = 256 * 1024
+# longest action or metric name parsed in bulk, longer ones a line at a time
+NAME_CHARS = 32
+_TEXT_DTYPE = np.dtype([('time', 'f8'), ('action', 'U%d' % NAME_CHARS), ('metric', 'U%d' % NAME_CHARS),
+                        ('value', 'f8')])
+
+
+class PortSummary(object):
+    """Records of a port summary, indexed by action and metric.
+
+    Records are kept in one structured array sorted by (action, metric, time),
+    so the series of an action metric is a slice found in O(1).
+
+    Usage::
+
+        summary = read_summary('5bc054af421aa92b599bcbf4_port_0.sum')
+        times, values = summary.series('READ', 'attempts')
+        summary.final('fails')['WRITE']
+
+    """
+
+    def __init__(self, records, actions, metrics, meta=None, skipped=0, path=None):
+        """Create a summary.
+
+        :param records: structured array of RECORD_DTYPE, action and metric are indexes
+        :param actions: list of action names
+        :param metrics: list of metric names
+        :param meta: dict of the key=value pairs of the comment lines
+        :param skipped: number of lines which did not parse
+        :param path: file the summary was read from
+        """
+
+        self.actions = list(actions)
+        self.metrics = list(metrics)
+        self.meta = dict(meta or {})
+        self.skipped = skipped
+        self.path = path
+
+        keys = records['action'].astype(np.int64) * max(1, len(self.metrics)) + records['metric']
+        order = np.lexsort((records['time'], keys))
+        self.records = records[order]
+        # key -> [start, end) of its records
+        keys = keys[order]
+        self._bounds = np.searchsorted(keys, np.arange(len(self.actions) * len(self.metrics) + 1))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return "<PortSummary %s: %d records, %d actions, %d metrics>" % (
+            self.path, len(self.records), len(self.actions), len(self.metrics))
+
+    @property
+    def test_id(self):
+        return self.meta.get('test_id')
+
+    @property
+    def port(self):
+        port = self.meta.get('port')
+        return int(port) if port is not None and port.isdigit() else port
+
+    def _slice(self, action, metric):
+        try:
+            key = self.actions.index(action) * len(self.metrics) + self.metrics.index(metric)
+        except ValueError:
+            raise KeyError("no %s %s in %s" % (action, metric, self.path))
+        return self.records[self._bounds[key]:self._bounds[key + 1]]
+
+    def series(self, action, metric):
+        """Return :tuple: (times, values) float64 arrays of an action metric, by time.
+
+        :param action: action name, e.g. 'READ'
+        :param metric: metric name, e.g. 'attempts'
+        """
+
+        records = self._slice(action, metric)
+        return records['time'], records['value']
+
+    def final(self, metric):
+        """Return :dict: action -> last value of a metric, NaN for an action without it.
+
+        :param metric: metric name, e.g. 'attempts'
+        """
+
+        result = {}
+        for action in self.actions:
+            records = self._slice(action, metric)
+            result[action] = float(records['value'][-1]) if len(records) else np.nan
+        return result
+
+    def table(self, metric):
+        """Return :tuple: (times, matrix) of a metric, one column per action, NaN where missing.
+
+        :param metric: metric name, e.g. 'attempts'
+        """
+
+        if metric not in self.metrics:
+            raise KeyError("no %s in %s" % (metric, self.path))
+        records = self.records[self.records['metric'] == self.metrics.index(metric)]
+        times, rows = np.unique(records['time'], return_inverse=True)
+        matrix = np.full((len(times), len(self.actions)), np.nan)
+        matrix[rows, records['action']] = records['value']
+        return times, matrix
+
+
+class _Reader(object):
+    """Parses the lines of a summary file a chunk at a time into typed arrays."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        # indexes of the COLUMNS and number of fields of a line
+        self.columns = None
+        self.width = None
+        # name -> index, in order of appearance
+        self.actions = {}
+        self.metrics = {}
+        # one (times, actions, metrics, values) tuple of arrays per chunk
+        self.chunks = []
+        self.skipped = 0
+
+    def _ids(self, names, index):
+        for name in dict.fromkeys(names):
+            if name not in index:
+                index[name] = len(index)
+        return np.fromiter(map(index.__getitem__, names), dtype='u4', count=len(names))
+
+    def _column_ids(self, column, index):
+        """Map a column of names to their indexes, compared in bulk, None if a name needs stripping."""
+
+        ids = np.full(len(column), -1, dtype='i8')
+        for name, i in index.items():
+            ids[column == name] = i
+        # one more comparison per new name
+        unknown = np.flatnonzero(ids < 0)
+        while len(unknown):
+            name = str(column[unknown[0]])
+            if name != name.strip() or not name:
+                return None
+            index[name] = len(index)
+            ids[column == name] = index[name]
+            unknown = unknown[ids[unknown] < 0]
+        return ids.astype('u4')
+
+    def _fast(self, lines):
+        """Parse a chunk of well formed records with the numpy parser, False if it is not one."""
+
+        if lines[0].startswith('#') or '\n#' in ''.join(lines):
+            return False
+        try:
+            records = np.loadtxt(lines, delimiter=',', dtype=_TEXT_DTYPE, usecols=self.columns, ndmin=1)
+        except ValueError:
+            return False
+
+        # a name as long as the field may be cut
+        for column in ('action', 'metric'):
+            if len(records) and np.char.str_len(records[column]).max() >= NAME_CHARS:
+                return False
+        actions = self._column_ids(records['action'], self.actions)
+        metrics = self._column_ids(records['metric'], self.metrics)
+        if actions is None or metrics is None:
+            return False
+
+        self.chunks.append((records['time'], actions, metrics, records['value']))
+        return True
+
+    def _slow(self, lines):
+        """Parse a chunk a line at a time, comments and bad lines included."""
+
+        times = array.array('d')
+        actions = []
+        metrics = []
+        values = array.array('d')
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                for pair in line.lstrip('#').split():
+                    if '=' in pair:
+                        key, value = pair.split('=', 1)
+                        self.meta[key] = value
+                continue
+
+            fields = line.split(',')
+            if self.columns is None:
+                header = [field.strip().lower() for field in fields]
+                if not all(name in header for name in COLUMNS):
+                    raise ValueError("%s: %r is not a %s header" % (self.path, line[:80], ','.join(COLUMNS)))
+                self.columns = [header.index(name) for name in COLUMNS]
+                self.width = len(header)
+                continue
+
+            if len(fields) < max(self.columns) + 1:
+                self.skipped += 1
+                continue
+            try:
+                time_value = float(fields[self.columns[0]])
+                value = float(fields[self.columns[3]])
+            except ValueError:
+                self.skipped += 1
+                continue
+            times.append(time_value)
+            values.append(value)
+            actions.append(fields[self.columns[1]].strip())
+            metrics.append(fields[self.columns[2]].strip())
+
+        self.chunks.append((np.frombuffer(times, dtype='f8'), self._ids(actions, self.actions),
+                            self._ids(metrics, self.metrics), np.frombuffer(values, dtype='f8')))
+
+    def feed(self, lines):
+        if self.columns is None:
+            # comments and header a line at a time, the records after them in bulk
+            header = next((i for i, line in enumerate(lines) if line.strip() and not line.startswith('#')), None)
+            if header is None:
+                self._slow(lines)
+                return
+            self._slow(lines[:header + 1])
+            lines = lines[header + 1:]
+        if lines and not self._fast(lines):
+            self._slow(lines)
+
+    def summary(self):
+        if self.columns is None:
+            raise ValueError("%s has no %s header" % (self.path, ','.join(COLUMNS)))
+        if self.skipped:
+            LOGGER.warning("skipped %d lines of %s", self.skipped, self.path)
+
+        size = sum(len(chunk[0]) for chunk in self.chunks)
+        records = np.empty(size, dtype=RECORD_DTYPE)
+        for i, name in enumerate(RECORD_DTYPE.names):
+            if size:
+                records[name] = np.concatenate([chunk[i] for chunk in self.chunks])
+
+        return PortSummary(records, list(self.actions), list(self.metrics), self.meta, self.skipped, self.path)
+
+
+def read_summary(path, encoding='utf-8', chunk_size=CHUNK_SIZE):
+    """Stream a summary file into typed arrays, a chunk of lines at a time.
+
+    Memory is the records, 24 bytes each, plus one chunk of text. Chunks of
+    well formed records are parsed column wise, others a line at a time.
+    Only the CSV layout of the module docstring is read, not the binary
+    summaries of an appliance.
+
+    :param path: .sum file in the CSV layout
+    :param encoding: encoding of the file
+    :param chunk_size: characters of text read at a time
+    :return: :PortSummary: records of the file
+    :rtype: PortSummary
+    """
+
+    meta = {}
+    match = SUMMARY_FILE.match(os.path.basename(path))
+    if match:
+        meta.update(match.groupdict())
+
+    with open(path, 'rb') as p:
+        if b'\0' in p.read(SNIFF_SIZE):
+            raise ValueError("%s is a binary summary, as saved from an appliance, only the CSV layout is read" % path)
+
+    reader = _Reader(path, meta)
+    with open(path, 'r', encoding=encoding, errors='replace', newline=None) as p:
+        while True:
+            lines = p.readlines(chunk_size)
+            if not lines:
+                break
+            # a last line without its newline is a truncated file
+            if not lines[-1].endswith('\n'):
+                reader.skipped += bool(lines.pop().strip())
+                if not lines:
+                    break
+            reader.feed(lines)
+
+    return reader.summary()
+
+
+def _read(path):
+    try:
+        return path, read_summary(path), None
+    except (OSError, ValueError) as e:
+        return path, None, str(e)
+
+
+def find_summaries(path):
+    """Return :list: sorted .sum files of a directory tree, e.g. the path given to save_all_test_results.
+
+    :param path: directory, or a single .sum file
+    """
+
+    if os.path.isfile(path):
+        return [path]
+
+    found = []
+    for root, _, files in os.walk(path):
+        found.extend(os.path.join(root, name) for name in files if name.endswith('.sum'))
+    return sorted(found)
+
+
+def _collect(results):
+    summaries = {}
+    for path, summary, error in results:
+        if error is not None:
+            LOGGER.error("failed reading %s: %s", path, error)
+        summaries[path] = summary
+    return summaries
+
+
+def read_summaries(paths, workers=None, chunksize=4):
+    """Read many summary files on a process pool, e.g. all the tests of a nightly run.
+
+    A file which cannot be read is logged and mapped to None.
+
+    :param paths: .sum files or directories holding them
+    :param workers: number of processes, os.cpu_count() if None, 1 to read in this process
+    :param chunksize: files sent to a process at a time
+    :return: :dict: path -> PortSummary, in order of the paths
+    :rtype: dict
+    """
+
+    files = []
+    for path in paths:
+        files.extend(find_summaries(path))
+
+    if workers == 1 or len(files) <= 1:
+        results = map(_read, files)
+        return _collect(results)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return _collect(executor.map(_read, files, chunksize=chunksize))
+
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""Module running CLI commands in a long lived process over a Unix socket
+
+A client sends one JSON line {"argv", "cwd", "level"} and receives JSON
+lines {"log": formatted record} followed by {"exit": status}.
+
+**Classes**
+
+    WorkloaderDaemon
+
+**Functions**
+
+    forward
+    merge_contexts
+"""
+
+import contextvars
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.workloader', 'workloader.sock')
+
+# (level, send) of the requests the log records of a context go to
+_routes = contextvars.ContextVar('workloader_log_routes', default=())
+
+
+def merge_contexts(contexts):
+    """Return a copy of the first context, its log records sent to the requests of all contexts.
+
+    E.g. the poll of a test several requests wait for, see monitor.SharedTestMonitor.
+
+    :param contexts: list of contextvars.Context
+    :return: :contextvars.Context: new context
+    :rtype: contextvars.Context
+    """
+
+    routes = []
+    for context in contexts:
+        routes.extend(route for route in context.get(_routes, ()) if route not in routes)
+
+    merged = contexts[0].copy()
+    merged.run(_routes.set, tuple(routes))
+    return merged
+
+
+class _RequestLogHandler(logging.Handler):
+    """Sends log records to the clients of the running requests.
+
+    A record goes to the request of the context emitting it, the request thread
+    sets it and util.ContextThreadPoolExecutor carries it into the pools doing
+    the work. Records of no request, e.g. of the daemon itself, are not sent.
+
+    """
+
+    def add(self, level, send):
+        """Send the records of the current context to a request. Returns the token to remove() it."""
+
+        return _routes.set(((level, send),))
+
+    def remove(self, token):
+        _routes.reset(token)
+
+    def emit(self, record):
+        line = None
+        for level, send in _routes.get():
+            if record.levelno < level:
+                continue
+            if line is None:
+                line = self.format(record)
+            try:
+                send({'log': line})
+            except OSError:
+                pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        daemon = self.server.daemon
+        write_lock = threading.Lock()
+
+        def send(message):
+            with write_lock:
+                self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+        except ValueError:
+            send({'exit': 2, 'error': 'invalid request'})
+            return
+
+        token = daemon.log_handler.add(logging.getLevelName(request.get('level', 'INFO')), send)
+        status = 0
+        try:
+            status = daemon.dispatch(request['argv'], request.get('cwd', '/')) or 0
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            LOGGER.exception("request %s failed", request['argv'][-1:])
+            status = 1
+        finally:
+            daemon.log_handler.remove(token)
+
+        try:
+            send({'exit': status})
+        except OSError:
+            LOGGER.debug("client left before the end of its request")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class WorkloaderDaemon(object):
+    """Serves CLI commands over a Unix socket, each one in its own thread.
+
+    The process keeps whatever ``dispatch`` caches between commands, e.g.
+    pooled sessions, name indexes and the appliance port inventory.
+
+    """
+
+    def __init__(self, dispatch, path=DEFAULT_SOCKET, formatter=None):
+        """Create a daemon.
+
+        :param dispatch: callable(argv, cwd) running a command, returns its exit status
+        :param path: file of the Unix socket
+        :param formatter: logging.Formatter of the records sent to the clients
+        """
+
+        self.dispatch = dispatch
+        self._path = path
+        self.log_handler = _RequestLogHandler()
+        if formatter is not None:
+            self.log_handler.setFormatter(formatter)
+        self._server = None
+
+    def serve_forever(self):
+        """Listen on the socket until shutdown() or a KeyboardInterrupt."""
+
+        directory = os.path.dirname(self._path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        if os.path.exists(self._path):
+            if _connect(self._path) is not None:
+                raise RuntimeError("a daemon is already listening on %s" % self._path)
+            os.remove(self._path)
+
+        old_umask = os.umask(0o077)
+        try:
+            self._server = _Server(self._path, _Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon = self
+
+        # a client may ask for more than the daemon logs itself, log_handler filters by its level
+        root = logging.getLogger()
+        root_level = root.level
+        root.setLevel(logging.DEBUG)
+        root.addHandler(self.log_handler)
+        LOGGER.info("serving on %s", self._path)
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            LOGGER.info("interrupted")
+        finally:
+            root.removeHandler(self.log_handler)
+            root.setLevel(root_level)
+            self._server.server_close()
+            if os.path.exists(self._path):
+                os.remove(self._path)
+
+    def shutdown(self):
+        """Stop serve_forever() from another thread."""
+
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def _connect(path):
+    """Return :socket: connected to the daemon, None if no daemon is listening."""
+
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    return sock
+
+
+def forward(argv, path=DEFAULT_SOCKET, level='INFO', out=None):
+    """Run a command in the daemon if one is listening.
+
+    :param argv: command line arguments, without the program name
+    :param path: file of the Unix socket
+    :param level: lowest level of the log records to receive
+    :param out: file the received records are written to, stderr if None
+    :return: :int: exit status of the command, None if no daemon is listening
+    :rtype: int
+    """
+
+    sock = _connect(path)
+    if sock is None:
+        return None
+
+    out = out or sys.stderr
+    with sock, sock.makefile('rwb') as stream:
+        stream.write((json.dumps({'argv': argv, 'cwd': os.getcwd(), 'level': level}) + '\n').encode('utf-8'))
+        stream.flush()
+
+        for line in stream:
+            message = json.loads(line.decode('utf-8'))
+            if 'log' in message:
+                out.write(message['log'] + '\n')
+                out.flush()
+            elif 'exit' in message:
+                return message['exit']
+
+    raise RuntimeError("daemon on %s closed the connection" % path)
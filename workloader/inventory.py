@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``PortInventory`` module keeping a short lived snapshot of appliance ports
+
+**Classes**
+
+    PortInventory
+"""
+
+import logging
+import threading
+import time
+
+from workloader.util import ContextThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+
+def testbed_ports(testbed):
+    """Ports used by a testbed.
+
+    :param testbed: testbed JSON object
+    :return: :list: (appliance_id, port_id) of each client
+    :rtype: list
+    """
+
+    return [(client['appliance_id'], client['port']) for client in testbed['clients']]
+
+
+class PortInventory(object):
+    """A (appliance_id, port_id) -> port map, each appliance fetched once per window.
+
+    Any number of port queries within ``max_age`` seconds share one download
+    of each appliance involved, stale appliances are fetched concurrently.
+
+    """
+
+    PORT_STATUS_IDLE = 'idle'
+    # seconds a fetched appliance is trusted, port states change quickly
+    DEFAULT_MAX_AGE = 5
+
+    def __init__(self, ww, max_age=DEFAULT_MAX_AGE, workers=8):
+        """Create an inventory.
+
+        :param ww: WorkloadWisdom to fetch the appliances from
+        :param max_age: seconds a fetched appliance is trusted
+        :param workers: max number of concurrent fetches
+        """
+
+        self._ww = ww
+        self._max_age = max_age
+        self._workers = workers
+        # (appliance_id, port_id) -> port JSON, appliance_id -> time of fetch
+        self._ports = {}
+        self._fetched_at = {}
+        self._lock = threading.Lock()
+
+    def update(self, appliance):
+        """Take in the ports of an appliance fetched elsewhere.
+
+        :param appliance: appliance JSON object
+        """
+
+        with self._lock:
+            self._update(appliance)
+
+    def _update(self, appliance):
+        for key in [key for key in self._ports if key[0] == appliance['id']]:
+            del self._ports[key]
+        for port in appliance.get('ports') or []:
+            self._ports[(appliance['id'], port['port_id'])] = port
+        self._fetched_at[appliance['id']] = time.time()
+
+    def refresh(self, appliance_ids, force=False):
+        """Fetch the appliances older than the freshness window, concurrently.
+
+        :param appliance_ids: ids of the appliances
+        :param force: fetch even the fresh ones
+        """
+
+        with self._lock:
+            now = time.time()
+            stale = sorted(set(appliance_id for appliance_id in appliance_ids
+                               if force or now - self._fetched_at.get(appliance_id, 0) >= self._max_age))
+            if not stale:
+                return
+
+            LOGGER.debug("fetch ports of %d appliances", len(stale))
+            with ContextThreadPoolExecutor(max_workers=min(self._workers, len(stale))) as executor:
+                for appliance in executor.map(self._ww.get_appliance, stale):
+                    self._update(appliance)
+
+    def invalidate(self, appliance_ids=None):
+        """Forget appliances, or all of them, to fetch them on next query.
+
+        :param appliance_ids: ids of the appliances, all if None
+        """
+
+        with self._lock:
+            if appliance_ids is None:
+                self._fetched_at.clear()
+            else:
+                for appliance_id in appliance_ids:
+                    self._fetched_at.pop(appliance_id, None)
+
+    def snapshot(self, ports):
+        """Current state of some ports.
+
+        :param ports: list of (appliance_id, port_id)
+        :return: :dict: (appliance_id, port_id) -> port JSON, None if the appliance has no such port
+        :rtype: dict
+        """
+
+        ports = list(ports)
+        self.refresh(appliance_id for appliance_id, _ in ports)
+        with self._lock:
+            return dict((key, self._ports.get(key)) for key in ports)
+
+    def state(self, appliance_id, port_id):
+        """State of a port.
+
+        :param appliance_id: id of the appliance
+        :param port_id: id of the port
+        :return: :str: status of the port, 'idle', 'running'
+        :rtype: str
+        """
+
+        port = self.snapshot([(appliance_id, port_id)])[(appliance_id, port_id)]
+        if port is None:
+            raise ValueError('invalid port_id')
+
+        return port['state']
+
+    def busy(self, ports):
+        """Ports which are not idle.
+
+        :param ports: list of (appliance_id, port_id)
+        :return: :dict: (appliance_id, port_id) -> port JSON of each port not idle, None if unknown
+        :rtype: dict
+        """
+
+        return dict((key, port) for key, port in self.snapshot(ports).items()
+                    if port is None or port['state'] != self.PORT_STATUS_IDLE)
+
+    def all_idle(self, ports):
+        """Tell if all ports are idle.
+
+        :param ports: list of (appliance_id, port_id)
+        :return: :bool: True if all ports are idle
+        :rtype: bool
+        """
+
+        return not self.busy(ports)
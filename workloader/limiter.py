@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``HostLimiter`` module pacing the requests sent to each host
+
+**Classes**
+
+    TokenBucket
+    AimdLimiter
+    HostLimiter
+"""
+
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """Allows ``rate`` requests per second on average, bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        """Create a bucket, full.
+
+        :param rate: tokens added per second
+        :param burst: max number of tokens, rate if None
+        """
+
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.throttle_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def acquire(self):
+        """Take a token, waiting for one if the bucket is empty.
+
+        :return: :float: seconds waited
+        :rtype: float
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if waited:
+                        self.throttled += 1
+                        self.throttle_wait += waited
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AimdLimiter(object):
+    """Concurrency limit raised by one per round of good responses, halved on trouble.
+
+    A response is trouble when it is an error (5xx, 429 or no response) or,
+    if ``latency_target`` is set, slower than it. The limit is cut at most
+    once per ``cooldown`` seconds, so one burst of slow responses counts once.
+
+    The latency of a response grows with its size, e.g. a results ZIP or a
+    full project listing, so a target only fits clients sending small
+    control calls. Pick it from the latency these calls show on a healthy
+    server, e.g. 3 to 5 times the p95 of metrics.summary(), slower ones then
+    mean an overloaded server rather than a big response.
+
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, latency_target=None, decrease=0.5, cooldown=1.0):
+        """Create a limiter.
+
+        :param initial: starting number of requests in flight
+        :param minimum: lowest limit
+        :param maximum: highest limit, initial if None
+        :param latency_target: seconds, slower responses shrink the limit, None to react to errors only
+        :param decrease: factor applied to the limit on trouble
+        :param cooldown: seconds between two cuts of the limit
+        """
+
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(max(minimum, min(initial, self.maximum)))
+        self.in_flight = 0
+        self.latency = None
+        self.errors = 0
+        self.slow = 0
+        self.waits = 0
+        self._cut_at = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot under the current limit.
+
+        :return: :bool: True if the limit was reached and the caller waited
+        :rtype: bool
+        """
+
+        with self._cond:
+            full = self.in_flight >= int(self.limit)
+            if full:
+                self.waits += 1
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+        return full
+
+    def release(self, latency, error=False):
+        """Free a slot and adjust the limit.
+
+        :param latency: seconds the request took
+        :param error: True if the response was an error
+        """
+
+        with self._cond:
+            self.in_flight -= 1
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+            slow = self.latency_target is not None and latency > self.latency_target
+            if error or slow:
+                self.errors += bool(error)
+                self.slow += slow
+                now = time.monotonic()
+                if now - self._cut_at >= self.cooldown:
+                    self._cut_at = now
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    LOGGER.debug("concurrency limit cut to %d, latency %.3f, error %s", self.limit, latency, error)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self._cond.notify_all()
+
+
+class HostLimiter(object):
+    """Token bucket rate and AIMD concurrency per host, shared by all threads.
+
+    Usage::
+
+        with limiter.slot('10.0.0.1') as slot:
+            resp = session.get(url)
+            slot['error'] = resp.status_code >= 500
+
+    """
+
+    def __init__(self, rate=None, burst=None, concurrency=10, min_concurrency=1, latency_target=None):
+        """Create a limiter.
+
+        :param rate: max requests per second per host, None for no rate limit
+        :param burst: requests allowed at once above the rate, rate if None
+        :param concurrency: max requests in flight per host, also the starting limit
+        :param min_concurrency: lowest limit of requests in flight per host
+        :param latency_target: seconds, slower responses lower the concurrency, None to react to errors only,
+            see AimdLimiter for how to pick it
+        """
+
+        self._rate = rate
+        self._burst = burst
+        self._concurrency = concurrency
+        self._min_concurrency = min_concurrency
+        self._latency_target = latency_target
+        self._hosts = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def _get(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                bucket = TokenBucket(self._rate, self._burst) if self._rate else None
+                aimd = AimdLimiter(self._concurrency, minimum=self._min_concurrency,
+                                   latency_target=self._latency_target)
+                self._hosts[host] = (bucket, aimd)
+                self._requests[host] = 0
+            self._requests[host] += 1
+            return self._hosts[host]
+
+    @contextmanager
+    def slot(self, host):
+        """Hold a request slot of a host, waiting for the rate and concurrency limits.
+
+        Yields a dict, set its 'error' to True if the response is an error, an
+        exception raised in the block counts as one. Its 'throttle_wait' holds
+        the seconds waited for the limits.
+
+        :param host: host name, e.g. '10.228.56.32:80'
+        """
+
+        bucket, aimd = self._get(host)
+        waited = bucket.acquire() if bucket is not None else 0.0
+        queued_at = time.monotonic()
+        if aimd.acquire():
+            waited += time.monotonic() - queued_at
+
+        outcome = {'error': False, 'throttle_wait': waited}
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception:
+            outcome['error'] = True
+            raise
+        finally:
+            aimd.release(time.monotonic() - start, outcome['error'])
+
+    def state(self):
+        """Current state of each host, e.g. to export as metrics.
+
+        :return: :dict: host -> dict of the limiter values
+        :rtype: dict
+        """
+
+        with self._lock:
+            hosts = dict(self._hosts)
+            requests = dict(self._requests)
+
+        state = {}
+        for host, (bucket, aimd) in hosts.items():
+            state[host] = {
+                'requests': requests[host],
+                'rate': bucket.rate if bucket else None,
+                'tokens': round(bucket.tokens, 3) if bucket else None,
+                'throttled': bucket.throttled if bucket else 0,
+                'throttle_wait': round(bucket.throttle_wait, 3) if bucket else 0.0,
+                'concurrency_limit': int(aimd.limit),
+                'in_flight': aimd.in_flight,
+                'concurrency_waits': aimd.waits,
+                'latency': round(aimd.latency, 4) if aimd.latency is not None else None,
+                'errors': aimd.errors,
+                'slow': aimd.slow,
+            }
+
+        return state
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``RequestMetrics`` module recording the REST requests per endpoint
+
+Requests are grouped by method and endpoint template, the path of the url
+with its ids replaced by ':id', e.g. 'GET /api/tests/:id/stats/ports/:id'.
+
+**Classes**
+
+    RequestMetrics
+
+**Functions**
+
+    endpoint_template
+"""
+
+import functools
+import json
+import logging
+import re
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+LOGGER = logging.getLogger(__name__)
+
+# upper bounds in seconds of the latency histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# numbers, hex object ids and uuids, a hex id has at least one digit so words are kept
+_ID_SEGMENT = re.compile(r'^(?:\d+|(?=[a-z]*\d)[0-9a-f]{8,}|[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12})$',
+                         re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=4096)
+def endpoint_template(url):
+    """Return :str: path of a url with the ids replaced by ':id', query left out.
+
+    :param url: full url or path, e.g. 'http://10.0.0.1/api/tests/5a1b2c3d4e5f6a7b8c9d0e1f/logs'
+    :rtype: str
+    """
+
+    path = urlsplit(url).path or '/'
+    return '/'.join(':id' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/'))
+
+
+class _Endpoint(object):
+
+    __slots__ = ('requests', 'errors', 'statuses', 'bytes', 'retries', 'throttled', 'throttle_wait',
+                 'seconds', 'max', 'buckets')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        # status code -> count, 'none' when no response came
+        self.statuses = {}
+        self.bytes = 0
+        self.retries = 0
+        self.throttled = 0
+        self.throttle_wait = 0.0
+        self.seconds = 0.0
+        self.max = 0.0
+        # one count per LATENCY_BUCKETS bound plus +Inf, not cumulative
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def quantile(self, q):
+        """Estimate a latency quantile from the histogram, linear within a bucket."""
+
+        timed = sum(self.buckets)
+        if not timed:
+            return None
+
+        rank = q * timed
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+class RequestMetrics(object):
+    """Latency histogram, request, error, byte, retry and throttle counts per endpoint.
+
+    Shared by all threads of a client, each request costs one lock and a
+    few additions.
+
+    Usage::
+
+        metrics = RequestMetrics()
+        transport = Transport(username, password, metrics=metrics)
+        ...
+        metrics.dump('workloader.prom')
+
+    """
+
+    def __init__(self):
+        # (method, template) -> _Endpoint
+        self._endpoints = {}
+        self._started_at = time.time()
+        self._lock = threading.Lock()
+
+    def _get(self, method, url):
+        key = (method.upper(), endpoint_template(url))
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = self._endpoints[key] = _Endpoint()
+        return endpoint
+
+    def observe(self, method, url, seconds, status=None, size=0, throttle_wait=0.0):
+        """Record an attempt of a request.
+
+        :param method: HTTP method, e.g. 'GET'
+        :param url: url of the request, ids are normalized out
+        :param seconds: time to the response, None if the request was never sent
+        :param status: HTTP status code, None if no response came
+        :param size: bytes of the response body
+        :param throttle_wait: seconds waited for the rate and concurrency limits before sending
+        """
+
+        with self._lock:
+            endpoint = self._get(method, url)
+            endpoint.requests += 1
+            endpoint.bytes += size
+            key = status if status is not None else 'none'
+            endpoint.statuses[key] = endpoint.statuses.get(key, 0) + 1
+            if status is None or status >= 400:
+                endpoint.errors += 1
+            if throttle_wait > 0:
+                endpoint.throttled += 1
+                endpoint.throttle_wait += throttle_wait
+            if seconds is not None:
+                endpoint.seconds += seconds
+                endpoint.max = max(endpoint.max, seconds)
+                i = 0
+                while i < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[i]:
+                    i += 1
+                endpoint.buckets[i] += 1
+
+    def retry(self, method, url):
+        """Record the retry of a failed attempt."""
+
+        with self._lock:
+            self._get(method, url).retries += 1
+
+    def reset(self):
+        """Forget all the recorded requests."""
+
+        with self._lock:
+            self._endpoints = {}
+            self._started_at = time.time()
+
+    def snapshot(self):
+        """Return the recorded values per endpoint.
+
+        :return: :dict: 'started_at', 'endpoints' list of method, endpoint, requests, errors,
+            statuses, bytes, retries, throttled, throttle_wait, seconds, max, p50, p99, buckets
+        :rtype: dict
+        """
+
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+        endpoints = []
+        with self._lock:
+            for (method, template), endpoint in sorted(self._endpoints.items(), key=lambda item: item[0]):
+                p50 = endpoint.quantile(0.5)
+                p99 = endpoint.quantile(0.99)
+                endpoints.append({
+                    'method': method,
+                    'endpoint': template,
+                    'requests': endpoint.requests,
+                    'errors': endpoint.errors,
+                    'statuses': dict((str(status), count) for status, count in endpoint.statuses.items()),
+                    'bytes': endpoint.bytes,
+                    'retries': endpoint.retries,
+                    'throttled': endpoint.throttled,
+                    'throttle_wait': round(endpoint.throttle_wait, 6),
+                    'seconds': round(endpoint.seconds, 6),
+                    'max': round(endpoint.max, 6),
+                    'p50': round(p50, 6) if p50 is not None else None,
+                    'p99': round(p99, 6) if p99 is not None else None,
+                    # upper bound -> count, not cumulative
+                    'buckets': dict(zip(bounds, endpoint.buckets)),
+                })
+            started_at = self._started_at
+
+        return {'started_at': started_at, 'endpoints': endpoints}
+
+    def to_json(self):
+        """Return :str: the snapshot as JSON."""
+
+        return json.dumps(self.snapshot(), indent=4, sort_keys=True)
+
+    def to_prometheus(self, prefix='workloader'):
+        """Return :str: the snapshot in the Prometheus text exposition format.
+
+        :param prefix: prefix of the metric names
+        """
+
+        endpoints = self.snapshot()['endpoints']
+        lines = []
+
+        def family(name, kind, description, values):
+            lines.append("# HELP %s_%s %s" % (prefix, name, description))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for labels, value in values:
+                lines.append("%s_%s{%s} %s" % (prefix, name, labels, value))
+
+        labels = [(endpoint, 'method="%s",endpoint="%s"' % (endpoint['method'], _escape(endpoint['endpoint'])))
+                  for endpoint in endpoints]
+
+        name = "%s_request_duration_seconds" % prefix
+        lines.append("# HELP %s Time to the response of a request" % name)
+        lines.append("# TYPE %s histogram" % name)
+        for endpoint, label in labels:
+            cumulative = 0
+            for bound, count in endpoint['buckets'].items():
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (name, label, bound, cumulative))
+            lines.append("%s_sum{%s} %r" % (name, label, endpoint['seconds']))
+            lines.append("%s_count{%s} %d" % (name, label, cumulative))
+
+        family('requests_total', 'counter', "Requests sent, retries included",
+               [(label, endpoint['requests']) for endpoint, label in labels])
+        family('request_errors_total', 'counter', "Requests failed with a 4xx, 5xx or no response",
+               [(label, endpoint['errors']) for endpoint, label in labels])
+        family('response_bytes_total', 'counter', "Bytes of the response bodies",
+               [(label, endpoint['bytes']) for endpoint, label in labels])
+        family('request_retries_total', 'counter', "Failed requests sent again",
+               [(label, endpoint['retries']) for endpoint, label in labels])
+        family('request_throttled_total', 'counter', "Requests held by the rate or concurrency limit",
+               [(label, endpoint['throttled']) for endpoint, label in labels])
+        family('request_throttle_seconds_total', 'counter', "Time requests were held by the limits",
+               [(label, repr(endpoint['throttle_wait'])) for endpoint, label in labels])
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, format=None):
+        """Save the snapshot to a file.
+
+        :param path: file name
+        :param format: 'json' or 'prometheus', from the extension if None: '.prom' or '.txt' for prometheus
+        """
+
+        if format is None:
+            format = 'prometheus' if path.endswith(('.prom', '.txt')) else 'json'
+        if format not in ('json', 'prometheus'):
+            raise ValueError("unknown metrics format %s" % format)
+
+        text = self.to_prometheus() if format == 'prometheus' else self.to_json()
+        with open(path, "w") as p:
+            p.write(text)
+        LOGGER.info("saved request metrics to: %s", path)
+
+    def summary(self):
+        """Return :list: lines of a table of the endpoints, slowest in total first."""
+
+        endpoints = sorted(self.snapshot()['endpoints'], key=lambda endpoint: -endpoint['seconds'])
+        lines = ["%-6s %-44s %8s %6s %7s %9s %9s %9s %9s %10s" % (
+            "method", "endpoint", "requests", "errors", "retries", "throttled", "p50 ms", "p99 ms", "max ms", "MB")]
+        for endpoint in endpoints:
+            lines.append("%-6s %-44s %8d %6d %7d %9d %9s %9s %9.1f %10.2f" % (
+                endpoint['method'], endpoint['endpoint'], endpoint['requests'], endpoint['errors'],
+                endpoint['retries'], endpoint['throttled'], _ms(endpoint['p50']), _ms(endpoint['p99']),
+                endpoint['max'] * 1000, endpoint['bytes'] / 1048576.0))
+
+        return lines
+
+
+def _ms(seconds):
+    return "%.1f" % (seconds * 1000) if seconds is not None else "-"
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``TestMonitor`` module to wait for many tests and iteration test suites at once
+
+**Classes**
+
+    TestMonitor
+    SharedTestMonitor
+    PollError
+"""
+
+import contextvars
+import logging
+import queue
+import threading
+import time
+
+import requests
+
+from workloader.stats import PortStats, log_test_stats
+from workloader.util import ContextThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PollError(RuntimeError):
+    """Raised by a wait once the other objects finished, if some could not be polled.
+
+    ``failed`` is the list of (kind, id, error message) of these objects, e.g. a
+    wrong test id answered 404.
+    """
+
+    def __init__(self, failed):
+        self.failed = list(failed)
+        RuntimeError.__init__(self, "failed polling %s" % ", ".join(
+            "%s %s: %s" % failure for failure in self.failed))
+
+
+class _Failed(object):
+    """Queued instead of an object which could not be polled."""
+
+    def __init__(self, key, message):
+        self.key = key
+        self.message = message
+
+
+def _transient(error):
+    """Return :bool: True if a failed poll is worth trying again later, e.g. the server is down or busy."""
+
+    # CircuitOpenError is a ConnectionError
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    if isinstance(error, requests.exceptions.RequestException) and response is not None:
+        return response.status_code >= 500 or response.status_code == 429
+    return False
+
+
+def _seconds(value):
+    """Return a duration in seconds as float, None if unknown."""
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TestMonitor(object):
+    """Polls tests and iteration test suites until they finish.
+
+    Each tracked object is polled on its own schedule: quickly while starting,
+    stopping or close to its planned end, slowly in the middle of a long run.
+    How quickly follows the planned duration, a one minute test is polled
+    every second near its end, a long one every few seconds. Stats of all
+    ports of a test are fetched concurrently. A failed poll is logged and
+    tried again later with a growing delay as long as the server is down or
+    busy. An object answered with a client error, e.g. a wrong id, or with a
+    malformed response MAX_FAILURES times in a row is no longer polled, the
+    wait raises PollError once the other objects finished.
+
+    Polling runs on a thread of its own, finished objects are queued for the
+    caller, so saving the results of one test does not delay the others.
+
+    Usage::
+
+        monitor = TestMonitor(ww)
+        monitor.add_test(test_id)
+        for kind, test in monitor.completed():
+            ww.save_all_test_results(test)
+
+    """
+
+    TEST = 'test'
+    ITERATION = 'iteration'
+
+    # shortest seconds between two polls of an object, whatever its duration
+    MIN_INTERVAL = 1
+    # seconds between two polls of an object in a transient state or near its end,
+    # a share of its planned duration, at most FAST_INTERVAL
+    FAST_SHARE = 1 / 60.0
+    FAST_INTERVAL = 5
+    MAX_INTERVAL = 60
+    # polls in a row failing with a client error or a malformed response before an object is given up
+    MAX_FAILURES = 3
+    # states worth polling quickly, they do not last
+    TRANSIENT_STATES = ['starting', 'waiting', 'stopping']
+
+    def __init__(self, ww, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, workers=8, recorder=None):
+        """Create a monitor.
+
+        :param ww: WorkloadWisdom to poll
+        :param min_interval: shortest seconds between two polls of an object
+        :param max_interval: longest seconds between two polls of an object
+        :param workers: max number of concurrent requests
+        :param recorder: recorder.StatsRecorder keeping every port stats sample, optional
+        """
+
+        self._ww = ww
+        self._recorder = recorder
+        self._min_interval = min_interval
+        self._max_interval = max(min_interval, max_interval)
+        self._workers = workers
+        # (kind, id) -> time of next poll
+        self._tracked = {}
+        # (kind, id) -> number of polls failed in a row
+        self._failures = {}
+        # test id -> PortStats of the previous poll
+        self._last_stats = {}
+        self._lock = threading.Lock()
+        # set to wake the poller up, e.g. when an object is added
+        self._wakeup = threading.Event()
+
+    def add_test(self, test_id):
+        """Track a test, also while completed() is running.
+
+        :param test_id: workload test id
+        """
+
+        self._add((self.TEST, test_id))
+
+    def add_iteration(self, iteration_test_suite_id):
+        """Track an iteration test suite, also while completed() is running.
+
+        :param iteration_test_suite_id: iteration test suite id
+        """
+
+        self._add((self.ITERATION, iteration_test_suite_id))
+
+    def _add(self, key):
+        with self._lock:
+            self._tracked[key] = time.monotonic()
+        self._wakeup.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tracked)
+
+    def poll_interval(self, state, remaining=None, planned=None):
+        """Seconds until next poll of an object.
+
+        :param state: state of the test or iteration test suite
+        :param remaining: planned seconds left to run, None if unknown
+        :param planned: planned duration in seconds, None if unknown
+        :return: :float: seconds
+        :rtype: float
+        """
+
+        fast = self.FAST_INTERVAL if planned is None else planned * self.FAST_SHARE
+        fast = max(self._min_interval, min(self.FAST_INTERVAL, self._max_interval, fast))
+        if state in self.TRANSIENT_STATES:
+            return fast
+        if remaining is None:
+            return self._max_interval
+
+        # check again half way to the planned end, so the end is caught quickly
+        return max(fast, min(self._max_interval, remaining / 2.0))
+
+    def retry_interval(self, failures):
+        """Seconds until next poll of an object after failed polls in a row, doubled each time.
+
+        :param failures: number of polls failed in a row
+        :rtype: float
+        """
+
+        return min(self._max_interval, self.FAST_INTERVAL * 2 ** (failures - 1))
+
+    def _poll_test(self, test_id, port_executor):
+        test = self._ww.show_test(test_id)
+        LOGGER.debug('test id %s state: %s', test['id'], test['state'])
+
+        ports = test.get('ports') or []
+        states = list(port_executor.map(lambda port: self._ww.get_test_port_state(test['id'], port['id']), ports))
+        port_ids = [port['id'] for port in ports]
+        if self._recorder is not None:
+            for port_id, resp in zip(port_ids, states):
+                self._recorder.record(test['id'], port_id, resp)
+
+        stats = PortStats.from_responses(port_ids, states)
+        log_test_stats(test, stats, self._last_stats.get(test['id']))
+        self._last_stats[test['id']] = stats
+
+        planned = _seconds(test.get('duration_planned'))
+        actual = _seconds(test.get('duration_actual'))
+        remaining = planned - actual if planned is not None and actual is not None else None
+
+        return test, self.poll_interval(test['state'], remaining, planned)
+
+    def _poll_iteration(self, iteration_test_suite_id):
+        iteration = self._ww.show_iteration_test_suite(iteration_test_suite_id)
+        LOGGER.info("-"*120)
+        LOGGER.info("iteration_test_suite id = %s, name = %s, state = %s, iteration_duration = %s, created_at = %s",
+                    iteration['id'], iteration['name_cache'], iteration['state'],
+                    iteration['iteration_duration'], iteration['created_at'])
+        LOGGER.info("-"*120)
+
+        return iteration, self.poll_interval(iteration['state'])
+
+    def _poll_round(self, executor, port_executor, finished):
+        """Poll the objects due, queue the finished ones. Returns :float: seconds until next poll is due."""
+
+        now = time.monotonic()
+        with self._lock:
+            due = [key for key, next_poll in self._tracked.items() if next_poll <= now]
+
+        futures = []
+        for kind, object_id in due:
+            if kind == self.TEST:
+                futures.append(self._submit(executor, (kind, object_id), self._poll_test, object_id, port_executor))
+            else:
+                futures.append(self._submit(executor, (kind, object_id), self._poll_iteration, object_id))
+
+        for key, future in zip(due, futures):
+            try:
+                obj, interval = future.result()
+                finished_state = obj['state'] in self._ww.TEST_FINISHED_STATES
+            except Exception as e:
+                # a failed request or a malformed response, e.g. without state, only delays this object
+                failures = self._failures.get(key, 0) + 1
+                self._failures[key] = failures
+                if not _transient(e) and failures >= self.MAX_FAILURES:
+                    with self._lock:
+                        self._tracked.pop(key, None)
+                    self._failures.pop(key, None)
+                    self._last_stats.pop(key[1], None)
+                    LOGGER.error('failed polling %s %s %d times: %s: %s, give up', key[0], key[1], failures,
+                                 type(e).__name__, e)
+                    finished.put(_Failed(key, "%s: %s" % (type(e).__name__, e)))
+                    continue
+                interval = self.retry_interval(failures)
+                with self._lock:
+                    self._tracked[key] = time.monotonic() + interval
+                LOGGER.warning('failed polling %s %s: %s: %s, try again in %s seconds',
+                               key[0], key[1], type(e).__name__, e, interval)
+                continue
+
+            self._failures.pop(key, None)
+            if finished_state:
+                with self._lock:
+                    del self._tracked[key]
+                self._last_stats.pop(key[1], None)
+                finished.put((key[0], obj))
+            else:
+                with self._lock:
+                    self._tracked[key] = time.monotonic() + interval
+                LOGGER.debug('next poll of %s %s in %s seconds', key[0], key[1], interval)
+
+        with self._lock:
+            if not self._tracked:
+                return None
+            return max(0, min(self._tracked.values()) - time.monotonic())
+
+    def _submit(self, executor, key, func, *args):
+        """Return :Future: of the poll of an object, run in the context of the poller."""
+
+        return executor.submit(func, *args)
+
+    def _poll(self, finished, stop):
+        """Poll until nothing is tracked or stop is set, then queue None.
+
+        :param finished: queue.Queue, or any object with put(), of the finished objects
+        :param stop: threading.Event ending the polling when set
+        """
+
+        try:
+            with ContextThreadPoolExecutor(max_workers=self._workers) as executor, \
+                    ContextThreadPoolExecutor(max_workers=self._workers) as port_executor:
+                while not stop.is_set():
+                    self._wakeup.clear()
+                    delay = self._poll_round(executor, port_executor, finished)
+                    if delay is None:
+                        break
+                    self._wakeup.wait(delay)
+        except BaseException as e:
+            finished.put(e)
+        finally:
+            finished.put(None)
+
+    def completed(self):
+        """Poll all tracked objects until they finish.
+
+        A generator yielding (kind, object) as soon as an object finishes, kind is
+        TestMonitor.TEST or TestMonitor.ITERATION, object the latest test or
+        iteration test suite JSON dict. Polling goes on while the caller handles
+        an object, it stops when the generator is closed. Raises PollError at
+        the end if objects could not be polled.
+        """
+
+        finished = queue.Queue()
+        stop = threading.Event()
+        # the logs of the polls go where the caller's go, e.g. to its daemon request
+        poller = threading.Thread(target=contextvars.copy_context().run, args=(self._poll, finished, stop),
+                                  name='TestMonitor')
+        poller.daemon = True
+        poller.start()
+        failed = []
+        try:
+            while True:
+                item = finished.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                if isinstance(item, _Failed):
+                    failed.append(item.key + (item.message,))
+                    continue
+                yield item
+            if failed:
+                raise PollError(failed)
+        finally:
+            stop.set()
+            self._wakeup.set()
+            poller.join()
+
+
+class _Fanout(object):
+    """Hands the objects finished by the poller of a SharedTestMonitor to their waiters."""
+
+    def __init__(self, monitor):
+        self._monitor = monitor
+
+    def put(self, item):
+        if item is not None:
+            self._monitor._dispatch(item)
+
+
+class SharedTestMonitor(TestMonitor):
+    """A TestMonitor polling for many waiters at once, e.g. the commands served by a daemon.
+
+    An object is polled once however many waiters wait for it, the logs of its
+    polls go to all of them. Objects added without a waiter, e.g. tests just
+    started, are polled too, and a finished object is kept ``finished_ttl``
+    seconds, so a later wait for it returns at once. The poller thread runs
+    while anything is tracked.
+
+    Usage::
+
+        monitor = SharedTestMonitor(ww)
+        monitor.add_test(test_id)
+        for kind, test in monitor.wait([test_id]):
+            ww.save_all_test_results(test)
+
+    """
+
+    FINISHED_TTL = 600
+
+    def __init__(self, ww, merge_contexts=None, finished_ttl=FINISHED_TTL, **kwargs):
+        """Create a monitor, the poller thread starts with the first object added.
+
+        :param ww: WorkloadWisdom to poll
+        :param merge_contexts: callable(list of contextvars.Context) returning the context the poll of
+            an object runs in, from the contexts of its waiters, a copy of the first one if None
+        :param finished_ttl: seconds a finished object is kept for later waits
+        :param kwargs: options of TestMonitor, e.g. min_interval, max_interval, workers
+        """
+
+        TestMonitor.__init__(self, ww, **kwargs)
+        self._merge_contexts = merge_contexts or (lambda contexts: contexts[0].copy())
+        self._finished_ttl = finished_ttl
+        # (kind, id) -> list of (queue, context) of the waiters
+        self._waiters = {}
+        # (kind, id) -> (time finished, object)
+        self._done = {}
+        self._poller = None
+        self._stop = threading.Event()
+
+    def _add(self, key):
+        TestMonitor._add(self, key)
+        self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._poller is not None or not self._tracked or self._stop.is_set():
+                return
+            self._poller = threading.Thread(target=self._serve, name='SharedTestMonitor')
+            self._poller.daemon = True
+            self._poller.start()
+
+    def _serve(self):
+        fanout = _Fanout(self)
+        while True:
+            self._poll(fanout, self._stop)
+            with self._lock:
+                # an object added after the last round is polled by a new round
+                if not self._tracked or self._stop.is_set():
+                    self._poller = None
+                    return
+
+    def _submit(self, executor, key, func, *args):
+        with self._lock:
+            contexts = [context for _, context in self._waiters.get(key, ())]
+        if not contexts:
+            return executor.submit(func, *args)
+
+        return executor.submit(self._merge_contexts(contexts).run, func, *args)
+
+    def _dispatch(self, item):
+        if isinstance(item, BaseException):
+            # the poller failed, not a poll, every waiter gets the error
+            with self._lock:
+                waiters = [waiter for entries in self._waiters.values() for waiter, _ in entries]
+                self._waiters.clear()
+                self._tracked.clear()
+            for waiter in set(waiters):
+                waiter.put(item)
+            return
+
+        if isinstance(item, _Failed):
+            with self._lock:
+                waiters = self._waiters.pop(item.key, [])
+            for waiter, _ in waiters:
+                waiter.put(item)
+            return
+
+        kind, obj = item
+        key = (kind, obj['id'])
+        with self._lock:
+            self._done[key] = (time.monotonic(), obj)
+            waiters = self._waiters.pop(key, [])
+        for waiter, _ in waiters:
+            waiter.put((key, obj))
+
+    def wait(self, test_ids=(), iteration_ids=()):
+        """Wait for tests and iteration test suites, polled along with those of the other waiters.
+
+        A generator yielding (kind, JSON dict) of each object as soon as it
+        finishes, kind is TestMonitor.TEST or TestMonitor.ITERATION. Logs of the
+        polls go where the caller's go. Raises PollError at the end if objects
+        could not be polled.
+
+        :param test_ids: workload test ids
+        :param iteration_ids: iteration test suite ids
+        """
+
+        keys = set([(self.TEST, test_id) for test_id in test_ids] +
+                   [(self.ITERATION, iteration_id) for iteration_id in iteration_ids])
+        waiter = queue.Queue()
+        context = contextvars.copy_context()
+
+        with self._lock:
+            now = time.monotonic()
+            for key, (finished_at, _) in list(self._done.items()):
+                if now - finished_at > self._finished_ttl:
+                    del self._done[key]
+            for key in keys:
+                if key in self._done:
+                    waiter.put((key, self._done[key][1]))
+                    continue
+                self._waiters.setdefault(key, []).append((waiter, context))
+                self._tracked.setdefault(key, now)
+        self._wakeup.set()
+        self._start()
+
+        pending = set(keys)
+        failed = []
+        try:
+            while pending:
+                item = waiter.get()
+                if isinstance(item, BaseException):
+                    raise item
+                if isinstance(item, _Failed):
+                    pending.discard(item.key)
+                    failed.append(item.key + (item.message,))
+                    continue
+                key, obj = item
+                pending.discard(key)
+                yield key[0], obj
+            if failed:
+                raise PollError(failed)
+        finally:
+            with self._lock:
+                for key in pending:
+                    entries = [entry for entry in self._waiters.get(key, ()) if entry[0] is not waiter]
+                    if entries:
+                        self._waiters[key] = entries
+                        continue
+                    self._waiters.pop(key, None)
+                    # nobody waits for an object failing to poll, e.g. a wrong id
+                    if key in self._failures:
+                        self._tracked.pop(key, None)
+                        self._failures.pop(key, None)
+
+    def close(self):
+        """Stop polling, waits in progress raise a RuntimeError."""
+
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            poller = self._poller
+        if poller is not None:
+            poller.join()
+        self._dispatch(RuntimeError("monitor closed"))
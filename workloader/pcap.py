@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``PcapIndex`` module slicing the .pcap traces saved by save_test_result by time
+
+The trace is memory-mapped and walked once, the offset, timestamp and
+lengths of each packet are saved in a side-car '<trace>.idx' file, reused
+while the trace keeps its size and modification time. Classic pcap only,
+micro or nanosecond timestamps, either byte order; pcapng is not supported.
+
+**Classes**
+
+    PcapIndex
+"""
+
+import array
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+# magic number as read little endian -> (byte order, ticks per second)
+PCAP_MAGICS = {
+    0xa1b2c3d4: ('<', 1000000),
+    0xd4c3b2a1: ('>', 1000000),
+    0xa1b23c4d: ('<', 1000000000),
+    0x4d3cb2a1: ('>', 1000000000),
+}
+PCAP_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'WLPCAPX1'
+# magic, trace size, trace mtime in ns, packets, truncated flag, then the trace header
+_INDEX_HEADER = struct.Struct('<8sQqQ?7x')
+# bytes copied at a time when writing a slice
+COPY_SIZE = 8 * 1024 * 1024
+# bytes of the trace walked before their pages are released
+RELEASE_SIZE = 64 * 1024 * 1024
+
+
+class PcapIndex(object):
+    """Packet offsets and timestamps of a pcap trace, for O(log n) time slicing.
+
+    Times are epoch seconds as floats, packets are numbered in file order.
+
+    Usage::
+
+        with PcapIndex('5bc054af421aa92b599bcbf4_port_0.pcap') as index:
+            first, last = index.start_time, index.end_time
+            edges, packets, sizes = index.window_counts(1.0)
+            index.write('busy.pcap', first + 60, first + 70)
+
+    """
+
+    def __init__(self, path, rebuild=False, save=True):
+        """Open a trace, with its side-car index if it is up to date, building it otherwise.
+
+        :param path: .pcap file
+        :param rebuild: build the index even if the side-car file is up to date
+        :param save: save a built index to the side-car file
+        """
+
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("%s is empty" % path)
+
+        self.header = self._map[:PCAP_HEADER_SIZE]
+        self._order, self._ticks = _pcap_format(path, self.header)
+
+        stat = os.fstat(self._file.fileno())
+        if rebuild or not self._load(stat):
+            self._build()
+            if save:
+                self._save(stat)
+
+        # a capture from several queues may be out of order, slices follow the time order
+        self._sorted = bool(np.all(self.timestamps[1:] >= self.timestamps[:-1]))
+        self._by_time = None if self._sorted else np.argsort(self.timestamps, kind='stable')
+        self._times = self.timestamps if self._sorted else self.timestamps[self._by_time]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return "<PcapIndex %s: %d packets>" % (self.path, len(self.offsets))
+
+    def close(self):
+        """Unmap the trace."""
+
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def _build(self):
+        """Walk the records of the trace, stop at a truncated last one."""
+
+        record = struct.Struct(self._order + 'IIII')
+        unpack = record.unpack_from
+        offsets = array.array('Q')
+        seconds = array.array('q')
+        fractions = array.array('q')
+        captured = array.array('I')
+        lengths = array.array('I')
+
+        data = self._map
+        size = len(data)
+        _advise(data, 'MADV_SEQUENTIAL')
+        offset = PCAP_HEADER_SIZE
+        released = 0
+        while offset + RECORD_HEADER_SIZE <= size:
+            # the pages walked are file backed, drop them instead of growing the RSS by the trace size
+            if offset - released >= RELEASE_SIZE:
+                _advise(data, 'MADV_DONTNEED', released, offset - offset % mmap.PAGESIZE - released)
+                released = offset - offset % mmap.PAGESIZE
+            ts_sec, ts_frac, incl_len, orig_len = unpack(data, offset)
+            if offset + RECORD_HEADER_SIZE + incl_len > size:
+                break
+            offsets.append(offset)
+            seconds.append(ts_sec)
+            fractions.append(ts_frac)
+            captured.append(incl_len)
+            lengths.append(orig_len)
+            offset += RECORD_HEADER_SIZE + incl_len
+        _advise(data, 'MADV_DONTNEED', released, size - released)
+
+        self.truncated = offset != size
+        if self.truncated:
+            LOGGER.warning("%s is truncated, %d bytes after the last complete packet", self.path, size - offset)
+
+        self.offsets = np.frombuffer(offsets, dtype='u8')
+        # nanoseconds since the epoch
+        self.timestamps = np.frombuffer(seconds, dtype='i8') * 1000000000 + \
+            np.frombuffer(fractions, dtype='i8') * (1000000000 // self._ticks)
+        self.captured = np.frombuffer(captured, dtype='u4')
+        self.lengths = np.frombuffer(lengths, dtype='u4')
+        LOGGER.debug("indexed %d packets of %s", len(self.offsets), self.path)
+
+    def _save(self, stat):
+        """Save the index next to the trace, the trace is still usable if it cannot."""
+
+        part = self.index_path + '.part'
+        try:
+            with open(part, 'wb') as p:
+                p.write(_INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(self.offsets),
+                                           self.truncated))
+                p.write(self.header)
+                for values, dtype in ((self.offsets, '<u8'), (self.timestamps, '<i8'),
+                                      (self.captured, '<u4'), (self.lengths, '<u4')):
+                    p.write(values.astype(dtype, copy=False).tobytes())
+            os.replace(part, self.index_path)
+        except OSError as e:
+            LOGGER.warning("unable to save the index of %s: %s", self.path, e)
+
+    def _load(self, stat):
+        """Load the side-car index, False if it is missing or stale."""
+
+        try:
+            with open(self.index_path, 'rb') as p:
+                magic, size, mtime_ns, count, truncated = _INDEX_HEADER.unpack(p.read(_INDEX_HEADER.size))
+                header = p.read(PCAP_HEADER_SIZE)
+                if magic != INDEX_MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns or \
+                        header != self.header:
+                    LOGGER.info("index of %s is stale, rebuild it", self.path)
+                    return False
+                self.offsets = np.fromfile(p, dtype='<u8', count=count)
+                self.timestamps = np.fromfile(p, dtype='<i8', count=count)
+                self.captured = np.fromfile(p, dtype='<u4', count=count)
+                self.lengths = np.fromfile(p, dtype='<u4', count=count)
+        except (OSError, struct.error):
+            return False
+
+        if len(self.lengths) != count:
+            LOGGER.info("index of %s is incomplete, rebuild it", self.path)
+            return False
+        self.truncated = truncated
+        return True
+
+    @property
+    def start_time(self):
+        """:float: epoch seconds of the first packet, None if no packet"""
+
+        return self._times[0] / 1e9 if len(self._times) else None
+
+    @property
+    def end_time(self):
+        """:float: epoch seconds of the last packet, None if no packet"""
+
+        return self._times[-1] / 1e9 if len(self._times) else None
+
+    def _range(self, start, end):
+        """Positions [i, j) in time order of the packets in [start, end)."""
+
+        i = 0 if start is None else int(np.searchsorted(self._times, int(round(start * 1e9)), 'left'))
+        j = len(self._times) if end is None else int(np.searchsorted(self._times, int(round(end * 1e9)), 'left'))
+        return i, max(i, j)
+
+    def packets(self, start=None, end=None):
+        """Return :ndarray: numbers of the packets sent in [start, end), in time order.
+
+        :param start: epoch seconds, the first packet if None
+        :param end: epoch seconds, after the last packet if None
+        """
+
+        i, j = self._range(start, end)
+        return np.arange(i, j) if self._sorted else self._by_time[i:j]
+
+    def count(self, start=None, end=None):
+        """Return :tuple: (packets, bytes on the wire) sent in [start, end)."""
+
+        packets = self.packets(start, end)
+        if self._sorted:
+            return len(packets), int(self.lengths[packets[0]:packets[-1] + 1].sum()) if len(packets) else 0
+        return len(packets), int(self.lengths[packets].sum())
+
+    def window_counts(self, window, start=None, end=None):
+        """Count the packets and bytes on the wire per window of time.
+
+        :param window: seconds of a window
+        :param start: epoch seconds of the first window, first packet if None
+        :param end: epoch seconds after the last window, last packet if None
+        :return: :tuple: (edges, packets, bytes) arrays, edges are the epoch seconds starting each window
+        :rtype: tuple
+        """
+
+        if window <= 0:
+            raise ValueError("window must be positive")
+        if not len(self._times):
+            return np.empty(0), np.empty(0, dtype='i8'), np.empty(0, dtype='i8')
+
+        start_ns = self._times[0] if start is None else int(round(start * 1e9))
+        end_ns = self._times[-1] + 1 if end is None else int(round(end * 1e9))
+        window_ns = int(round(window * 1e9))
+        windows = max(0, -(-(end_ns - start_ns) // window_ns))
+        edges_ns = start_ns + np.arange(windows + 1, dtype='i8') * window_ns
+
+        # positions of the edges in time order, each window is a slice
+        positions = np.searchsorted(self._times, edges_ns, 'left')
+        positions[-1] = np.searchsorted(self._times, end_ns, 'left')
+        lengths = self.lengths if self._sorted else self.lengths[self._by_time]
+        cumulative = np.concatenate(([0], np.cumsum(lengths, dtype='i8')))
+        packets = np.diff(positions)
+        sizes = np.diff(cumulative[positions])
+
+        return edges_ns[:-1] / 1e9, packets, sizes
+
+    def write(self, path, start=None, end=None):
+        """Write the packets sent in [start, end) to a new trace, copied from the map a chunk at a time.
+
+        :param path: .pcap file to write
+        :param start: epoch seconds, the first packet if None
+        :param end: epoch seconds, after the last packet if None
+        :return: :int: number of packets written
+        :rtype: int
+        """
+
+        packets = self.packets(start, end)
+        with open(path, 'wb') as p:
+            p.write(self.header)
+            if self._sorted and len(packets):
+                # one contiguous run of records
+                first = int(self.offsets[packets[0]])
+                last = int(self.offsets[packets[-1]]) + RECORD_HEADER_SIZE + int(self.captured[packets[-1]])
+                for offset in range(first, last, COPY_SIZE):
+                    p.write(self._map[offset:min(last, offset + COPY_SIZE)])
+                    _advise(self._map, 'MADV_DONTNEED', offset - offset % mmap.PAGESIZE,
+                            min(last, offset + COPY_SIZE) - offset + offset % mmap.PAGESIZE)
+            else:
+                for packet in packets:
+                    offset = int(self.offsets[packet])
+                    p.write(self._map[offset:offset + RECORD_HEADER_SIZE + int(self.captured[packet])])
+
+        LOGGER.info("saved %d packets to: %s", len(packets), path)
+        return len(packets)
+
+
+def _advise(data, advice, start=0, length=None):
+    """madvise() a map where the platform supports it, python 3.8+ on Unix."""
+
+    if hasattr(data, 'madvise') and hasattr(mmap, advice):
+        if length is None:
+            data.madvise(getattr(mmap, advice))
+        elif length > 0:
+            data.madvise(getattr(mmap, advice), start, length)
+
+
+def _pcap_format(path, header):
+    """Return :tuple: (byte order, ticks per second) of a pcap global header."""
+
+    if len(header) < PCAP_HEADER_SIZE:
+        raise ValueError("%s is too short to be a pcap" % path)
+    magic = struct.unpack('<I', header[:4])[0]
+    if magic not in PCAP_MAGICS:
+        if header[:4] == b'\x0a\x0d\x0d\x0a':
+            raise ValueError("%s is a pcapng, only pcap is supported" % path)
+        raise ValueError("%s is not a pcap, magic %#x" % (path, magic))
+    return PCAP_MAGICS[magic]
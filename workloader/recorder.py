@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``StatsRecorder`` module keeping port statistics samples of running tests
+
+A recording file starts with ``MAGIC`` followed by chunks, each one is:
+
+    4 bytes little-endian header length
+    JSON header {"test_id", "port_id", "rows", "metrics"}
+    rows float64 little-endian timestamps
+    rows float64 little-endian values for each metric, NaN if not sampled
+
+**Classes**
+
+    StatsRecorder
+
+**Functions**
+
+    iter_chunks
+    read_recording
+"""
+
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+
+from array import array
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'WLSTATS1\n'
+NAN = float('nan')
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _to_bytes(column):
+    if sys.byteorder == 'big':
+        column = array('d', column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_bytes(data):
+    column = array('d')
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+class _Series(object):
+    """Unflushed samples of one test port, a timestamp column and a column per metric."""
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.columns = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, values):
+        rows = len(self.timestamps)
+        for name, value in values.items():
+            if name not in self.columns:
+                self.columns[name] = array('d', [NAN]) * rows
+            self.columns[name].append(_to_float(value))
+        for name, column in self.columns.items():
+            if name not in values:
+                column.append(NAN)
+        self.timestamps.append(timestamp)
+
+
+class StatsRecorder(object):
+    """Records every stat_string sample of get_test_port_state responses.
+
+    Samples are kept per test and port in array-backed float64 columns and
+    appended to the recording file in chunks, so memory stays bounded however
+    long the test runs.
+
+    """
+
+    CHUNK_ROWS = 256
+    # seconds an unflushed sample may wait, so a crash loses little
+    FLUSH_INTERVAL = 300
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS, flush_interval=FLUSH_INTERVAL):
+        """Open a recording file, samples are appended to an existing one.
+
+        :param path: file name containing full path
+        :param chunk_rows: number of samples of a port kept in memory before flushing
+        :param flush_interval: seconds before unflushed samples are flushed anyway
+        """
+
+        self._path = path
+        self._chunk_rows = chunk_rows
+        self._flush_interval = flush_interval
+        self._series = {}
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new:
+            self._file.write(MAGIC)
+        LOGGER.debug("recording stats to: %s", path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def record(self, test_id, port_id, resp, timestamp=None):
+        """Record a get_test_port_state response.
+
+        :param test_id: test id
+        :param port_id: port id
+        :param resp: return of get_test_port_state()
+        :param timestamp: epoch seconds of the sample, now if None
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+        values = dict((item['stat_string'], item['value']) for item in resp['tests'])
+        if not values:
+            return
+
+        with self._lock:
+            key = (test_id, str(port_id))
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            series.append(timestamp, values)
+
+            if len(series) >= self._chunk_rows:
+                self._write_chunk(key, series)
+            elif time.time() - self._last_flush >= self._flush_interval:
+                self._flush()
+
+    def _write_chunk(self, key, series):
+        metrics = sorted(series.columns)
+        header = json.dumps({
+            'test_id': key[0],
+            'port_id': key[1],
+            'rows': len(series),
+            'metrics': metrics,
+        }).encode('utf-8')
+
+        self._file.write(struct.pack('<I', len(header)))
+        self._file.write(header)
+        self._file.write(_to_bytes(series.timestamps))
+        for name in metrics:
+            self._file.write(_to_bytes(series.columns[name]))
+        self._file.flush()
+
+        del self._series[key]
+
+    def _flush(self):
+        for key, series in list(self._series.items()):
+            self._write_chunk(key, series)
+        self._last_flush = time.time()
+
+    def flush(self):
+        """Write all samples kept in memory to the recording file."""
+
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Flush and close the recording file."""
+
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+
+
+def iter_chunks(path):
+    """Iterate over the chunks of a recording file.
+
+    A generator yielding (test_id, port_id, timestamps, {metric: values}) per
+    chunk, columns are array('d'). A last chunk cut short, as left by a
+    process killed while writing it, is skipped with a warning.
+
+    :param path: file name containing full path
+    """
+
+    with open(path, "rb") as p:
+        if p.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a stats recording: %s" % path)
+
+        while True:
+            offset = p.tell()
+            size = p.read(4)
+            if not size:
+                break
+            chunk = _read_chunk(p, size)
+            if chunk is None:
+                LOGGER.warning("%s: incomplete chunk at byte %d, the samples after it are lost", path, offset)
+                break
+            yield chunk
+
+
+def _read_chunk(p, size):
+    """Return :tuple: (test_id, port_id, timestamps, columns) of the chunk after its size, None if cut short."""
+
+    if len(size) < 4:
+        return None
+    header_size = struct.unpack('<I', size)[0]
+    data = p.read(header_size)
+    if len(data) < header_size:
+        return None
+    try:
+        header = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+
+    length = header['rows'] * 8
+    columns = []
+    for _ in range(1 + len(header['metrics'])):
+        data = p.read(length)
+        if len(data) < length:
+            return None
+        columns.append(_from_bytes(data))
+
+    return header['test_id'], header['port_id'], columns[0], dict(zip(header['metrics'], columns[1:]))
+
+
+def read_recording(path, test_id=None):
+    """Read a whole recording file into columns per test port.
+
+    :param path: file name containing full path
+    :param test_id: only read this test if specified
+    :return: :dict: (test_id, port_id) -> (timestamps, {metric: values}), samples in time order
+    :rtype: dict
+    """
+
+    result = {}
+    for chunk_test_id, port_id, timestamps, columns in iter_chunks(path):
+        if test_id is not None and chunk_test_id != test_id:
+            continue
+        key = (chunk_test_id, port_id)
+        if key not in result:
+            result[key] = (array('d'), {})
+        all_timestamps, all_columns = result[key]
+        rows = len(all_timestamps)
+        for name in set(all_columns) | set(columns):
+            if name not in all_columns:
+                all_columns[name] = array('d', [NAN]) * rows
+            all_columns[name].extend(columns.get(name, array('d', [NAN]) * len(timestamps)))
+        all_timestamps.extend(timestamps)
+
+    return result
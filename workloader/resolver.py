@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``NameResolver`` module caching name to id lookups of WorkloadWisdom entities
+
+**Classes**
+
+    NameResolver
+"""
+
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class NameResolver(object):
+    """Name to id indexes per entity type, e.g. 'project', 'testbed'.
+
+    Each index is built from a registered loader returning the id/name list
+    of the entity type, and is reloaded once older than ``ttl`` seconds.
+
+    """
+
+    DEFAULT_TTL = 300
+    # a missed name reloads an index older than this, it may be newly created
+    MISS_REFRESH_AGE = 5
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        """Create a resolver.
+
+        :param ttl: seconds an index is trusted, 0 reloads on every lookup
+        """
+
+        self._ttl = ttl
+        self._loaders = {}
+        # kind -> {name: id} and kind -> {id: name}
+        self._ids = {}
+        self._names = {}
+        self._loaded_at = {}
+        self._lock = threading.RLock()
+
+    def register(self, kind, loader):
+        """Register the loader of an entity type.
+
+        :param kind: entity type, e.g. 'project'
+        :param loader: callable returning a list of dicts with 'id' and 'name'
+        """
+
+        self._loaders[kind] = loader
+
+    def _age(self, kind):
+        if kind not in self._loaded_at:
+            return None
+        return time.time() - self._loaded_at[kind]
+
+    def refresh(self, kind):
+        """Reload the index of an entity type from its loader.
+
+        :param kind: entity type, e.g. 'project'
+        """
+
+        with self._lock:
+            items = self._loaders[kind]()
+            ids = {}
+            names = {}
+            for item in items:
+                # first one wins on duplicated names, same as a linear scan
+                ids.setdefault(item['name'], item['id'])
+                names[item['id']] = item['name']
+            self._ids[kind] = ids
+            self._names[kind] = names
+            self._loaded_at[kind] = time.time()
+            LOGGER.debug("loaded %d %s names", len(ids), kind)
+
+    def _lookup(self, name, kind):
+        with self._lock:
+            age = self._age(kind)
+            if age is None or age >= self._ttl:
+                self.refresh(kind)
+            return self._ids[kind].get(name)
+
+    def resolve(self, name, kinds):
+        """Resolve a name to an id, entity types are searched in order.
+
+        :param name: name of the entity
+        :param kinds: entity type or tuple of entity types, e.g. ('project', 'composite')
+        :return: :tuple: (kind, id) of the first match, (None, None) if not found
+        :rtype: tuple
+        """
+
+        if not isinstance(kinds, (list, tuple)):
+            kinds = (kinds,)
+
+        for kind in kinds:
+            entity_id = self._lookup(name, kind)
+            if entity_id is not None:
+                return kind, entity_id
+
+        with self._lock:
+            for kind in kinds:
+                age = self._age(kind)
+                if age is None or age >= self.MISS_REFRESH_AGE:
+                    LOGGER.debug("%s not in %s index, reload it", name, kind)
+                    self.refresh(kind)
+                entity_id = self._ids[kind].get(name)
+                if entity_id is not None:
+                    return kind, entity_id
+
+        return None, None
+
+    def add(self, kind, name, entity_id):
+        """Patch an index with a created or updated entity.
+
+        :param kind: entity type, e.g. 'project'
+        :param name: name of the entity
+        :param entity_id: id of the entity
+        """
+
+        with self._lock:
+            if kind not in self._ids:
+                return
+            old_name = self._names[kind].get(entity_id)
+            if old_name is not None and self._ids[kind].get(old_name) == entity_id:
+                del self._ids[kind][old_name]
+            self._ids[kind].setdefault(name, entity_id)
+            self._names[kind][entity_id] = name
+
+    def remove(self, kind, entity_id):
+        """Drop a deleted entity from an index.
+
+        :param kind: entity type, e.g. 'project'
+        :param entity_id: id of the entity
+        """
+
+        with self._lock:
+            if kind not in self._ids:
+                return
+            name = self._names[kind].pop(entity_id, None)
+            if name is not None and self._ids[kind].get(name) == entity_id:
+                # another entity sharing the name is found by the reload on miss
+                del self._ids[kind][name]
+
+    def invalidate(self, kind=None):
+        """Forget an index, or all of them, to reload on next lookup.
+
+        :param kind: entity type, all if None
+        """
+
+        with self._lock:
+            if kind is None:
+                self._loaded_at.clear()
+            else:
+                self._loaded_at.pop(kind, None)
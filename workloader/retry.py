@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""Module deciding when a failed request is sent again, and when not at all
+
+**Classes**
+
+    RetryPolicy
+    CircuitBreaker
+    CircuitOpenError
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a host which keeps failing."""
+
+
+class RetryPolicy(object):
+    """Which failures are retried, how many times and how long to wait in between.
+
+    Idempotent methods are retried on connection errors, timeouts and the
+    ``statuses`` responses. A POST is only retried when the caller marks it
+    safe, e.g. a test start may have reached the server even if it answered
+    429 or 503, or timed out while connecting through a proxy.
+
+    """
+
+    DEFAULT_RETRIES = 3
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=1.0, max_backoff=30.0,
+                 statuses=RETRY_STATUSES, methods=IDEMPOTENT_METHODS):
+        """Create a policy.
+
+        :param retries: max number of retries of a request, 0 to disable
+        :param backoff: seconds of the first wait, doubled on each retry and fully jittered
+        :param max_backoff: longest wait in seconds
+        :param statuses: HTTP status codes worth retrying
+        :param methods: HTTP methods retried without being marked safe
+        """
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = tuple(statuses)
+        self.methods = tuple(methods)
+
+    def should_retry(self, method, attempt, status=None, error=None, safe=None):
+        """Tell if a failed attempt is to be sent again.
+
+        :param method: HTTP method of the request
+        :param attempt: number of the attempt that failed, 0 for the first one
+        :param status: HTTP status code of the response, None if no response
+        :param error: exception raised by the attempt, None if a response came
+        :param safe: True/False to force the method to be seen as idempotent or not
+        :return: :bool: True to retry
+        :rtype: bool
+        """
+
+        if attempt >= self.retries:
+            return False
+        if error is None and status not in self.statuses:
+            return False
+
+        idempotent = safe if safe is not None else method.upper() in self.methods
+        if not idempotent:
+            return False
+
+        return error is None or isinstance(error, (requests.exceptions.ConnectionError,
+                                                   requests.exceptions.Timeout))
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before a retry.
+
+        :param attempt: number of the attempt that failed, 0 for the first one
+        :param retry_after: Retry-After header of the response, if any
+        :return: :float: seconds
+        :rtype: float
+        """
+
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """Fails requests fast once a host failed ``failures`` times in a row.
+
+    After ``reset_timeout`` seconds a single probe request is let through,
+    its success closes the circuit again, its failure keeps it open.
+
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failures=5, reset_timeout=30.0):
+        """Create a breaker.
+
+        :param failures: consecutive failures opening the circuit of a host
+        :param reset_timeout: seconds before a probe is let through an open circuit
+        """
+
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        # host -> [state, consecutive failures, opened at]
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def check(self, host):
+        """Raise CircuitOpenError if requests to a host must not be sent.
+
+        :param host: host name, e.g. '10.228.56.32:80'
+        """
+
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state[0] == self.CLOSED:
+                return
+            now = time.monotonic()
+            # a probe lost without an outcome is replaced after the timeout too
+            if now - state[2] >= self.reset_timeout:
+                state[0] = self.HALF_OPEN
+                state[2] = now
+                LOGGER.info("circuit of %s half open, probing", host)
+                return
+            raise CircuitOpenError("circuit of %s is open after %d failures" % (host, state[1]))
+
+    def success(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None and state[0] != self.CLOSED:
+                LOGGER.info("circuit of %s closed", host)
+            self._hosts[host] = [self.CLOSED, 0, None]
+
+    def failure(self, host):
+        with self._lock:
+            state = self._hosts.setdefault(host, [self.CLOSED, 0, None])
+            state[1] += 1
+            if state[0] == self.HALF_OPEN or (state[0] == self.CLOSED and state[1] >= self.failures):
+                state[0] = self.OPEN
+                state[2] = time.monotonic()
+                LOGGER.error("circuit of %s open after %d failures", host, state[1])
+
+    def state(self, host):
+        """State of the circuit of a host, 'closed', 'open' or 'half_open'."""
+
+        with self._lock:
+            return self._hosts.get(host, [self.CLOSED])[0]
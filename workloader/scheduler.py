@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``TestScheduler`` module running a queue of tests as soon as their ports are free
+
+**Classes**
+
+    TestScheduler
+"""
+
+import contextvars
+import logging
+import queue
+import threading
+import time
+
+import requests
+
+from workloader.inventory import testbed_ports
+from workloader.util import ContextThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TestScheduler(object):
+    """Starts queued tests and iteration test suites as soon as their ports are idle.
+
+    Jobs are started in queue order, a job never jumps ahead of an earlier one
+    sharing a port with it, while jobs on independent testbeds run in parallel.
+    The ports of a started job are reserved until it finishes. Scheduling runs
+    on a thread of its own, finished jobs are queued for the caller, so saving
+    the results of one job does not hold up the start of the others. A job
+    whose ports are not found on their appliances for ``unknown_port_timeout``
+    seconds fails.
+
+    Usage::
+
+        scheduler = TestScheduler(ww)
+        scheduler.add_test('project', 'testbed', 600)
+        scheduler.add_iteration('iteration suite', 'testbed')
+        for job in scheduler.run():
+            ww.save_all_test_results(job['result'])
+
+    """
+
+    TEST = 'test'
+    ITERATION = 'iteration'
+
+    # seconds between two checks of the ports and of the started jobs
+    POLL_INTERVAL = 10
+    # seconds a job waits for ports its appliances do not report before it fails
+    UNKNOWN_PORT_TIMEOUT = 300
+
+    def __init__(self, ww, poll_interval=POLL_INTERVAL, workers=8, unknown_port_timeout=UNKNOWN_PORT_TIMEOUT):
+        """Create a scheduler.
+
+        :param ww: WorkloadWisdom to run the jobs on
+        :param poll_interval: seconds between two checks of the ports and of the started jobs
+        :param workers: max number of concurrent requests
+        :param unknown_port_timeout: seconds a job waits for ports missing from their appliances
+        """
+
+        self._ww = ww
+        self._poll_interval = poll_interval
+        self._workers = workers
+        self._unknown_port_timeout = unknown_port_timeout
+        self._pending = []
+        self._running = []
+        # id of a pending job -> time its ports were first found missing
+        self._unknown_since = {}
+        self._lock = threading.Lock()
+        # set to wake the scheduling thread up, e.g. when a job is queued
+        self._wakeup = threading.Event()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending) + len(self._running)
+
+    def _add(self, kind, name, source, testbed_name, duration):
+        testbed = self._ww.get_testbed_by_name(testbed_name)
+        job = {
+            'kind': kind,
+            'name': name,
+            'testbed': testbed_name,
+            'duration': duration,
+            'id': None,
+            'state': 'queued',
+            'result': None,
+            'error': None,
+            'queued_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        with self._lock:
+            self._pending.append((job, source, testbed, set(testbed_ports(testbed))))
+        self._wakeup.set()
+        LOGGER.info("queued %s %s on testbed %s", kind, name, testbed_name)
+
+        return job
+
+    def add_test(self, project_name, testbed_name, duration):
+        """Queue a test.
+
+        :param project_name: name of the project to create a test from
+        :param testbed_name: name of the testbed to start the test on
+        :param duration: duration of the test in seconds
+        :return: :dict: the job, updated as it runs
+        :rtype: dict
+        """
+
+        project = self._ww.get_project_by_name(project_name)
+        return self._add(self.TEST, project_name, project, testbed_name, duration)
+
+    def add_iteration(self, iteration_suite_name, testbed_name):
+        """Queue an iteration test suite.
+
+        :param iteration_suite_name: name of the iteration suite to create a test suite from
+        :param testbed_name: name of the testbed to start the test suite on
+        :return: :dict: the job, updated as it runs
+        :rtype: dict
+        """
+
+        iteration_suite = self._ww.get_iteration_suite_by_name(iteration_suite_name)
+        return self._add(self.ITERATION, iteration_suite_name, iteration_suite, testbed_name, None)
+
+    def _fail(self, job, error):
+        job['state'] = 'failed'
+        job['error'] = error
+        job['finished_at'] = time.time()
+        LOGGER.error("failed starting %s %s: %s", job['kind'], job['name'], error)
+
+    def _try_start(self, job, source, testbed, ports):
+        """Start a job if all its ports are idle. Returns :bool: True if it is no longer pending."""
+
+        try:
+            busy = self._ww.inventory.busy(ports)
+        except requests.exceptions.RequestException as e:
+            LOGGER.warning("failed checking the ports of %s %s: %s, check again later", job['kind'], job['name'], e)
+            return False
+
+        # a port its appliance does not report, e.g. removed from it, may never be idle
+        unknown = sorted(key for key, port in busy.items() if port is None)
+        if unknown:
+            missing_for = time.time() - self._unknown_since.setdefault(id(job), time.time())
+            if missing_for < self._unknown_port_timeout:
+                LOGGER.warning("ports %s of testbed %s not found on their appliances, check again later",
+                               unknown, job['testbed'])
+                return False
+            self._unknown_since.pop(id(job), None)
+            self._fail(job, "ports %s not found on their appliances for %.0f seconds" % (unknown, missing_for))
+            return True
+        self._unknown_since.pop(id(job), None)
+        if busy:
+            return False
+
+        try:
+            if job['kind'] == self.TEST:
+                started = self._ww.start_test(source, testbed, job['duration'], check_ports=False)
+            else:
+                started = self._ww.start_iteration_test_suite(source, testbed, check_ports=False)
+        except requests.exceptions.RequestException as e:
+            self._fail(job, str(e))
+            return True
+
+        job['id'] = started['id']
+        job['state'] = 'running'
+        job['started_at'] = time.time()
+        LOGGER.info("started %s %s on testbed %s, id: %s, queued %.0f seconds",
+                    job['kind'], job['name'], job['testbed'], job['id'], job['started_at'] - job['queued_at'])
+        return True
+
+    def _start_ready(self, executor):
+        """Start the pending jobs whose ports are free, in queue order."""
+
+        reserved = set()
+        for _, _, _, ports in self._running:
+            reserved |= ports
+
+        with self._lock:
+            queued = list(self._pending)
+        candidates = []
+        for pending in queued:
+            ports = pending[3]
+            # ports of an earlier job still queued stay reserved for it
+            if not ports & reserved:
+                candidates.append(pending)
+            reserved |= ports
+
+        if not candidates:
+            return []
+
+        # one fetch of each appliance for all candidates
+        try:
+            self._ww.inventory.refresh(set(appliance_id for pending in candidates for appliance_id, _ in pending[3]))
+        except requests.exceptions.RequestException as e:
+            LOGGER.warning("failed fetching the appliance ports: %s, check again later", e)
+            return []
+        started = list(executor.map(lambda pending: self._try_start(*pending), candidates))
+        done = []
+        for pending, leaves_queue in zip(candidates, started):
+            if not leaves_queue:
+                continue
+            with self._lock:
+                self._pending.remove(pending)
+                if pending[0]['state'] == 'running':
+                    self._running.append(pending)
+                    continue
+            done.append(pending[0])
+
+        return done
+
+    def _poll(self, job):
+        """Return the latest JSON dict of a started job, None if it cannot be fetched this time."""
+
+        try:
+            if job['kind'] == self.TEST:
+                result = self._ww.show_test(job['id'])
+            else:
+                result = self._ww.show_iteration_test_suite(job['id'])
+            if not isinstance(result, dict) or 'state' not in result:
+                raise ValueError("no state in the response")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            LOGGER.warning("failed polling %s %s id %s: %s, poll again later", job['kind'], job['name'], job['id'], e)
+            return None
+        return result
+
+    def _finish_completed(self, executor):
+        """Release the ports of the started jobs which finished."""
+
+        if not self._running:
+            return []
+
+        results = list(executor.map(lambda running: self._poll(running[0]), self._running))
+        done = []
+        for running, result in zip(list(self._running), results):
+            if result is None or result['state'] not in self._ww.TEST_FINISHED_STATES:
+                continue
+            job = running[0]
+            job['state'] = result['state']
+            job['result'] = result
+            job['finished_at'] = time.time()
+            with self._lock:
+                self._running.remove(running)
+            done.append(job)
+            LOGGER.info("%s %s id %s %s", job['kind'], job['name'], job['id'], job['state'])
+
+        return done
+
+    def _schedule(self, finished, stop):
+        """Start and poll the jobs until none is left or stop is set, queue the finished ones, then None."""
+
+        try:
+            with ContextThreadPoolExecutor(max_workers=self._workers) as executor:
+                while not stop.is_set():
+                    self._wakeup.clear()
+                    for job in self._finish_completed(executor) + self._start_ready(executor):
+                        finished.put(job)
+
+                    with self._lock:
+                        queued, running = len(self._pending), len(self._running)
+                    if not queued and not running:
+                        break
+                    LOGGER.debug("%d jobs queued, %d running", queued, running)
+                    self._wakeup.wait(self._poll_interval)
+        except BaseException as e:
+            finished.put(e)
+        finally:
+            finished.put(None)
+
+    def run(self):
+        """Run all queued jobs.
+
+        A generator yielding each job dict as soon as it finishes, 'result' is
+        the latest test or iteration test suite JSON dict, 'error' is set if
+        the job could not be started. Jobs may be queued while it runs. Jobs
+        keep being started while the caller handles a finished one, scheduling
+        stops when the generator is closed.
+        """
+
+        finished = queue.Queue()
+        stop = threading.Event()
+        # the logs of the scheduling go where the caller's go, e.g. to its daemon request
+        scheduler = threading.Thread(target=contextvars.copy_context().run, args=(self._schedule, finished, stop),
+                                     name='TestScheduler')
+        scheduler.daemon = True
+        scheduler.start()
+        try:
+            while True:
+                job = finished.get()
+                if job is None:
+                    break
+                if isinstance(job, BaseException):
+                    raise job
+                yield job
+        finally:
+            stop.set()
+            self._wakeup.set()
+            scheduler.join()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``PortStats`` module aggregating the port statistics of a test
+
+**Classes**
+
+    PortStats
+
+**Functions**
+
+    log_test_stats
+"""
+
+import logging
+import time
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+ATTEMPTS = 'load.scenarios.attempts'
+SUCCEEDS = 'load.scenarios.succeeds'
+FAILS = 'load.scenarios.fails'
+ABORTS = 'load.scenarios.aborts'
+SCENARIO_METRICS = [ATTEMPTS, SUCCEEDS, FAILS, ABORTS]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class PortStats(object):
+    """Stats of all ports of a test at one point in time.
+
+    Values are kept in a float64 matrix, one row per port and one column per
+    stat_string, NaN where a port did not report a stat. Testbed totals, rates
+    between two samples and ratios are computed over whole columns.
+
+    Usage::
+
+        stats = ww.get_test_stats(test)
+        stats.totals()[stats.ATTEMPTS]
+        stats.ratio(stats.SUCCEEDS, stats.ATTEMPTS)
+
+    """
+
+    ATTEMPTS = ATTEMPTS
+    SUCCEEDS = SUCCEEDS
+    FAILS = FAILS
+    ABORTS = ABORTS
+
+    def __init__(self, port_ids, metrics, values, timestamp=None):
+        """Create stats from a matrix.
+
+        :param port_ids: list of port ids, one per row
+        :param metrics: list of stat_string, one per column
+        :param values: array-like of shape (ports, metrics)
+        :param timestamp: epoch seconds of the sample, now if None
+        """
+
+        self.port_ids = [str(port_id) for port_id in port_ids]
+        self.metrics = list(metrics)
+        self.values = np.asarray(values, dtype=np.float64).reshape(len(self.port_ids), len(self.metrics))
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._columns = dict((name, i) for i, name in enumerate(self.metrics))
+
+    @classmethod
+    def from_responses(cls, port_ids, responses, timestamp=None):
+        """Build stats from get_test_port_state responses.
+
+        :param port_ids: list of port ids
+        :param responses: list of get_test_port_state returns, same order as port_ids
+        :param timestamp: epoch seconds of the sample, now if None
+        :return: :PortStats: stats of the ports
+        :rtype: PortStats
+        """
+
+        columns = {}
+        cells = []
+        for row, resp in enumerate(responses):
+            for item in resp['tests']:
+                column = columns.setdefault(item['stat_string'], len(columns))
+                cells.append((row, column, _to_float(item['value'])))
+
+        values = np.full((len(port_ids), len(columns)), np.nan)
+        if cells:
+            rows, cols, data = zip(*cells)
+            values[list(rows), list(cols)] = data
+
+        metrics = sorted(columns, key=columns.get)
+        return cls(port_ids, metrics, values, timestamp)
+
+    def __len__(self):
+        return len(self.port_ids)
+
+    def column(self, metric):
+        """Values of a stat on each port.
+
+        :param metric: stat_string, e.g. 'load.scenarios.attempts'
+        :return: :ndarray: one value per port, NaN if not reported
+        :rtype: numpy.ndarray
+        """
+
+        if metric not in self._columns:
+            return np.full(len(self.port_ids), np.nan)
+        return self.values[:, self._columns[metric]]
+
+    def select(self, metrics):
+        """Sub-matrix of some stats, missing ones are NaN columns.
+
+        :param metrics: list of stat_string
+        :return: :ndarray: shape (ports, len(metrics))
+        :rtype: numpy.ndarray
+        """
+
+        return np.column_stack([self.column(metric) for metric in metrics]) if metrics \
+            else np.empty((len(self.port_ids), 0))
+
+    def port_available(self):
+        """Tell which ports reported stats.
+
+        :return: :ndarray: one bool per port
+        :rtype: numpy.ndarray
+        """
+
+        return ~np.all(np.isnan(self.values), axis=1) if self.metrics else np.zeros(len(self.port_ids), bool)
+
+    def totals(self, metrics=None):
+        """Testbed wide sums, ports which did not report a stat are skipped.
+
+        :param metrics: list of stat_string, all if None
+        :return: :dict: stat_string -> sum, NaN if no port reported it
+        :rtype: dict
+        """
+
+        metrics = self.metrics if metrics is None else metrics
+        matrix = self.select(metrics)
+        reported = ~np.isnan(matrix)
+        sums = np.where(reported.any(axis=0), np.nansum(matrix, axis=0), np.nan)
+        return dict(zip(metrics, sums.tolist()))
+
+    def rates(self, previous):
+        """Per second rates since a previous sample of the same test.
+
+        :param previous: PortStats sampled earlier
+        :return: :PortStats: rates on the ports and stats of this sample, NaN where unknown
+        :rtype: PortStats
+        """
+
+        elapsed = self.timestamp - previous.timestamp
+        if elapsed <= 0:
+            raise ValueError("previous sample is not older: %s >= %s" % (previous.timestamp, self.timestamp))
+
+        rows = dict((port_id, i) for i, port_id in enumerate(previous.port_ids))
+        index = np.array([rows.get(port_id, -1) for port_id in self.port_ids], dtype=int)
+        before = np.full(self.values.shape, np.nan)
+        found = index >= 0
+        before[found] = previous.select(self.metrics)[index[found]]
+
+        return PortStats(self.port_ids, self.metrics, (self.values - before) / elapsed, self.timestamp)
+
+    def ratio(self, numerator, denominator):
+        """Ratio of two stats on each port, e.g. succeeds over attempts.
+
+        :param numerator: stat_string
+        :param denominator: stat_string
+        :return: :ndarray: one ratio per port, NaN where the denominator is 0 or missing
+        :rtype: numpy.ndarray
+        """
+
+        top = self.column(numerator)
+        bottom = self.column(denominator)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(bottom > 0, top / bottom, np.nan)
+
+    def total_ratio(self, numerator, denominator):
+        """Testbed wide ratio of two stats.
+
+        :param numerator: stat_string
+        :param denominator: stat_string
+        :return: :float: ratio, NaN if the denominator total is 0 or missing
+        :rtype: float
+        """
+
+        totals = self.totals([numerator, denominator])
+        if not totals[denominator] > 0:
+            return float('nan')
+        return totals[numerator] / totals[denominator]
+
+    def to_dict(self):
+        """Stats as plain python objects, e.g. to dump as JSON.
+
+        :return: :dict: timestamp, totals and port_id -> {stat_string: value}, unreported stats left out
+        :rtype: dict
+        """
+
+        ports = {}
+        for port_id, row in zip(self.port_ids, self.values.tolist()):
+            ports[port_id] = dict((name, value) for name, value in zip(self.metrics, row) if value == value)
+
+        return {
+            'timestamp': self.timestamp,
+            'totals': dict((name, value) for name, value in self.totals().items() if value == value),
+            'ports': ports,
+        }
+
+
+def _format(value):
+    return "n/a" if value != value else "%g" % value
+
+
+def log_test_stats(test, stats, previous=None):
+    """Log the scenario counters of each port and of the whole testbed.
+
+    :param test: dict of a WorkloadTest JSON
+    :param stats: PortStats of the test
+    :param previous: PortStats of an earlier poll, to log attempts per second
+    """
+
+    counters = stats.select(SCENARIO_METRICS)
+    available = stats.port_available()
+    rates = stats.rates(previous).column(ATTEMPTS) if previous is not None else None
+
+    for i, port_id in enumerate(stats.port_ids):
+        if not available[i]:
+            LOGGER.warning("Stats not available for test %s, port %s", test['id'], port_id)
+            continue
+        LOGGER.info("-"*120)
+        LOGGER.info("test id = %s, port = %s, state = %s, duration planned = %s, duration actual = %s",
+                    test['id'], port_id, test['state'], test['duration_planned'], test['duration_actual'])
+        LOGGER.info("Attempts = %s, Succeeds = %s, Fails = %s, Aborts = %s",
+                    *[_format(value) for value in counters[i]])
+        if rates is not None:
+            LOGGER.info("Attempts/s = %s", _format(rates[i]))
+        LOGGER.info("-"*120)
+
+    if len(stats) > 1 and available.any():
+        totals = stats.totals(SCENARIO_METRICS)
+        LOGGER.info("test id = %s, all %d ports: Attempts = %s, Succeeds = %s, Fails = %s, Aborts = %s,"
+                    " success ratio = %s", test['id'], len(stats),
+                    *([_format(totals[name]) for name in SCENARIO_METRICS] +
+                      [_format(stats.total_ratio(SUCCEEDS, ATTEMPTS))]))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``Tracer`` module recording timed spans as a Chrome trace-event timeline
+
+The saved JSON opens in chrome://tracing, https://ui.perfetto.dev or
+speedscope. Spans of a thread nest by time, each thread of a pool gets its
+own track, so a sequential and a parallel run are told apart at a glance.
+
+**Classes**
+
+    Tracer
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Tracer(object):
+    """Collects complete ('X') trace events from all threads.
+
+    Usage::
+
+        tracer = Tracer()
+        ww = WorkloadWisdom(url, username, password, tracer=tracer)
+        with tracer.span('start', 'command'):
+            ww.start_test_by_name(project, testbed, 600)
+        tracer.save('start.trace.json')
+
+    """
+
+    DEFAULT_MAX_EVENTS = 1000000
+
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS):
+        """Create a tracer.
+
+        :param max_events: events kept, later ones are counted as dropped
+        """
+
+        self._max_events = max_events
+        self._events = []
+        self._dropped = 0
+        self._threads = {}
+        self._pid = os.getpid()
+        # timestamps are relative to the tracer creation
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1000000
+
+    def _add(self, event):
+        tid = threading.get_ident()
+        event['pid'] = self._pid
+        event['tid'] = tid
+        with self._lock:
+            if tid not in self._threads:
+                self._threads[tid] = threading.current_thread().name
+            if len(self._events) < self._max_events:
+                self._events.append(event)
+            else:
+                self._dropped += 1
+
+    @contextmanager
+    def span(self, name, category='workloader', **args):
+        """Time the block as a span of the calling thread.
+
+        Yields the args dict of the span, values set in the block are saved
+        with it, e.g. the status of a response.
+
+        :param name: name of the span, e.g. 'WorkloadWisdom.start_test'
+        :param category: category of the span, e.g. 'http'
+        :param args: values saved with the span
+        """
+
+        start = self._now_us()
+        try:
+            yield args
+        except Exception as e:
+            args['error'] = "%s: %s" % (type(e).__name__, e)
+            raise
+        finally:
+            event = {'name': name, 'cat': category, 'ph': 'X', 'ts': round(start, 1),
+                     'dur': round(self._now_us() - start, 1)}
+            if args:
+                event['args'] = dict((key, value if isinstance(value, (int, float, bool, type(None))) else str(value))
+                                     for key, value in args.items())
+            self._add(event)
+
+    def instant(self, name, category='workloader', **args):
+        """Record an instant event, e.g. a retry."""
+
+        event = {'name': name, 'cat': category, 'ph': 'i', 's': 't', 'ts': round(self._now_us(), 1)}
+        if args:
+            event['args'] = dict((key, str(value)) for key, value in args.items())
+        self._add(event)
+
+    def wrap(self, func, name, category='workloader'):
+        """Return func timed as a span on every call.
+
+        The span of a generator function, e.g. wait_until_tests_complete, lasts
+        until the generator is exhausted or closed, not just its creation.
+        """
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def traced_generator(*args, **kwargs):
+                with self.span(name, category):
+                    return (yield from func(*args, **kwargs))
+
+            return traced_generator
+
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            with self.span(name, category):
+                return func(*args, **kwargs)
+
+        return traced
+
+    def instrument(self, obj, category='workloader'):
+        """Time every public method of an object, on this object only.
+
+        Methods calling each other through self nest their spans, properties
+        and private methods are left alone.
+
+        :param obj: object to instrument, e.g. a WorkloadWisdom
+        :param category: category of the spans
+        """
+
+        cls = type(obj)
+        for name in dir(cls):
+            if name.startswith('_'):
+                continue
+            attr = inspect.getattr_static(cls, name)
+            if not inspect.isfunction(attr):
+                continue
+            setattr(obj, name, self.wrap(getattr(obj, name), "%s.%s" % (cls.__name__, name), category))
+
+    def events(self):
+        """Return :list: the trace events, thread name metadata first."""
+
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+            dropped = self._dropped
+
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': self._pid, 'tid': 0,
+                     'args': {'name': 'workloader'}}]
+        for tid, name in threads.items():
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': name}})
+        if dropped:
+            LOGGER.warning("%d trace events dropped over the max of %d", dropped, self._max_events)
+
+        return metadata + events
+
+    def save(self, path):
+        """Save the timeline as Chrome trace-event JSON.
+
+        :param path: file name, e.g. 'start.trace.json'
+        """
+
+        with open(path, "w") as p:
+            json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, p)
+        LOGGER.info("saved trace to: %s", path)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#
+#                      __   .__                    .___
+# __  _  _____________|  | _|  |   _________     __| _/___________
+# \ \/ \/ /  _ \_  __ \  |/ /  |  /  _ \__  \   / __ |/ __ \_  __ \
+#  \     (  <_> )  | \/    <|  |_(  <_> ) __ \_/ /_/ \  ___/|  | \/
+#   \/\_/ \____/|__|  |__|_ \____/\____(____  /\____ |\___  >__|
+#                          \/               \/      \/    \/
+#
+# Copyright (c) 2018 Stephen Shao <sjh311@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.  See http://www.gnu.org/copyleft/gpl.html for
+# the full text of the license.
+
+"""``Transport`` module holding the pooled HTTP session used by the REST helpers
+
+**Classes**
+
+    Transport
+"""
+
+import logging
+import time
+
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from workloader.metrics import endpoint_template
+from workloader.retry import CircuitOpenError
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Transport(object):
+    """A pooled, keep-alive HTTP session towards one WorkloadWisdom.
+
+    Every ``util.rest_*`` call given a transport reuses its connections
+    instead of opening a new TCP connection per request. Requests are paced
+    per host by an optional limiter.HostLimiter, transient failures retried
+    by an optional retry.RetryPolicy behind an optional retry.CircuitBreaker.
+    Every attempt is recorded by an optional metrics.RequestMetrics and
+    timed as a span by an optional tracing.Tracer.
+
+    """
+
+    DEFAULT_POOL_SIZE = 10
+    # (connect, read) in seconds, read timeout applies between received bytes
+    DEFAULT_TIMEOUT = (10, 300)
+
+    def __init__(self, username, password, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT, keep_alive=True, limiter=None, retry=None, breaker=None, metrics=None,
+                 tracer=None):
+        """Create a transport.
+
+        :param username: username
+        :param password: password
+        :param pool_size: max number of connections kept open per host
+        :param timeout: default timeout, seconds or a (connect, read) tuple
+        :param keep_alive: keep connections open between requests
+        :param limiter: limiter.HostLimiter pacing the requests, None for no limit
+        :param retry: retry.RetryPolicy of failed requests, None for no retry
+        :param breaker: retry.CircuitBreaker failing fast towards a failing host, None for none
+        :param metrics: metrics.RequestMetrics recording the requests, None for no recording
+        :param tracer: tracing.Tracer timing each attempt, None for no tracing
+        """
+
+        self._timeout = timeout
+        self._limiter = limiter
+        self._retry = retry
+        self._breaker = breaker
+        self._metrics = metrics
+        self._tracer = tracer
+        self._keep_alive = keep_alive
+        self._pool_size = pool_size
+
+        self._session = requests.Session()
+        self._session.auth = HTTPBasicAuth(username, password)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        if not keep_alive:
+            self._session.headers['Connection'] = 'close'
+
+        LOGGER.debug("transport created, pool_size=%s, timeout=%s, keep_alive=%s",
+                     pool_size, timeout, keep_alive)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def limiter(self):
+        return self._limiter
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def _send(self, method, url, host, timeout, **kwargs):
+        if self._breaker is not None:
+            try:
+                self._breaker.check(host)
+            except CircuitOpenError:
+                if self._metrics is not None:
+                    self._metrics.observe(method, url, None)
+                raise
+
+        waited = 0.0
+        start = time.perf_counter()
+        try:
+            if self._limiter is None:
+                resp = self._session.request(method, url, timeout=timeout, **kwargs)
+            else:
+                with self._limiter.slot(host) as slot:
+                    waited = slot['throttle_wait']
+                    resp = self._session.request(method, url, timeout=timeout, **kwargs)
+                    slot['error'] = resp.status_code >= 500 or resp.status_code == 429
+        except requests.exceptions.RequestException:
+            if self._metrics is not None:
+                self._metrics.observe(method, url, time.perf_counter() - start - waited, throttle_wait=waited)
+            if self._breaker is not None:
+                self._breaker.failure(host)
+            raise
+
+        if self._metrics is not None:
+            # a streamed body is not read yet, its announced length is counted
+            if kwargs.get('stream'):
+                size = int(resp.headers.get('Content-Length') or 0)
+            else:
+                size = len(resp.content)
+            self._metrics.observe(method, url, time.perf_counter() - start - waited, resp.status_code,
+                                  size, waited)
+
+        if self._breaker is not None:
+            if resp.status_code >= 500:
+                self._breaker.failure(host)
+            else:
+                self._breaker.success(host)
+        return resp
+
+    def request(self, method, url, timeout=None, retry_safe=None, **kwargs):
+        """Sends a request through the pooled session. Returns :`Response` object.
+
+        :param method: HTTP method, e.g. 'GET'
+        :param url: full url of the request
+        :param timeout: timeout for this request only, default timeout if None
+        :param retry_safe: True/False to retry the request as idempotent or not, per method if None
+        :param kwargs: passed to requests.Session.request
+        :rtype: requests.Response
+        """
+
+        if timeout is None:
+            timeout = self._timeout
+        host = urlsplit(url).netloc
+
+        attempt = 0
+        while True:
+            try:
+                if self._tracer is None:
+                    span = nullcontext({})
+                else:
+                    span = self._tracer.span("%s %s" % (method, endpoint_template(url)), 'http', url=url)
+                with span as span_args:
+                    resp = self._send(method, url, host, timeout, **kwargs)
+                    span_args['status'] = resp.status_code
+            except CircuitOpenError:
+                raise
+            except requests.exceptions.RequestException as e:
+                if self._retry is None or not self._retry.should_retry(method, attempt, error=e, safe=retry_safe):
+                    raise
+                reason = e
+                delay = self._retry.delay(attempt)
+            else:
+                if self._retry is None or \
+                        not self._retry.should_retry(method, attempt, status=resp.status_code, safe=retry_safe):
+                    return resp
+                reason = "%s %s" % (resp.status_code, resp.reason)
+                delay = self._retry.delay(attempt, resp.headers.get('Retry-After'))
+                resp.close()
+
+            attempt += 1
+            if self._metrics is not None:
+                self._metrics.retry(method, url)
+            if self._tracer is not None:
+                self._tracer.instant("retry %s %s" % (method, endpoint_template(url)), 'http',
+                                     reason=reason, delay=round(delay, 3))
+            LOGGER.warning("%s %s failed: %s, retry %d of %d in %.1f seconds",
+                           method, url, reason, attempt, self._retry.retries, delay)
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        return self.request('POST', url, data=data, json=json, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections."""
+
+        LOGGER.debug("transport closed")
+        self._session.close()
@@ -17,12 +17,39 @@
 
 import requests
 import logging
+import logging.handlers
+import contextvars
+import hashlib
 import json
+import os
+import queue
+import sys
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
 from requests.auth import HTTPBasicAuth
 
 LOGGER = logging.getLogger(__name__)
 
+# size of the chunks written to disk when streaming a download
+CHUNK_SIZE = 1024 * 1024
+# (connect, read) seconds of the requests sent without a transport
+DEFAULT_TIMEOUT = (10, 300)
+
+# dump_json limits, characters kept of a dump and 1 dump logged out of 'every' calls
+DUMP_MAX_CHARS = 4096
+DUMP_EVERY = 1
+# caller name -> (max_chars, every), only the calls polled by the wait loops are
+# capped and sampled, other dumps are logged in full
+DUMP_LIMITS = {
+    'show_test': (DUMP_MAX_CHARS, 10),
+    'show_iteration_test_suite': (DUMP_MAX_CHARS, 10),
+    'get_test_port_state': (DUMP_MAX_CHARS, 10),
+}
+_dump_counts = {}
+_dump_lock = threading.Lock()
+
 
 def save_to_file(local_file, content):
     """Save data into a file.
@@ -31,8 +58,10 @@ def save_to_file(local_file, content):
     :param content: data to be write into the file
     """
 
+    # summary, trace and zip files are binary
+    mode = "wb" if isinstance(content, bytes) else "w"
     try:
-        p = open(local_file, "w")
+        p = open(local_file, mode)
         p.write(content)
         p.close()
         LOGGER.info("saved file to: %s", local_file)
@@ -40,29 +69,125 @@ def save_to_file(local_file, content):
         LOGGER.error("failed saving log file %s", local_file)
         raise
 
-def dump_json(dict):
+class _LazyJson(object):
+    """Formats a JSON object only when a handler emits the log record."""
+
+    def __init__(self, obj, max_chars):
+        self._obj = obj
+        self._max_chars = max_chars
+
+    def __str__(self):
+        text = json.dumps(self._obj, indent=4, sort_keys=True)
+        if self._max_chars is not None and len(text) > self._max_chars:
+            return "%s ... (%d more characters)" % (text[:self._max_chars], len(text) - self._max_chars)
+        return text
+
+
+def set_dump_limits(endpoint, max_chars=DUMP_MAX_CHARS, every=DUMP_EVERY):
+    """Limit the dumps of an endpoint, e.g. a stats call polled every few seconds.
+
+    :param endpoint: name of the method calling dump_json, e.g. 'get_test_port_state'
+    :param max_chars: characters kept of a dump, None for no limit
+    :param every: log 1 dump out of every calls
+    """
+
+    DUMP_LIMITS[endpoint] = (max_chars, max(1, every))
+
+
+def dump_json(dict, endpoint=None):
     """Dump the dict with formatting.
 
+    Nothing is done unless DEBUG is enabled, and the JSON is only formatted
+    when the record is emitted. Dumps of the endpoints in DUMP_LIMITS, the
+    ones polled while waiting for tests, are truncated and sampled.
+
     :param dict: JSON object to be dumped
+    :param endpoint: name of the limits to apply, the calling method name if None
     """
 
-    if dict:
-        LOGGER.debug(json.dumps(dict, indent=4, sort_keys=True))
-    else:
+    if not dict:
         raise ValueError("input cannot be None")
+    if not LOGGER.isEnabledFor(logging.DEBUG):
+        return
+
+    if endpoint is None:
+        endpoint = sys._getframe(1).f_code.co_name
+    max_chars, every = DUMP_LIMITS.get(endpoint, (None, DUMP_EVERY))
+    if every > 1:
+        with _dump_lock:
+            count = _dump_counts.get(endpoint, 0)
+            _dump_counts[endpoint] = count + 1
+        if count % every:
+            return
+
+    LOGGER.debug("%s: %s", endpoint, _LazyJson(dict, max_chars))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queues records as they are, messages are formatted by the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+def start_log_listener(handlers, logger=None):
+    """Move log handlers behind a queue, emitted by a background thread.
+
+    Records are put on an unbounded queue by the calling threads, so polling
+    threads never wait for a file or console write.
+
+    :param handlers: list of logging.Handler to emit the records
+    :param logger: logger to attach the queue to, root if None
+    :return: :QueueListener: started listener, stop() it to flush on exit
+    :rtype: logging.handlers.QueueListener
+    """
+
+    records = queue.Queue(-1)
+    logger = logger or logging.getLogger()
+    logger.addHandler(_QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+
+    return listener
+
 
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """Runs each call in a copy of the context it was submitted from.
 
-def rest_get(api, username, password, json=True):
+    Context variables follow the work into the pool threads, e.g. the daemon
+    request the log records of a poll or a download are sent to.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        return ThreadPoolExecutor.submit(self, contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _send(method, api, username, password, transport=None, timeout=None, retry_safe=None, **kwargs):
+    """Sends a request through the transport if given, a one-off connection otherwise.
+
+    :rtype: requests.Response
+    """
+
+    if transport is not None:
+        return transport.request(method, api, timeout=timeout, retry_safe=retry_safe, **kwargs)
+
+    return requests.request(method, api, auth=HTTPBasicAuth(username, password),
+                            timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+
+
+def rest_get(api, username, password, json=True, transport=None, timeout=None):
     """Sends a GET request with specific API. Returns :JSON of `Response` object.
 
     :param api: api for the post request
     :param username: username
     :param password: password
     :param json: return json or raw content
+    :param transport: pooled transport.Transport, a new connection is used if None
+    :param timeout: timeout of this request, transport default if None
     :rtype: requests.Response.json()
     """
 
-    resp = requests.get(api, auth=HTTPBasicAuth(username, password))
+    resp = _send('GET', api, username, password, transport, timeout)
     if resp.ok:
         if json:
             return resp.json()
@@ -70,10 +195,10 @@ def rest_get(api, username, password, json=True):
             return resp.content
     else:
         LOGGER.error("%s", resp.content)
-        raise requests.exceptions.RequestException(resp.reason)
+        raise requests.exceptions.RequestException(resp.reason, response=resp)
 
 
-def rest_post(api, username, password, data=None, json=None):
+def rest_post(api, username, password, data=None, json=None, transport=None, timeout=None, safe=False):
     """Sends a POST request with specific API. Returns :JSON of `Response` object.
 
     :param api: api for the post request
@@ -81,47 +206,129 @@ def rest_post(api, username, password, data=None, json=None):
     :param password: password
     :param data: data for the post request
     :param json: json for the post request
+    :param transport: pooled transport.Transport, a new connection is used if None
+    :param timeout: timeout of this request, transport default if None
+    :param safe: the request may be sent twice, it is then retried like a GET
     :rtype: requests.Response.json()
     """
 
-    resp = requests.post(api, data, json, auth=HTTPBasicAuth(username, password))
+    resp = _send('POST', api, username, password, transport, timeout, safe or None, data=data, json=json)
     if resp.ok:
         return resp.json()
     else:
         LOGGER.error("%s", resp.content)
-        raise requests.exceptions.RequestException(resp.reason)
+        raise requests.exceptions.RequestException(resp.reason, response=resp)
 
 
-def rest_delete(api, username, password):
+def rest_delete(api, username, password, transport=None, timeout=None):
     """Sends a DELETE request with specific API. Returns :JSON of `Response` object.
 
     :param api: api for the delete request
     :param username: username
     :param password: password
+    :param transport: pooled transport.Transport, a new connection is used if None
+    :param timeout: timeout of this request, transport default if None
     :rtype: requests.Response.json()
     """
 
-    resp = requests.delete(api, auth=HTTPBasicAuth(username, password))
+    resp = _send('DELETE', api, username, password, transport, timeout)
     if resp.ok:
         return resp.json()
     else:
         LOGGER.error("%s", resp.content)
-        raise requests.exceptions.RequestException(resp.reason)
+        raise requests.exceptions.RequestException(resp.reason, response=resp)
 
 
-def rest_put(api, username, password, data=None):
+def rest_put(api, username, password, data=None, transport=None, timeout=None):
     """Sends a PUT request with specific API. Returns :JSON of `Response` object.
 
     :param api: api for the put request
     :param username: username
     :param password: password
     :param data: data for the put request
+    :param transport: pooled transport.Transport, a new connection is used if None
+    :param timeout: timeout of this request, transport default if None
     :rtype: requests.Response.json()
     """
 
-    resp = requests.put(api, data, auth=HTTPBasicAuth(username, password))
+    resp = _send('PUT', api, username, password, transport, timeout, data=data)
     if resp.ok:
         return resp.json()
     else:
         LOGGER.error("%s", resp.content)
-        raise requests.exceptions.RequestException(resp.reason)
\ No newline at end of file
+        raise requests.exceptions.RequestException(resp.reason, response=resp)
+
+
+def rest_download(api, username, password, local_file, transport=None, timeout=None,
+                  resume=True, progress=None, checksum='sha256', chunk_size=CHUNK_SIZE):
+    """Streams the content of a GET request into a file. Returns :tuple: (size, checksum).
+
+    The content is written to local_file + '.part', which is renamed to local_file
+    once complete. A '.part' file left by an interrupted download is resumed with
+    an HTTP Range request.
+
+    :param api: api for the get request
+    :param username: username
+    :param password: password
+    :param local_file: file name containing full path
+    :param transport: pooled transport.Transport, a new connection is used if None
+    :param timeout: timeout of this request, transport default if None
+    :param resume: resume an existing '.part' file
+    :param progress: callable(received, total) called after every chunk, total is None if unknown
+    :param checksum: hashlib algorithm computed over the file, None to skip
+    :param chunk_size: bytes read from the response and written at a time
+    :rtype: tuple
+    """
+
+    part_file = local_file + ".part"
+    offset = 0
+    headers = {}
+    if resume and os.path.exists(part_file):
+        offset = os.path.getsize(part_file)
+        if offset:
+            headers['Range'] = 'bytes=%d-' % offset
+
+    resp = _send('GET', api, username, password, transport, timeout, stream=True, headers=headers)
+    try:
+        if resp.status_code == 416:
+            # the partial file does not match the remote one any more
+            LOGGER.warning("unable to resume %s, download it again", local_file)
+            os.remove(part_file)
+            return rest_download(api, username, password, local_file, transport, timeout,
+                                 False, progress, checksum, chunk_size)
+        if not resp.ok:
+            LOGGER.error("%s", resp.content)
+            raise requests.exceptions.RequestException(resp.reason, response=resp)
+
+        digest = hashlib.new(checksum) if checksum else None
+        if resp.status_code == 206:
+            LOGGER.info("resume %s from %d bytes", local_file, offset)
+            mode = "ab"
+            if digest:
+                with open(part_file, "rb") as p:
+                    for chunk in iter(lambda: p.read(chunk_size), b''):
+                        digest.update(chunk)
+        else:
+            offset = 0
+            mode = "wb"
+
+        total = resp.headers.get('Content-Length')
+        if total is not None:
+            total = int(total) + offset
+
+        with open(part_file, mode) as p:
+            for chunk in resp.iter_content(chunk_size):
+                p.write(chunk)
+                if digest:
+                    digest.update(chunk)
+                offset += len(chunk)
+                if progress:
+                    progress(offset, total)
+    finally:
+        resp.close()
+
+    os.replace(part_file, local_file)
+    hexdigest = digest.hexdigest() if digest else None
+    LOGGER.info("saved file to: %s, %d bytes, %s %s", local_file, offset, checksum, hexdigest)
+
+    return offset, hexdigest
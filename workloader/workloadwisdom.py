@@ -22,11 +22,23 @@
     WorkloadWisdom
 """
 
+import functools
+import json
 import logging
 import time
 import re
+import sqlite3
+import threading
 
+from workloader import artifacts
 from workloader import util
+from workloader.catalog import SuiteCatalog
+from workloader.inventory import PortInventory, testbed_ports
+from workloader.limiter import HostLimiter
+from workloader.metrics import RequestMetrics
+from workloader.resolver import NameResolver
+from workloader.retry import CircuitBreaker, RetryPolicy
+from workloader.transport import Transport
 
 LOGGER = logging.getLogger(__name__)
 
@@ -44,17 +56,137 @@ class WorkloadWisdom(object):
     # skipped is the finished status for pre-test only workload
     TEST_FINISHED_STATES = ['failed', 'finished', 'aborted_by_user', 'skipped']
 
-    def __init__(self, url, username, password):
+    # max number of threads fetching in parallel, e.g. appliance details
+    DEFAULT_WORKERS = 8
+
+    def __init__(self, url, username, password, pool_size=Transport.DEFAULT_POOL_SIZE,
+                 timeout=Transport.DEFAULT_TIMEOUT, keep_alive=True, workers=DEFAULT_WORKERS,
+                 name_ttl=NameResolver.DEFAULT_TTL, catalog=SuiteCatalog.DEFAULT_PATH,
+                 catalog_ttl=SuiteCatalog.DEFAULT_TTL,
+                 port_max_age=PortInventory.DEFAULT_MAX_AGE, rate_limit=None, latency_target=None,
+                 retries=RetryPolicy.DEFAULT_RETRIES, circuit_breaker=True, tracer=None):
+        # spans around every public method and HTTP call, before the methods are handed out
+        if tracer is not None:
+            tracer.instrument(self)
         self._url = url
         self._username = username
         self._password = password
         self._version = None
-        self._appliances = []
-        self.get_version()
+        # appliance id -> appliance dict
+        self._appliances = {}
+        self._workers = workers
+        # requests per second capped if rate_limit, requests in flight cut on server errors,
+        # and on responses slower than latency_target if set
+        self._limiter = HostLimiter(rate=rate_limit, concurrency=pool_size, latency_target=latency_target)
+        # latency, errors, bytes, retries and throttling per endpoint
+        self._metrics = RequestMetrics()
+        # idempotent requests retried on transient failures, fail fast while the server is down
+        self._transport = Transport(username, password, pool_size=pool_size,
+                                    timeout=timeout, keep_alive=keep_alive, limiter=self._limiter,
+                                    retry=RetryPolicy(retries=retries) if retries else None,
+                                    breaker=CircuitBreaker() if circuit_breaker else None,
+                                    metrics=self._metrics, tracer=tracer)
+        # name -> id indexes shared by all get_*_by_name lookups
+        self._resolver = NameResolver(ttl=name_ttl)
+        self._resolver.register('appliance', self._list_appliance_names)
+        self._resolver.register('testbed', self.list_testbeds)
+        self._resolver.register('project', self.list_projects)
+        self._resolver.register('composite', self.list_composite_workloads)
+        # iteration suites catalog, opened on first use
+        self._catalog_path = catalog
+        self._catalog_ttl = catalog_ttl
+        self._catalog = None
+        # appliance ports snapshot shared by the port checks
+        self._inventory = PortInventory(self, max_age=port_max_age, workers=workers)
+        # fetched on first use of the version property, not on every construction
+        self._version_lock = threading.Lock()
 
     def __del__(self):
         pass
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the pooled connections to the WorkloadWisdom."""
+
+        self._transport.close()
+        if self._catalog is not None:
+            self._catalog.close()
+            self._catalog = None
+
+    def _get_catalog(self):
+        """Open the iteration suites catalog, in memory if its file is not usable."""
+
+        if self._catalog is None:
+            try:
+                self._catalog = SuiteCatalog(self._url, self._catalog_path, ttl=self._catalog_ttl)
+            except (OSError, sqlite3.Error):
+                LOGGER.warning("unable to open catalog %s, use a memory one", self._catalog_path)
+                self._catalog = SuiteCatalog(self._url, ':memory:', ttl=self._catalog_ttl)
+
+        return self._catalog
+
+    def invalidate_catalog(self, kind=None):
+        """Fetch the iteration suites and iteration test suites again on next lookup, e.g. after editing one.
+
+        :param kind: 'iteration_suite' or 'iteration_test_suite', both if None
+        """
+
+        self._get_catalog().invalidate(kind)
+
+    @property
+    def version(self):
+        """:str: version of the WorkloadWisdom, fetched once then cached"""
+
+        with self._version_lock:
+            if self._version is None:
+                self.get_version()
+            return self._version
+
+    @property
+    def inventory(self):
+        """:PortInventory: snapshot of the appliance ports, shared by start_test and the scheduler"""
+
+        return self._inventory
+
+    @property
+    def metrics(self):
+        """:RequestMetrics: requests per endpoint, e.g. metrics.dump('workloader.prom') or metrics.summary()"""
+
+        return self._metrics
+
+    def get_limiter_state(self):
+        """Return the state of the request limiter, e.g. to export as metrics.
+
+        :return: :dict: host -> requests, rate, tokens, throttled, concurrency_limit, in_flight, latency, errors
+        :rtype: dict
+        """
+
+        return self._limiter.state()
+
+    def resolve_names(self, kind, names):
+        """Resolve many names of an entity type at once, one listing for all of them.
+
+        :param kind: 'appliance', 'testbed', 'project', 'composite' or 'iteration_suite'
+        :param names: names to resolve
+        :return: :dict: name -> id, None if not found
+        :rtype: dict
+        """
+
+        names = set(names)
+        if kind != 'iteration_suite':
+            return dict((name, self._resolver.resolve(name, kind)[1]) for name in names)
+
+        catalog = self._get_catalog()
+        catalog.sync('iteration_suite', self.list_iteration_suite(), self.show_iteration_suite,
+                     workers=self._workers)
+        suites = dict((name, catalog.find('iteration_suite', name)) for name in names)
+        return dict((name, suite['id'] if suite else None) for name, suite in suites.items())
+
 
     def get_version(self, api="/api/version"):
         """Get version of WorkloadWisdom.
@@ -64,7 +196,7 @@ class WorkloadWisdom(object):
         :rtype: string
         """
 
-        resp = util.rest_get(self._url+api, self._username, self._password)
+        resp = util.rest_get(self._url+api, self._username, self._password, transport=self._transport)
         self._version = resp['version']
         LOGGER.debug("WorkloadWisdom Version: %s", self._version)
 
@@ -72,10 +204,13 @@ class WorkloadWisdom(object):
 
 
     # Generator(formerly Appliances) related API
-    def list_appliances(self, api="/api/appliances/"):
+    def list_appliances(self, api="/api/appliances/", name=None):
         """List all appliances managed by this WorkloadWisdom.
 
+        Appliances are fetched concurrently by up to ``workers`` threads.
+
         :param api: REST API to list all appliances managed by this WorkloadWisdom
+        :param name: only fetch the appliances with this name if specified
         :return: :list: list of appliance dicts
         :rtype: list
         """
@@ -83,13 +218,9 @@ class WorkloadWisdom(object):
         list_url = self._url+api
         LOGGER.debug("list all appliances: %s", list_url)
 
-        appliance_list = util.rest_get(list_url, self._username, self._password)
+        appliance_list = util.rest_get(list_url, self._username, self._password, transport=self._transport)
         util.dump_json(appliance_list)
 
-        for generator in appliance_list:
-            appliance = self.get_appliance(appliance_id=generator['id'])
-            self._appliances.append(appliance)
-
         """
             {
                 "id": "5bae33e6421aa95fab49c579",
@@ -101,7 +232,25 @@ class WorkloadWisdom(object):
             }
         """
 
-        return self._appliances
+        if name is not None:
+            appliance_list = [generator for generator in appliance_list if generator['name'] == name]
+        else:
+            # full listing, forget appliances removed from the WorkloadWisdom
+            self._appliances = {}
+
+        ids = [generator['id'] for generator in appliance_list]
+        if ids:
+            with util.ContextThreadPoolExecutor(max_workers=min(self._workers, len(ids))) as executor:
+                for appliance in executor.map(self.get_appliance, ids):
+                    self._appliances[appliance['id']] = appliance
+                    self._inventory.update(appliance)
+
+        return [self._appliances[appliance_id] for appliance_id in ids]
+
+    def _list_appliance_names(self, api="/api/appliances/"):
+        """List id and name of all appliances, without their details."""
+
+        return util.rest_get(self._url+api, self._username, self._password, transport=self._transport)
 
     def get_appliance(self, appliance_id, api="/api/appliances/"):
         """Get a appliances JSON object by id.
@@ -115,7 +264,7 @@ class WorkloadWisdom(object):
         show_url = self._url+api+appliance_id
         LOGGER.debug("get appliance details: %s", show_url)
 
-        appliance = util.rest_get(show_url, self._username, self._password)
+        appliance = util.rest_get(show_url, self._username, self._password, transport=self._transport)
         util.dump_json(appliance)
 
         return appliance
@@ -128,39 +277,44 @@ class WorkloadWisdom(object):
         :rtype: dict
         """
 
-        appliance = None
-        if not self._appliances:
-            self._appliances = self.list_appliances()
-        for gen in self._appliances:
-            if gen['name'] == name:
-                LOGGER.debug("got appliance: %s", name)
-                appliance = gen
-                break
+        _, appliance_id = self._resolver.resolve(name, 'appliance')
 
-        if not appliance:
+        if not appliance_id:
             LOGGER.error("appliance %s not found", name)
             exit()
 
-        util.dump_json(appliance)
+        LOGGER.debug("got appliance: %s", name)
+        appliance = self.get_appliance(appliance_id)
+        self._appliances[appliance_id] = appliance
+        self._inventory.update(appliance)
+
         return appliance
 
     def get_appliance_port_status(self, appliance_id, port_id):
         """Return the specified port status by id.
 
+        The appliance is fetched at most once per inventory freshness window.
+
         :param appliance_id: id of the appliance
         :param port_id: id of the port
         :return: :str: status of the port, 'idle', 'running'
         :rtype: str
         """
 
-        appliance = self.get_appliance(appliance_id)
+        state = self._inventory.state(appliance_id, port_id)
+        LOGGER.debug("appliance %s port %s status: %s", appliance_id, port_id, state)
+
+        return state
 
-        for port in appliance['ports']:
-            if port_id == port['port_id']:
-                LOGGER.debug("appliance %s port %s status: %s", appliance_id, port_id, port['state'])
-                return port['state']
+    def check_testbed_ports(self, testbed):
+        """Tell which ports of a testbed are not idle, each appliance fetched once.
 
-        raise ValueError('invalid port_id')
+        :param testbed: testbed JSON object
+        :return: :dict: (appliance_id, port_id) -> port JSON of each port not idle, None if unknown
+        :rtype: dict
+        """
+
+        return self._inventory.busy(testbed_ports(testbed))
 
     # Test beds related API
     def list_testbeds(self, api="/api/test_beds/"):
@@ -174,7 +328,7 @@ class WorkloadWisdom(object):
         list_url = self._url+api
         LOGGER.debug("list all testbeds: %s", list_url)
 
-        testbed_list = util.rest_get(list_url, self._username, self._password)
+        testbed_list = util.rest_get(list_url, self._username, self._password, transport=self._transport)
         util.dump_json(testbed_list)
 
         return testbed_list
@@ -197,7 +351,7 @@ class WorkloadWisdom(object):
         rest_url = self._url+api+testbed_id
         LOGGER.debug("get testbed details: %s", rest_url)
 
-        testbed = util.rest_get(rest_url, self._username, self._password)
+        testbed = util.rest_get(rest_url, self._username, self._password, transport=self._transport)
         util.dump_json(testbed)
 
         return testbed
@@ -211,23 +365,21 @@ class WorkloadWisdom(object):
         :rtype: dict
         """
 
-        if not testbed_list:
-            tb_list = self.list_testbeds()
+        testbed_id = None
+        if testbed_list:
+            for item in testbed_list:
+                if item['name'] == name:
+                    testbed_id = item['id']
+                    break
         else:
-            tb_list = testbed_list
-
-        testbed = None
-        for item in tb_list:
-            if item['name'] == name:
-                LOGGER.debug("got testbed: %s", name)
-                testbed = item
-                break
+            _, testbed_id = self._resolver.resolve(name, 'testbed')
 
-        if not testbed:
+        if not testbed_id:
             LOGGER.error("%s not found", name)
             exit()
 
-        return self.get_testbed(testbed['id'])
+        LOGGER.debug("got testbed: %s", name)
+        return self.get_testbed(testbed_id)
 
     def clone_testbed(self, testbed_id, new_name, api="/api/test_beds/"):
         """Clone a testbed to a new one.
@@ -248,9 +400,10 @@ class WorkloadWisdom(object):
             'name' : new_name
         }
 
-        testbed = util.rest_post(clone_url, self._username, self._password, data)
+        testbed = util.rest_post(clone_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(testbed)
         LOGGER.info("cloned a new testbed: %s", testbed['name'])
+        self._resolver.add('testbed', testbed['name'], testbed['id'])
 
         return testbed
 
@@ -264,7 +417,7 @@ class WorkloadWisdom(object):
         delete_url = self._url+api+testbed_id
         LOGGER.debug("delete testbed: %s", delete_url)
 
-        body = util.rest_delete(delete_url, self._username, self._password)
+        body = util.rest_delete(delete_url, self._username, self._password, transport=self._transport)
         """
             {
                 "redirect": "http://10.228.56.32/test_beds"
@@ -272,6 +425,7 @@ class WorkloadWisdom(object):
         """
         util.dump_json(body)
         LOGGER.info("deleted testbed: %s", testbed_id)
+        self._resolver.remove('testbed', testbed_id)
 
     def set_testbed_privacy(self, testbed_id, private=True, api="/api/test_beds/"):
         """Set the privacy of a testbed by id.
@@ -294,9 +448,10 @@ class WorkloadWisdom(object):
             'private': value
         }
 
-        testbed = util.rest_put(privacy_url, self._username, self._password, data)
+        testbed = util.rest_put(privacy_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(testbed)
         LOGGER.info("set testbed: %s privacy=%s success", testbed['name'], testbed['private'])
+        self._resolver.add('testbed', testbed['name'], testbed['id'])
 
 
 
@@ -323,7 +478,7 @@ class WorkloadWisdom(object):
         ]
         """
 
-        tests_list = util.rest_get(list_url, self._username, self._password)
+        tests_list = util.rest_get(list_url, self._username, self._password, transport=self._transport)
         util.dump_json(tests_list)
 
         return tests_list
@@ -340,78 +495,65 @@ class WorkloadWisdom(object):
         show_url = self._url+api+test_id
         LOGGER.debug("show a test: %s", show_url)
 
-        test = util.rest_get(show_url, self._username, self._password)
+        test = util.rest_get(show_url, self._username, self._password, transport=self._transport)
         util.dump_json(test)
 
         return test
 
-    def wait_until_test_complete(self, test_id, interval=60):
+    def wait_until_test_complete(self, test_id, interval=60, recorder=None):
         """Wait until test complete.
 
+        The test is polled every interval seconds at most, more often when it
+        is starting, stopping or close to its planned end.
+
         :param test_id: workload test id
-        :param interval: query interval
+        :param interval: max query interval
+        :param recorder: recorder.StatsRecorder keeping every port stats sample, optional
         :return: :dict: dict of a WorkloadTest JSON
         :rtype: dict
         """
 
-        while True:
-            test = self.show_test(test_id)
-            LOGGER.debug('test id %s state: %s', test['id'], test['state'])
-            for port in test['ports']:
-                resp = self.get_test_port_state(test['id'], port['id'])
-                if len(resp['tests']) == 0:
-                    LOGGER.warn("Stats not available for test %s, port %s", test['id'], str(port['id']))
-                else:
-                    for item in resp['tests']:
-                        if item['stat_string'] == "load.scenarios.attempts":
-                            attempts = str(item['value'])
-                        if item['stat_string'] == "load.scenarios.succeeds":
-                            succeeds = str(item['value'])
-                        if item['stat_string'] == "load.scenarios.fails":
-                            fails = str(item['value'])
-                        if item['stat_string'] == "load.scenarios.aborts":
-                            aborts = str(item['value'])
-                    LOGGER.info("-"*120)
-                    LOGGER.info("test id = %s, port = %s, state = %s, duration planned = %s, duration actual = %s",
-                                test['id'], str(port['id']), test['state'],
-                                test['duration_planned'], test['duration_actual'])
-                    LOGGER.info("Attempts = " + attempts + ",Succeeds = " + succeeds
-                                + ", Fails = " + fails + ", Aborts = " + aborts)
-                    LOGGER.info("-"*120)
+        for _, test in self.wait_until_tests_complete([test_id], interval=interval, recorder=recorder):
+            # fix a bug, passing latest result to save_all_test_results
+            return test
 
-            if test['state'] not in self.TEST_FINISHED_STATES:
-                LOGGER.debug('sleep %s seconds', interval)
-                time.sleep(interval)
-            else:
-                break
+    def wait_until_tests_complete(self, test_ids, iteration_ids=(), interval=60, recorder=None):
+        """Wait until tests and iteration test suites complete, all of them polled concurrently.
 
-        # fix a bug, passing latest result to save_all_test_results
-        return test
+        A generator yielding (kind, JSON dict) of each test or iteration test suite
+        as soon as it completes, kind is 'test' or 'iteration'. A test the server
+        keeps answering with a client error, e.g. a wrong id, raises
+        monitor.PollError once the others completed.
+
+        :param test_ids: workload test ids
+        :param iteration_ids: iteration test suite ids
+        :param interval: max query interval of each test
+        :param recorder: recorder.StatsRecorder keeping every port stats sample, optional
+        """
+
+        # numpy is only loaded once a test is monitored
+        from workloader.monitor import TestMonitor
+
+        monitor = TestMonitor(self, max_interval=interval, workers=self._workers, recorder=recorder)
+        for test_id in test_ids:
+            monitor.add_test(test_id)
+        for iteration_id in iteration_ids:
+            monitor.add_iteration(iteration_id)
+
+        for kind, obj in monitor.completed():
+            yield kind, obj
 
     def wait_until_iteration_complete(self, iteration_suite_id, interval=60):
         """Wait until an iteration test suite complete.
 
         :param iteration_suite_id: workload test id
-        :param interval: query interval
+        :param interval: max query interval
         :return: :dict: dict of a WorkloadTest JSON
         :rtype: dict
         """
 
-        while True:
-            iteration = self.show_iteration_test_suite(iteration_suite_id)
-            LOGGER.info("-"*120)
-            LOGGER.info("iteration_test_suite id = %s, name = %s, state = %s, iteration_duration = %s, created_at = %s",
-                        iteration['id'], iteration['name_cache'], iteration['state'],
-                        iteration['iteration_duration'], iteration['created_at'])
-            LOGGER.info("-"*120)
-
-            if iteration['state'] not in self.TEST_FINISHED_STATES:
-                LOGGER.debug('sleep %s seconds', interval)
-                time.sleep(interval)
-            else:
-                break
-
-        return iteration
+        for _, iteration in self.wait_until_tests_complete([], [iteration_suite_id], interval=interval):
+            return iteration
 
 
     def stop_test_by_project_name(self, project_name, project_list=None):
@@ -462,7 +604,7 @@ class WorkloadWisdom(object):
             'test_id' : test_id
         }
 
-        test = util.rest_put(stop_url, self._username, self._password, data)
+        test = util.rest_put(stop_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(test)
         LOGGER.info("stopping test: %s and wait until complete", test_id)
 
@@ -507,13 +649,14 @@ class WorkloadWisdom(object):
         testbed = self.get_testbed_by_name(testbed_name)
         return self.start_test(project, testbed, duration)
 
-    def start_test(self, project, testbed, duration, api="/api/tests"):
+    def start_test(self, project, testbed, duration, api="/api/tests", check_ports=True):
         """Start a test on the WorkloadWisdom.
 
         :param project: project JSON object
         :param testbed: testbed JSON object
         :param duration: duration of the test in seconds
         :param api: REST API to start a test
+        :param check_ports: raise RuntimeError if a port of the testbed is not idle
         :return: :dict: dict of a started WorkloadTest JSON
         :rtype: dict
         """
@@ -521,11 +664,11 @@ class WorkloadWisdom(object):
         if not (type(project) is dict and type(testbed) is dict):
             raise TypeError("non dict param")
 
-        for client in testbed['clients']:
-            state = self.get_appliance_port_status(client['appliance_id'], client['port'])
-            if state != WorkloadWisdom.PORT_STATUS_IDLE:
-                LOGGER.error("port_id %s is %s, unable to start test", client['port'], state)
-                raise RuntimeError("port in use")
+        busy = self.check_testbed_ports(testbed) if check_ports else {}
+        for (_, port_id), port in busy.items():
+            LOGGER.error("port_id %s is %s, unable to start test", port_id, port['state'] if port else 'unknown')
+        if busy:
+            raise RuntimeError("port in use")
 
         start_url = self._url+api
         LOGGER.debug("start a test: %s", start_url)
@@ -536,8 +679,10 @@ class WorkloadWisdom(object):
             'duration': duration
         }
 
-        test = util.rest_post(start_url, self._username, self._password, data)
+        test = util.rest_post(start_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(test)
+        # the ports are no longer idle
+        self._inventory.invalidate(appliance_id for appliance_id, _ in testbed_ports(testbed))
 
         return test
 
@@ -556,12 +701,34 @@ class WorkloadWisdom(object):
         get_url = self._url+api+test_id+"/stats/ports/"+str(port_id)
         LOGGER.debug("get state for test: %s", get_url)
 
-        state = util.rest_get(get_url, self._username, self._password)
+        state = util.rest_get(get_url, self._username, self._password, transport=self._transport)
         if dump:
             util.dump_json(state)
 
         return state
 
+    def get_test_stats(self, test):
+        """Get statistics of all ports of a test, fetched concurrently.
+
+        :param test: test id, or dict of a WorkloadTest JSON
+        :return: :PortStats: ports x stats matrix of the test
+        :rtype: PortStats
+        """
+
+        from workloader.stats import PortStats
+
+        if not isinstance(test, dict):
+            test = self.show_test(test)
+
+        port_ids = [port['id'] for port in test.get('ports') or []]
+        if not port_ids:
+            return PortStats.from_responses([], [])
+
+        with util.ContextThreadPoolExecutor(max_workers=min(self._workers, len(port_ids))) as executor:
+            states = list(executor.map(lambda port_id: self.get_test_port_state(test['id'], port_id), port_ids))
+
+        return PortStats.from_responses(port_ids, states)
+
 
     def get_test_config(self, test_id, api="/api/tests/"):
         """Get config for a test on the WorkloadWisdom.
@@ -575,7 +742,7 @@ class WorkloadWisdom(object):
         get_url = self._url+api+test_id+"/config"
         LOGGER.debug("get config for test: %s", get_url)
 
-        config = util.rest_get(get_url, self._username, self._password)
+        config = util.rest_get(get_url, self._username, self._password, transport=self._transport)
         util.dump_json(config)
 
         return config
@@ -592,7 +759,7 @@ class WorkloadWisdom(object):
         get_url = self._url+api+test_id+"/logs"
         LOGGER.debug("show logs for a test: %s", get_url)
 
-        logs = util.rest_get(get_url, self._username, self._password)
+        logs = util.rest_get(get_url, self._username, self._password, transport=self._transport)
         '''
             "tests": [
                     {
@@ -611,9 +778,11 @@ class WorkloadWisdom(object):
 
         return logs
 
-    def save_test_result(self, test_id, uri, api="/api/tests/", dir="./"):
+    def save_test_result(self, test_id, uri, api="/api/tests/", dir="./", progress=None):
         """Save test result into a file
 
+        The file is streamed to disk, an interrupted download is resumed on next call.
+
         :param test_id: test id
         :param uri: log, summary or trace:
             files/ports/:port_id/summary
@@ -621,12 +790,16 @@ class WorkloadWisdom(object):
             files/ports/:port_id/log
         :param api: REST API for a test
         :param dir: path to save test result
+        :param progress: callable(received, total) called while downloading
         :return: :str: file name containing full path
         :rtype: str
         """
 
         get_url = self._url+api+str(test_id)+"/"+uri
-        m = re.match(r"files/ports/(\d)/(summary|log|trace)", uri)
+        m = re.match(r"files/ports/(\d+)/(summary|log|trace)", uri)
+        if not m:
+            LOGGER.error("invalid uri: %s", uri)
+            raise ValueError("invalid uri")
             # GET /api/tests/:test_id/files/ports/:port_id/log
         if m.group(2) == 'log':
             postfix = ".log"
@@ -635,29 +808,24 @@ class WorkloadWisdom(object):
             postfix = ".sum"
         elif m.group(2) == 'trace':
             postfix = ".pcap"
-        else:
-            LOGGER.error("invalid uri: %s", uri)
 
         LOGGER.info("get %s file for test", get_url)
         log_name = dir+str(test_id)+"_port_"+str(m.group(1))+postfix
 
-        content = util.rest_get(get_url, self._username, self._password, json=False)
         # ./5bc054af421aa92b599bcbf4_port_0.log
-
         LOGGER.debug("full log name: %s", log_name)
-        # summary & trace are not readable
-        if 'log' in postfix:
-            LOGGER.debug("%s", content)
-        util.save_to_file(log_name, content)
+        util.rest_download(get_url, self._username, self._password, log_name,
+                           transport=self._transport, progress=progress)
 
         return log_name
 
-    def export_test_charts(self, test_id, api="/api/tests/", path="./"):
+    def export_test_charts(self, test_id, api="/api/tests/", path="./", progress=None):
         """Export test charts into a file
 
         :param test_id: test id
         :param api: REST API for a test
         :param path: path to save test result
+        :param progress: callable(received, total) called while downloading
         :return: :str: file name containing full path
         :rtype: str
         """
@@ -668,21 +836,43 @@ class WorkloadWisdom(object):
         postfix = ".zip"
         log_name = path + str(test_id) + postfix
 
-        content = util.rest_get(export_url, self._username, self._password, json=False)
         # ./5bc054af421aa92b599bcbf4.zip
         LOGGER.debug("full log name: %s", log_name)
-        util.save_to_file(log_name, content)
+        util.rest_download(export_url, self._username, self._password, log_name,
+                           transport=self._transport, progress=progress)
 
         return log_name
 
-    def save_all_test_results(self, test, path="./"):
+    def save_test_config(self, test_id, path="./"):
+        """Save config of a test into a file
+
+        :param test_id: test id
+        :param path: path to save test config
+        :return: :str: file name containing full path
+        :rtype: str
+        """
+
+        config = self.get_test_config(test_id)
+        # ./5bc054af421aa92b599bcbf4_config.json
+        config_name = path + str(test_id) + "_config.json"
+        util.save_to_file(config_name, json.dumps(config, indent=4, sort_keys=True))
+
+        return config_name
+
+    def save_all_test_results(self, test, path="./", workers=artifacts.DEFAULT_WORKERS,
+                              retries=artifacts.DEFAULT_RETRIES):
         """Save all available test results to path
 
+        Files are downloaded concurrently, each one retried on its own if failed.
+
         :param test: test JSON dict
         :param path: path to save test result
+        :param workers: max number of concurrent downloads
+        :param retries: number of retries of a failed download
+        :return: :list: manifest, a dict per file with name, path, size, duration, attempts and error
+        :rtype: list
         """
 
-        self.show_test(test['id'])
         LOGGER.info("save test results for: %s", test['id'])
         util.dump_json(test)
 
@@ -709,19 +899,23 @@ class WorkloadWisdom(object):
         summaries = test['result_files']['summary']
         traces = test['result_files']['traces']
 
-        for log in logs:
-            LOGGER.info("save log file: %s", log)
-            self.save_test_result(test['id'], log, dir=path)
-        for summary in summaries:
-            LOGGER.info("save summary file: %s", summary)
-            self.save_test_result(test['id'], summary, dir=path)
-        for trace in traces:
-            LOGGER.info("save trace file: %s", trace)
-            self.save_test_result(test['id'], trace, dir=path)
+        # biggest files first, so they do not end up alone at the tail
+        jobs = []
+        for uri in traces + summaries + logs:
+            LOGGER.info("save file: %s", uri)
+            jobs.append((uri, functools.partial(self.save_test_result, test['id'], uri, dir=path)))
+        jobs.append(("export_charts", functools.partial(self.export_test_charts, test['id'], path=path)))
+        jobs.append((config, functools.partial(self.save_test_config, test['id'], path=path)))
 
-        self.export_test_charts(test['id'], path=path)
-        self.get_test_config(test['id'])
-        LOGGER.info("completed saving all test results for: %s", test['id'])
+        manifest = artifacts.fetch_artifacts(jobs, workers=workers, retries=retries)
+
+        failures = [entry['name'] for entry in manifest if entry['error']]
+        if failures:
+            LOGGER.error("failed saving %d test results for %s: %s", len(failures), test['id'], failures)
+        else:
+            LOGGER.info("completed saving all test results for: %s", test['id'])
+
+        return manifest
 
     # Workloads(formerly Projects) related API, a workload can have multiple tests
     def list_projects(self, api="/api/projects/", library=False):
@@ -752,7 +946,7 @@ class WorkloadWisdom(object):
         ]
         """
 
-        project_list = util.rest_get(list_url, self._username, self._password)
+        project_list = util.rest_get(list_url, self._username, self._password, transport=self._transport)
         util.dump_json(project_list)
 
         return project_list
@@ -769,7 +963,7 @@ class WorkloadWisdom(object):
         show_url = self._url+api+project_id
         LOGGER.debug("show a project: %s", show_url)
 
-        project = util.rest_get(show_url, self._username, self._password)
+        project = util.rest_get(show_url, self._username, self._password, transport=self._transport)
         util.dump_json(project)
 
         return project
@@ -789,9 +983,10 @@ class WorkloadWisdom(object):
         del_url = self._url+api+project_id
         LOGGER.debug("delete a project: %s", del_url)
 
-        resp = util.rest_delete(del_url, self._username, self._password)
+        resp = util.rest_delete(del_url, self._username, self._password, transport=self._transport)
         util.dump_json(resp)
         LOGGER.info("deleted project: %s", project_id)
+        self._resolver.remove('project', project_id)
 
     def get_project_by_name(self, name, project_list=None):
         """Get a project JSON object by its name
@@ -802,27 +997,26 @@ class WorkloadWisdom(object):
         :rtype: dict
         """
 
-        if not project_list:
-            proj_list = self.list_projects()
+        project_id = None
+        if project_list:
+            for proj in project_list:
+                if proj['name'] == name:
+                    project_id = proj['id']
+                    break
+            # AR999302 - failed to start composite workload
+            if not project_id:
+                LOGGER.error("%s not found, check composite workloads", name)
+                project_id = self.get_composite_workload_by_name(name)['id']
         else:
-            proj_list = project_list
-
-        project = None
-        for proj in proj_list:
-            if proj['name'] == name:
-                LOGGER.debug("got project: %s", name)
-                project = proj
-                break
-        # AR999302 - failed to start composite workload
-        if not project:
-            LOGGER.error("%s not found, check composite workloads", name)
-            project = self.get_composite_workload_by_name(name)
+            # AR999302 - failed to start composite workload, so composite workloads are searched too
+            _, project_id = self._resolver.resolve(name, ('project', 'composite'))
 
-        if not project:
+        if not project_id:
             LOGGER.error("%s not found", name)
             exit()
 
-        return self.show_project(project['id'])
+        LOGGER.debug("got project: %s", name)
+        return self.show_project(project_id)
 
 
     def clone_project(self, project_id, new_name, api="/api/projects/"):
@@ -844,9 +1038,10 @@ class WorkloadWisdom(object):
             'name': new_name
         }
 
-        project = util.rest_post(clone_url, self._username, self._password, data)
+        project = util.rest_post(clone_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(project)
         LOGGER.info("cloned a new project: %s", project['name'])
+        self._resolver.add('project', project['name'], project['id'])
 
         return project
 
@@ -871,9 +1066,10 @@ class WorkloadWisdom(object):
             'private': value
         }
 
-        project = util.rest_put(privacy_url, self._username, self._password, data)
+        project = util.rest_put(privacy_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(project)
         LOGGER.info("set project: %s privacy=%s success", project['name'], project['private'])
+        self._resolver.add('project', project['name'], project['id'])
 
 
     # Composite workload related API
@@ -901,7 +1097,7 @@ class WorkloadWisdom(object):
         ]
         """
 
-        composite_list = util.rest_get(list_url, self._username, self._password)
+        composite_list = util.rest_get(list_url, self._username, self._password, transport=self._transport)
         util.dump_json(composite_list)
 
         return composite_list
@@ -918,7 +1114,7 @@ class WorkloadWisdom(object):
         show_url = self._url+api+workload_id
         LOGGER.debug("show a composite workload: %s", show_url)
 
-        composite = util.rest_get(show_url, self._username, self._password)
+        composite = util.rest_get(show_url, self._username, self._password, transport=self._transport)
         util.dump_json(composite)
 
         return composite
@@ -938,9 +1134,10 @@ class WorkloadWisdom(object):
         del_url = self._url+api+workload_id
         LOGGER.debug("delete a composite workload: %s", del_url)
 
-        resp = util.rest_delete(del_url, self._username, self._password)
+        resp = util.rest_delete(del_url, self._username, self._password, transport=self._transport)
         util.dump_json(resp)
         LOGGER.info("deleted composite workload: %s", workload_id)
+        self._resolver.remove('composite', workload_id)
 
 
     def clone_composite_workload(self, workload_id, new_name, api="/api/composite_workloads/"):
@@ -961,9 +1158,10 @@ class WorkloadWisdom(object):
             'name': new_name
         }
 
-        composite = util.rest_post(clone_url, self._username, self._password, data)
+        composite = util.rest_post(clone_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(composite)
         LOGGER.info("cloned a new composite workload: %s", composite['name'])
+        self._resolver.add('composite', composite['name'], composite['id'])
 
         return composite
 
@@ -988,9 +1186,10 @@ class WorkloadWisdom(object):
             'private': value
         }
 
-        composite = util.rest_put(privacy_url, self._username, self._password, data)
+        composite = util.rest_put(privacy_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(composite)
         LOGGER.info("set composite workload: %s privacy=%s success", composite['name'], composite['private'])
+        self._resolver.add('composite', composite['name'], composite['id'])
 
     def get_composite_workload_by_name(self, name, composite_list=None):
         """Get a project JSON object by its name
@@ -1001,23 +1200,21 @@ class WorkloadWisdom(object):
         :rtype: dict
         """
 
-        if not composite_list:
-            cw_list = self.list_composite_workloads()
+        workload_id = None
+        if composite_list:
+            for item in composite_list:
+                if item['name'] == name:
+                    workload_id = item['id']
+                    break
         else:
-            cw_list = composite_list
-
-        composite_workload = None
-        for item in cw_list:
-            if item['name'] == name:
-                LOGGER.debug("got composite workload: %s", name)
-                composite_workload = item
-                break
+            _, workload_id = self._resolver.resolve(name, 'composite')
 
-        if not composite_workload:
+        if not workload_id:
             LOGGER.error("%s not found", name)
             exit()
 
-        return self.show_composite_workload(composite_workload['id'])
+        LOGGER.debug("got composite workload: %s", name)
+        return self.show_composite_workload(workload_id)
 
 
     # Iteration suites related API
@@ -1045,7 +1242,7 @@ class WorkloadWisdom(object):
         ]
         """
 
-        iteration_list = util.rest_get(list_url, self._username, self._password)
+        iteration_list = util.rest_get(list_url, self._username, self._password, transport=self._transport)
         util.dump_json(iteration_list)
 
         return iteration_list
@@ -1062,7 +1259,7 @@ class WorkloadWisdom(object):
         show_url = self._url+api+id
         LOGGER.debug("show a iteration test suite: %s", show_url)
 
-        iteration_suite = util.rest_get(show_url, self._username, self._password)
+        iteration_suite = util.rest_get(show_url, self._username, self._password, transport=self._transport)
         util.dump_json(iteration_suite)
 
         return iteration_suite
@@ -1070,6 +1267,9 @@ class WorkloadWisdom(object):
     def get_iteration_suite_by_name(self, iteration_suite_name, iteration_suite_list=None):
         """Get an iteration suite by name
 
+        Iteration suites are kept in the local catalog, only new ones or ones cached longer than
+        its ttl are shown again, see invalidate_catalog().
+
         :param iteration_suite_name: iteration test suite name, e.g. 'CCT_LDX_ILD_FAST_PACO_HA_Iteration'
         :param iteration_suite_list: return of list_iteration_suite(), memory data might be out of date
         :return: :dict: dict of project JSON object
@@ -1081,22 +1281,24 @@ class WorkloadWisdom(object):
         else:
             its_list = iteration_suite_list
 
-        for its in its_list:
-            iteration_suite = self.show_iteration_suite(its['id'])
-            '''
-                {
-                    "id": "5d23029b421aa92501da5160",
-                    "name": "CCT_LDX_ILD_FAST_PACO_HA_Iteration"
-                }
-            '''
-            if iteration_suite['name'] == iteration_suite_name:
-                LOGGER.debug("got iteration suite: %s, id: %s", iteration_suite_name, iteration_suite['id'])
-                return iteration_suite
+        '''
+            {
+                "id": "5d23029b421aa92501da5160",
+                "name": "CCT_LDX_ILD_FAST_PACO_HA_Iteration"
+            }
+        '''
+        catalog = self._get_catalog()
+        catalog.sync('iteration_suite', its_list, self.show_iteration_suite,
+                     prune=not iteration_suite_list, workers=self._workers)
+        iteration_suite = catalog.find('iteration_suite', iteration_suite_name)
 
         if not iteration_suite:
             LOGGER.error("%s not found", iteration_suite_name)
             exit()
 
+        LOGGER.debug("got iteration suite: %s, id: %s", iteration_suite_name, iteration_suite['id'])
+        return iteration_suite
+
 
     # Iteration test suites related API
     def list_iteration_test_suite(self, api="/api/iteration_test_suites"):
@@ -1121,7 +1323,7 @@ class WorkloadWisdom(object):
         ]
         """
 
-        iteration_list = util.rest_get(list_url, self._username, self._password)
+        iteration_list = util.rest_get(list_url, self._username, self._password, transport=self._transport)
         util.dump_json(iteration_list)
 
         return iteration_list
@@ -1138,7 +1340,7 @@ class WorkloadWisdom(object):
         show_url = self._url+api+iteration_id
         LOGGER.debug("show a iteration test suite: %s", show_url)
 
-        iteration_test_suite = util.rest_get(show_url, self._username, self._password)
+        iteration_test_suite = util.rest_get(show_url, self._username, self._password, transport=self._transport)
         util.dump_json(iteration_test_suite)
 
         return iteration_test_suite
@@ -1159,7 +1361,7 @@ class WorkloadWisdom(object):
             'iteration_test_suite_id ' : iteration_test_suite_id
         }
 
-        resp = util.rest_put(stop_url, self._username, self._password, data)
+        resp = util.rest_put(stop_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(resp)
         LOGGER.info("stopping iteration test suite: %s and wait until complete", iteration_test_suite_id)
 
@@ -1185,6 +1387,8 @@ class WorkloadWisdom(object):
 
         iteration = self.get_iteration_suite_by_name(iteration_suite_name, iteration_list)
         LOGGER.info("id of iteration suite %s is: %s", iteration_suite_name, iteration['id'])
+        # new runs may not bump updated_at, show the suite again for its latest test suites
+        iteration = self.show_iteration_suite(iteration['id'])
         '''
             "test_suites": [
                 {
@@ -1215,32 +1419,38 @@ class WorkloadWisdom(object):
 
 
     def get_iteration_test_suite_by_name(self, iteration_suite_name, iteration_suite_list=None):
-        """Get an iteration test suite by its name
+        """Get the latest iteration test suite by its name
+
+        Iteration test suites are kept in the local catalog, only new ones, still active ones or ones
+        cached longer than its ttl are shown again.
 
         :param iteration_suite_name: iteration test suite name, e.g. 'CCT_LDX_ILD_FAST_PACO_HA_Iteration'
-        :param iteration_suite_list: return of list_iteration_suite(), memory data might be out of date
+        :param iteration_suite_list: return of list_iteration_test_suite(), memory data might be out of date
         :return: :dict: dict of project JSON object
         :rtype: dict
         """
 
         if not iteration_suite_list:
-            its_list = self.list_iteration_suite()
+            its_list = self.list_iteration_test_suite()
         else:
             its_list = iteration_suite_list
 
-        for its in its_list:
-            iteration_test_suite = self.show_iteration_test_suite(its['id'])
-            '''
-                "name_cache": "CCT_LDX_ILD_FAST_PACO_HA_Iteration",
-            '''
-            if iteration_test_suite['name_cache'] == iteration_suite_name:
-                LOGGER.debug("got iteration test suite: %s, id: %s", iteration_suite_name, iteration_test_suite['id'])
-                return iteration_test_suite
+        '''
+            "name_cache": "CCT_LDX_ILD_FAST_PACO_HA_Iteration",
+        '''
+        catalog = self._get_catalog()
+        catalog.sync('iteration_test_suite', its_list, self.show_iteration_test_suite, name_field='name_cache',
+                     refetch=lambda suite: suite['state'] not in self.TEST_FINISHED_STATES,
+                     prune=not iteration_suite_list, workers=self._workers)
+        iteration_test_suite = catalog.find('iteration_test_suite', iteration_suite_name)
 
         if not iteration_test_suite:
             LOGGER.error("%s not found", iteration_suite_name)
             exit()
 
+        LOGGER.debug("got iteration test suite: %s, id: %s", iteration_suite_name, iteration_test_suite['id'])
+        return iteration_test_suite
+
     def start_iteration_test_suite_by_id(self, iteration_suite_id, testbed_id):
         """Start an iteration test suite by iteration suite id.
 
@@ -1268,12 +1478,14 @@ class WorkloadWisdom(object):
         testbed = self.get_testbed_by_name(testbed_name)
         return self.start_iteration_test_suite(iteration_suite, testbed)
 
-    def start_iteration_test_suite(self, iteration_suite, testbed, api="/api/iteration_test_suites"):
+    def start_iteration_test_suite(self, iteration_suite, testbed, api="/api/iteration_test_suites",
+                                   check_ports=True):
         """Start a test on the WorkloadWisdom.
 
         :param iteration_test_suite: iteration test suite JSON object
         :param testbed: testbed JSON object
         :param api: REST API to start a test
+        :param check_ports: raise RuntimeError if a port of the testbed is not idle
         :return: :dict: dict of a started WorkloadTest JSON
         :rtype: dict
         """
@@ -1282,11 +1494,12 @@ class WorkloadWisdom(object):
             raise TypeError("non dict param")
 
 
-        for client in testbed['clients']:
-            state = self.get_appliance_port_status(client['appliance_id'], client['port'])
-            if state != WorkloadWisdom.PORT_STATUS_IDLE:
-                LOGGER.error("port_id %s is %s, unable to start iteration test suite", client['port'], state)
-                raise RuntimeError("port in use")
+        busy = self.check_testbed_ports(testbed) if check_ports else {}
+        for (_, port_id), port in busy.items():
+            LOGGER.error("port_id %s is %s, unable to start iteration test suite",
+                         port_id, port['state'] if port else 'unknown')
+        if busy:
+            raise RuntimeError("port in use")
 
         start_url = self._url+api
         LOGGER.debug("start an iteration test suite: %s", start_url)
@@ -1296,8 +1509,9 @@ class WorkloadWisdom(object):
             'test_bed_id': testbed['id'],
         }
 
-        iteration = util.rest_post(start_url, self._username, self._password, data)
+        iteration = util.rest_post(start_url, self._username, self._password, data, transport=self._transport)
         util.dump_json(iteration)
+        self._inventory.invalidate(appliance_id for appliance_id, _ in testbed_ports(testbed))
 
         return iteration
 